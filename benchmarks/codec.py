@@ -0,0 +1,91 @@
+"""
+Decode time and bytes on the wire for a full MaskedEmail/get, per JSON codec and compression
+
+Starts benchmarks/fake_server.py on a background thread with compression
+enabled and fetches the whole account once for each encoding the client can
+decode (identity, gzip, and br when brotli is installed), reporting the
+bytes sent and the time to decompress them. Then times decoding the body
+with each codec fastmask can use here (json, and orjson when installed),
+and a full MaskedMailClient.get with that codec.
+
+    python benchmarks/codec.py [--size 100000] [--runs 3]
+"""
+
+import argparse
+import gzip
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_server import ACCOUNT_ID, JMAP_CORE, MASKED_EMAIL_SCOPE, FakeJMAP, FakeServer
+from fastmask.codec import STDLIB, accept_encoding, get_codec
+from fastmask.masked_email import MaskedMailClient
+import requests
+
+
+def best_of(runs: int, fn) -> float:
+    """Fastest of runs calls of fn, in milliseconds"""
+
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return min(times)
+
+def decompressors() -> dict:
+    found = {'identity': lambda body: body, 'gzip': gzip.decompress}
+    if 'br' in accept_encoding():
+        try:
+            import brotli
+        except ImportError:
+            import brotlicffi as brotli
+        found['br'] = brotli.decompress
+    return found
+
+def codecs() -> list:
+    found = [STDLIB]
+    try:
+        found.append(get_codec('orjson'))
+    except ImportError:
+        pass
+    return found
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=100000, help='Number of masked emails in the account')
+    parser.add_argument('--runs', type=int, default=3, help='Runs per measurement, the fastest is kept')
+    args = parser.parse_args()
+
+    call = STDLIB.dumps({
+        'using': [JMAP_CORE, MASKED_EMAIL_SCOPE],
+        'methodCalls': [['MaskedEmail/get', {'accountId': ACCOUNT_ID, 'ids': None}, '0']],
+    })
+
+    with FakeServer(FakeJMAP(size=args.size, compress=True)) as server:
+        api_url = server.session_url.replace('/.well-known/jmap', '/jmap/api/')
+
+        print(f'{"encoding":<10} {"wire KiB":>10} {"decompress ms":>14}')
+        body = None
+        for encoding, decompress in decompressors().items():
+            res = requests.post(api_url, data=call, headers={'Accept-Encoding': encoding}, stream=True)
+            wire = res.raw.read(decode_content=False)
+            body = decompress(wire)
+            ms = best_of(args.runs, lambda: decompress(wire))
+            print(f'{encoding:<10} {len(wire) / 1024:>10.1f} {ms:>14.1f}', flush=True)
+
+        print(f'\n{"codec":<10} {"decode ms":>10} {"get ms":>10}')
+        for codec in codecs():
+            decode = best_of(args.runs, lambda: codec.loads(body))
+            client = MaskedMailClient('bench@fastmail.com', 'bench-token', session_url=server.session_url, cache_session=False, codec=codec)
+            get = best_of(args.runs, lambda: client.get(sort_by=None))
+            print(f'{codec.name:<10} {decode:>10.1f} {get:>10.1f}', flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,404 @@
+"""
+Local stand-in for Fastmail's JMAP API, for benchmarking fastmask
+
+Implements the session resource (/.well-known/jmap), MaskedEmail/get,
+/set and /changes, including result references (#ids) and ifInState, and
+the event source, over a generated account. Latency and 429 responses can be injected, responses
+can be compressed, and the server counts requests and bytes in both directions.
+
+Run standalone:
+
+    python benchmarks/fake_server.py --size 10000 --port 8080 --latency 20
+
+then point fastmask at it:
+
+    fastmask --session-url http://127.0.0.1:8080/.well-known/jmap list
+"""
+
+from datetime import datetime, timedelta, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlsplit
+import argparse
+import gzip
+import json
+import random
+import threading
+import time
+
+JMAP_CORE = 'urn:ietf:params:jmap:core'
+MASKED_EMAIL_SCOPE = 'https://www.fastmail.com/dev/maskedemail'
+ACCOUNT_ID = 'u1234abcd'
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+WORDS = ['amazon', 'github', 'reddit', 'netflix', 'spotify', 'airline', 'bank', 'shop', 'forum', 'newsletter', 'games', 'news']
+DOMAINS = ['com', 'org', 'net', 'io', 'shop', 'co.uk']
+
+
+def generate_account(size: int, seed: int = 0) -> dict[str, dict]:
+    """Generate size Masked Emails spread over the last three years"""
+
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    account = {}
+    for i in range(size):
+        word = rng.choice(WORDS)
+        site = f'{word}{rng.randint(1, 999)}.{rng.choice(DOMAINS)}'
+        created = now - timedelta(seconds=rng.randint(0, 3 * 365 * 86400))
+        used = rng.random() < 0.6
+        last_message = created + timedelta(seconds=rng.randint(0, int((now - created).total_seconds()))) if used else None
+        id_ = f'masked-{10000000 + i}'
+        account[id_] = {
+            'id': id_,
+            'email': f'{word}.{rng.randint(1000, 9999)}{i}@fastmail.com',
+            'description': rng.choice(['', site.split('.')[0], word.title(), f'{word} account']),
+            'state': rng.choices(['enabled', 'disabled', 'deleted', 'pending'], weights=[70, 15, 10, 5])[0],
+            'url': rng.choice([None, f'https://{site}']),
+            'forDomain': rng.choice(['', f'https://{site}']),
+            'createdAt': created.strftime(TIME_FORMAT),
+            'lastMessageAt': last_message.strftime(TIME_FORMAT) if last_message else None,
+            'createdBy': rng.choice(['Fastmail Web', 'fastmask', '1Password']),
+        }
+    return account
+
+
+class FakeJMAP:
+    """Account state, change log and counters shared by the request handlers"""
+
+    def __init__(self, size: int = 1000, latency: float = 0, throttle_every: int = 0, retry_after: float = 0.1, seed: int = 0, limits: dict | None = None, compress: bool = False):
+        """
+        size: Number of Masked Emails to generate
+        latency: Seconds added to every response
+        throttle_every: Answer every nth API request with 429 (0 disables)
+        retry_after: Retry-After sent with injected 429s
+        limits: Overrides for the core capability limits
+        compress: Compress responses with brotli (when installed) or gzip, if the client accepts it
+        """
+
+        self.objects = generate_account(size, seed)
+        self.log = []
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.compress = compress
+        self.limits = {
+            'maxSizeUpload': 50000000,
+            'maxConcurrentUpload': 4,
+            'maxSizeRequest': 10000000,
+            'maxConcurrentRequests': 4,
+            'maxCallsInRequest': 16,
+            'maxObjectsInGet': 4096,
+            'maxObjectsInSet': 4096,
+            'collationAlgorithms': [],
+            **(limits or {}),
+        }
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        with self.lock:
+            self.stats = {'requests': 0, 'throttled': 0, 'bytes_in': 0, 'bytes_out': 0, 'method_calls': 0}
+
+    @property
+    def state(self) -> str:
+        return str(len(self.log))
+
+    def session(self, base_url: str) -> dict:
+        return {
+            'capabilities': {JMAP_CORE: self.limits, MASKED_EMAIL_SCOPE: {}},
+            'accounts': {ACCOUNT_ID: {'name': 'bench@fastmail.com', 'isPersonal': True, 'isReadOnly': False, 'accountCapabilities': {MASKED_EMAIL_SCOPE: {}}}},
+            'primaryAccounts': {JMAP_CORE: ACCOUNT_ID, MASKED_EMAIL_SCOPE: ACCOUNT_ID},
+            'username': 'bench@fastmail.com',
+            'apiUrl': f'{base_url}/jmap/api/',
+            'downloadUrl': f'{base_url}/jmap/download/{{accountId}}/{{blobId}}/{{name}}',
+            'uploadUrl': f'{base_url}/jmap/upload/{{accountId}}/',
+            'eventSourceUrl': f'{base_url}/jmap/event/',
+            'state': 'session-1',
+        }
+
+    def resolve(self, args: dict, results: dict) -> dict:
+        """Replace #name result references with values from earlier responses"""
+
+        args = dict(args)
+        for key in [k for k in args if k.startswith('#')]:
+            ref = args.pop(key)
+            value = results[ref['resultOf']]
+            for part in ref['path'].strip('/').split('/'):
+                value = value[part]
+            args[key[1:]] = value
+        return args
+
+    def masked_email_get(self, args: dict) -> dict | tuple:
+        ids = args.get('ids')
+        if ids is not None and len(ids) > self.limits['maxObjectsInGet']:
+            return ('error', {'type': 'requestTooLarge'})
+        if ids is None:
+            found, not_found = list(self.objects.values()), []
+        else:
+            found = [self.objects[i] for i in ids if i in self.objects]
+            not_found = [i for i in ids if i not in self.objects]
+        if args.get('properties') is not None:
+            props = set(args['properties']) | {'id'}
+            found = [{k: v for k, v in x.items() if k in props} for x in found]
+        return {'accountId': ACCOUNT_ID, 'state': self.state, 'list': found, 'notFound': not_found}
+
+    def masked_email_changes(self, args: dict) -> dict | tuple:
+        try:
+            since = int(args['sinceState'])
+        except ValueError:
+            return ('error', {'type': 'cannotCalculateChanges'})
+        if since > len(self.log):
+            return ('error', {'type': 'cannotCalculateChanges'})
+
+        max_changes = args.get('maxChanges') or len(self.log)
+        entries = self.log[since:since + max_changes]
+        new_state = str(since + len(entries))
+        created, updated, destroyed = {}, {}, {}
+        for kind, id_ in entries:
+            if kind == 'created':
+                created[id_] = True
+            elif kind == 'updated' and id_ not in created:
+                updated[id_] = True
+            elif kind == 'destroyed':
+                if created.pop(id_, None) is None:
+                    destroyed[id_] = True
+                updated.pop(id_, None)
+        return {
+            'accountId': ACCOUNT_ID,
+            'oldState': args['sinceState'],
+            'newState': new_state,
+            'hasMoreChanges': int(new_state) < len(self.log),
+            'created': list(created),
+            'updated': list(updated),
+            'destroyed': list(destroyed),
+        }
+
+    def masked_email_set(self, args: dict) -> dict | tuple:
+        if args.get('ifInState') is not None and args['ifInState'] != self.state:
+            return ('error', {'type': 'stateMismatch'})
+
+        old_state = self.state
+        result = {'accountId': ACCOUNT_ID, 'oldState': old_state, 'created': {}, 'notCreated': {}, 'updated': {}, 'notUpdated': {}, 'destroyed': [], 'notDestroyed': {}}
+        now = datetime.now(timezone.utc).strftime(TIME_FORMAT)
+
+        for creation_id, props in (args.get('create') or {}).items():
+            id_ = f'masked-{20000000 + len(self.log)}'
+            word = (props.get('description') or 'new').split()[0].lower() or 'new'
+            obj = {
+                'id': id_,
+                'email': f'{word}.{len(self.log)}@fastmail.com',
+                'description': '',
+                'state': 'pending',
+                'url': None,
+                'forDomain': '',
+                'createdAt': now,
+                'lastMessageAt': None,
+                'createdBy': 'fastmask',
+                **props,
+            }
+            self.objects[id_] = obj
+            self.log.append(('created', id_))
+            result['created'][creation_id] = {'id': id_, 'email': obj['email'], 'createdAt': now}
+
+        for id_, patch in (args.get('update') or {}).items():
+            if id_ not in self.objects:
+                result['notUpdated'][id_] = {'type': 'notFound'}
+                continue
+            self.objects[id_].update(patch)
+            self.log.append(('updated', id_))
+            result['updated'][id_] = None
+
+        for id_ in args.get('destroy') or []:
+            if self.objects.pop(id_, None) is None:
+                result['notDestroyed'][id_] = {'type': 'notFound'}
+                continue
+            self.log.append(('destroyed', id_))
+            result['destroyed'].append(id_)
+
+        result['newState'] = self.state
+        return result
+
+    def state_change(self) -> dict:
+        return {'@type': 'StateChange', 'changed': {ACCOUNT_ID: {'MaskedEmail': self.state}}}
+
+    def api(self, request: dict) -> dict:
+        methods = {
+            'MaskedEmail/get': self.masked_email_get,
+            'MaskedEmail/changes': self.masked_email_changes,
+            'MaskedEmail/set': self.masked_email_set,
+        }
+        responses, results = [], {}
+        with self.lock:
+            state = self.state
+            self.stats['method_calls'] += len(request['methodCalls'])
+            for name, args, call_id in request['methodCalls']:
+                try:
+                    args = self.resolve(args, results)
+                except (KeyError, TypeError):
+                    responses.append(['error', {'type': 'invalidResultReference'}, call_id])
+                    continue
+                if name not in methods:
+                    responses.append(['error', {'type': 'unknownMethod'}, call_id])
+                    continue
+                response = methods[name](args)
+                if isinstance(response, tuple):
+                    responses.append([*response, call_id])
+                else:
+                    results[call_id] = response
+                    responses.append([name, response, call_id])
+            if self.state != state:
+                self.changed.notify_all()
+        return {'methodResponses': responses, 'sessionState': 'session-1'}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    jmap: FakeJMAP = None
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def encode(self, body: bytes) -> tuple[bytes, str | None]:
+        """Compress body with the best encoding the client accepts, returning it and the encoding"""
+
+        accepted = [e.split(';')[0].strip() for e in self.headers.get('Accept-Encoding', '').split(',')]
+        if 'br' in accepted:
+            try:
+                import brotli
+                return brotli.compress(body, quality=5), 'br'
+            except ImportError:
+                pass
+        if 'gzip' in accepted:
+            return gzip.compress(body, compresslevel=6), 'gzip'
+        return body, None
+
+    def reply(self, status: int, body: bytes, headers: dict | None = None) -> None:
+        if self.jmap.latency:
+            time.sleep(self.jmap.latency)
+        encoding = None
+        if self.jmap.compress:
+            body, encoding = self.encode(body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        if encoding is not None:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+        with self.jmap.lock:
+            self.jmap.stats['bytes_out'] += len(body)
+
+    def count(self, body: bytes) -> None:
+        with self.jmap.lock:
+            self.jmap.stats['requests'] += 1
+            self.jmap.stats['bytes_in'] += len(body)
+
+    def do_GET(self) -> None:
+        self.count(b'')
+        if self.path.startswith('/jmap/event/'):
+            return self.event_source()
+        if self.path != '/.well-known/jmap':
+            return self.reply(404, b'{}')
+        host = f'http://{self.server.server_address[0]}:{self.server.server_address[1]}'
+        self.reply(200, json.dumps(self.jmap.session(host)).encode())
+
+    def event_source(self) -> None:
+        """Stream a StateChange on connect and on every change, and pings in between, until the client goes away"""
+
+        ping = int(parse_qs(urlsplit(self.path).query).get('ping', ['300'])[0]) or 300
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        jmap = self.jmap
+        sent = None
+        try:
+            while True:
+                with jmap.changed:
+                    if sent == jmap.state:
+                        jmap.changed.wait(ping)
+                    state, change = jmap.state, jmap.state_change()
+                if state != sent:
+                    self.wfile.write(f'event: state\ndata: {json.dumps(change)}\n\n'.encode())
+                    sent = state
+                else:
+                    self.wfile.write(f'event: ping\ndata: {{"interval": {ping}}}\n\n'.encode())
+                self.wfile.flush()
+        except OSError:
+            pass
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.count(body)
+
+        if self.path != '/jmap/api/':
+            return self.reply(404, b'{}')
+
+        throttle_every = self.jmap.throttle_every
+        if throttle_every and self.jmap.stats['requests'] % throttle_every == 0:
+            with self.jmap.lock:
+                self.jmap.stats['throttled'] += 1
+            return self.reply(429, b'{"type": "urn:ietf:params:jmap:error:limit"}', {'Retry-After': str(self.jmap.retry_after)})
+
+        try:
+            request = json.loads(body)
+        except ValueError:
+            return self.reply(400, b'{"type": "urn:ietf:params:jmap:error:notJSON"}')
+
+        self.reply(200, json.dumps(self.jmap.api(request)).encode())
+
+
+class FakeServer:
+    """Run a FakeJMAP on a background thread::
+
+        with FakeServer(FakeJMAP(size=10000)) as server:
+            client = MaskedMailClient('u', 't', session_url=server.session_url)
+    """
+
+    def __init__(self, jmap: FakeJMAP, host: str = '127.0.0.1', port: int = 0):
+        handler = type('BoundHandler', (Handler,), {'jmap': jmap})
+        self.jmap = jmap
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def session_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}/.well-known/jmap'
+
+    def __enter__(self) -> 'FakeServer':
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=1000, help='Number of masked emails to generate')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0, help='Milliseconds added to every response')
+    parser.add_argument('--throttle-every', type=int, default=0, help='Answer every nth API request with 429')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compress', action='store_true', help='Compress responses the client accepts compressed')
+    args = parser.parse_args()
+
+    jmap = FakeJMAP(size=args.size, latency=args.latency / 1000, throttle_every=args.throttle_every, seed=args.seed, compress=args.compress)
+    server = FakeServer(jmap, args.host, args.port)
+    print(f'Serving {args.size} masked emails at {server.session_url}')
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""
+End-to-end benchmarks for the fastmask CLI against a local JMAP stand-in
+
+For each account size, starts benchmarks/fake_server.py on a background
+thread and runs each case as a fresh `python -m fastmask` process, with its
+own cache directory unless the case is marked warm (then an untimed run
+fills the session cache and mirror first). Reports wall time, HTTP requests
+and bytes seen by the server, and the peak RSS of the fastmask process.
+
+    python benchmarks/run.py [--sizes 10,10000,100000] [--latency-ms 20] [--throttle-every 0] [--compress]
+                             [--case list --case search ...] [--runs 3] [--json results.json]
+
+With --json, results are appended to the file together with the fastmask
+version and a timestamp, so runs can be compared over time.
+"""
+
+from datetime import datetime, timezone
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_server import FakeJMAP, FakeServer
+
+BULK_SIZE = 500
+
+# name: (fastmask arguments, warm). {email}, {ids}, {out} and {snapshot} are filled in per account
+CASES = {
+    'list': (['--no-cache', 'list'], False),
+    'list --limit 20 (warm)': (['list', '--limit', '20', '--desc'], True),
+    'list --json': (['--no-cache', 'list', '--json'], False),
+    'list --recent 30': (['--no-cache', 'list', '--recent', '30'], False),
+    'list --where': (['--no-cache', 'list', '--where', 'state = enabled and lastMessageAt is null'], False),
+    'search': (['--no-cache', 'search', 'amazon'], False),
+    'search --ranked': (['--no-cache', 'search', 'amazon', '--ranked', '--limit', '20'], False),
+    'resolve + block': (['--no-cache', 'block', '{email}'], False),
+    'resolve + block (warm)': (['block', '{email}'], True),
+    f'bulk block {BULK_SIZE}': (['--no-cache', 'block', '--from-file', '{ids}'], False),
+    'export csv': (['--no-cache', 'list', '-o', '{out}.csv'], False),
+    'export json': (['--no-cache', 'list', '-o', '{out}.json'], False),
+    'stats': (['--no-cache', 'stats'], False),
+    'stats (warm)': (['stats'], True),
+    'list (snapshot)': (['list', '--from-snapshot', '{snapshot}'], False),
+    'stats (snapshot)': (['stats', '--from-snapshot', '{snapshot}'], False),
+}
+
+
+def run_fastmask(argv: list[str], env: dict) -> tuple[int, float, int, str]:
+    """Run fastmask in a child process, returning (exit code, wall seconds, peak RSS bytes, stderr)"""
+
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'fastmask', *argv],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, env=env, cwd=ROOT,
+    )
+    stderr = proc.stderr.read()
+    _, status, usage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+    return proc.returncode, wall, rss, stderr.decode(errors='replace')
+
+
+def bench_size(size: int, cases: list[str], args: argparse.Namespace, workdir: str) -> list[dict]:
+    jmap = FakeJMAP(size=size, latency=args.latency_ms / 1000, throttle_every=args.throttle_every, seed=args.seed, compress=args.compress)
+    records = sorted(jmap.objects.values(), key=lambda x: x['id'])
+    email = records[len(records) // 2]['email']
+
+    ids_path = os.path.join(workdir, f'ids-{size}.txt')
+    with open(ids_path, 'w') as f:
+        f.writelines(x['id'] + '\n' for x in records[:BULK_SIZE])
+    snapshot_path = os.path.join(workdir, f'snapshot-{size}.fmsnap')
+
+    results = []
+    with FakeServer(jmap) as server:
+        for name in cases:
+            template, warm = CASES[name]
+            cache = tempfile.mkdtemp(dir=workdir)
+            env = dict(
+                os.environ,
+                PYTHONPATH=ROOT,
+                SKIP_PYTHONDOTENV='1',
+                FM_USERNAME='bench@fastmail.com',
+                FM_ME_TOKEN='bench-token',
+                FM_SESSION_URL=server.session_url,
+                FASTMASK_CACHE_DIR=cache,
+            )
+            argv = [a.format(email=email, ids=ids_path, out=os.path.join(cache, 'out'), snapshot=snapshot_path) for a in template]
+
+            if '{snapshot}' in template and not os.path.exists(snapshot_path):
+                run_fastmask(['--no-cache', 'snapshot', snapshot_path], env)
+            if warm:
+                run_fastmask(['list', '--limit', '1'], env)
+
+            best = None
+            for _ in range(args.runs):
+                jmap.reset_stats()
+                code, wall, rss, stderr = run_fastmask(argv, env)
+                stats = dict(jmap.stats)
+                if code != 0:
+                    print(f'{name} failed at size {size}:\n{stderr.strip()[-2000:]}', file=sys.stderr)
+                if best is None or wall < best['wall_s']:
+                    best = {
+                        'case': name,
+                        'size': size,
+                        'ok': code == 0,
+                        'wall_s': wall,
+                        'requests': stats['requests'],
+                        'throttled': stats['throttled'],
+                        'bytes': stats['bytes_in'] + stats['bytes_out'],
+                        'peak_rss': rss,
+                    }
+            results.append(best)
+            print_row(best)
+    return results
+
+
+def print_row(r: dict) -> None:
+    status = '' if r['ok'] else '  FAILED'
+    print(f'{r["case"]:<26} {r["size"]:>7} {r["wall_s"] * 1000:>10.0f} {r["requests"]:>5} {r["throttled"]:>5} '
+          f'{r["bytes"] / 1024:>10.1f} {r["peak_rss"] / 2**20:>8.1f}{status}', flush=True)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10,10000,100000', help='Comma separated account sizes')
+    parser.add_argument('--case', dest='cases', action='append', choices=list(CASES), help='Case to run (repeatable), all by default')
+    parser.add_argument('--latency-ms', type=float, default=0, help='Latency added to every server response')
+    parser.add_argument('--throttle-every', type=int, default=0, help='Answer every nth API request with 429')
+    parser.add_argument('--runs', type=int, default=1, help='Runs per case, the fastest is kept')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compress', action='store_true', help='Compress responses the client accepts compressed')
+    parser.add_argument('--json', dest='json_path', default=None, help='Append results to this JSON file')
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',')]
+    cases = args.cases or list(CASES)
+
+    print(f'{"case":<26} {"size":>7} {"wall ms":>10} {"reqs":>5} {"429s":>5} {"KiB":>10} {"RSS MiB":>8}')
+    results = []
+    with tempfile.TemporaryDirectory(prefix='fastmask-bench-') as workdir:
+        for size in sizes:
+            results += bench_size(size, cases, args, workdir)
+
+    if args.json_path is not None:
+        from fastmask.version import __version__
+
+        history = []
+        if os.path.exists(args.json_path):
+            with open(args.json_path) as f:
+                history = json.load(f)
+        history.append({
+            'date': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'version': __version__,
+            'python': sys.version.split()[0],
+            'latency_ms': args.latency_ms,
+            'throttle_every': args.throttle_every,
+            'results': results,
+        })
+        with open(args.json_path, 'w') as f:
+            json.dump(history, f, indent=4)
+
+    return 0 if all(r['ok'] for r in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
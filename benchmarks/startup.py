@@ -0,0 +1,115 @@
+"""
+Cold start benchmark for the fastmask CLI
+
+Runs each subcommand's --help under `python -X importtime`, which loads the
+CLI and parses arguments without touching credentials or the network, and
+reports the import time and wall time for each. The client module is
+measured on its own since every command that runs needs it, and a few
+commands are run for real against benchmarks/fake_server.py, so the imports
+on their whole path are covered too.
+
+Exits non-zero if any command fails or measurement is over budget, or if
+a module that should only load for tables and file output (pandas,
+rich.table) is imported on the way.
+
+    python benchmarks/startup.py [--budget-ms 150] [--client-budget-ms 250] [--command-budget-ms 250] [--runs 5]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ('pandas', 'numpy', 'rich.table', 'rich.console')
+
+# Commands run against the fake server, with output that needs no tables
+COMMANDS = [
+    ['--no-cache', 'list', '--limit', '5', '--json'],
+    ['--no-cache', 'search', 'shop', '--limit', '5', '--json'],
+    ['--no-cache', 'stats', '--json'],
+]
+
+
+def importtime(argv: list[str], env: dict | None = None) -> tuple[float, float, set[str], int]:
+    """Run python -X importtime argv, returning (import ms, wall ms, imported modules, exit code)"""
+
+    env = {**os.environ, 'SKIP_PYTHONDOTENV': '1', 'FM_USERNAME': '', 'FM_ME_TOKEN': '', **(env or {})}
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', *argv],
+        capture_output=True, text=True, env=env,
+    )
+    wall = (time.perf_counter() - start) * 1000
+
+    total_us, modules = 0, set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        total_us += int(self_us)
+        modules.add(name.strip())
+
+    return total_us / 1000, wall, modules, proc.returncode
+
+
+def best_of(runs: int, argv: list[str], env: dict | None = None) -> tuple[float, float, set[str], int]:
+    results = [importtime(argv, env) for _ in range(runs)]
+    return min(r[0] for r in results), min(r[1] for r in results), results[0][2], max(r[3] for r in results)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget-ms', type=float, default=150, help='Import time budget for a subcommand --help')
+    parser.add_argument('--client-budget-ms', type=float, default=250, help='Import time budget for the client module')
+    parser.add_argument('--command-budget-ms', type=float, default=250, help='Import time budget for a command run against the fake server')
+    parser.add_argument('--runs', type=int, default=5, help='Runs per measurement, the best is kept')
+    args = parser.parse_args()
+
+    from fastmask.cli import cli
+    from fake_server import FakeJMAP, FakeServer
+
+    cases = [('fastmask --help', ['-m', 'fastmask', '--help'], args.budget_ms, None)]
+    cases += [(f'fastmask {name} --help', ['-m', 'fastmask', name, '--help'], args.budget_ms, None) for name in sorted(cli.commands)]
+    cases += [('import fastmask.masked_email', ['-c', 'import fastmask.masked_email'], args.client_budget_ms, None)]
+
+    failures = []
+    with FakeServer(FakeJMAP(size=100)) as server, tempfile.TemporaryDirectory() as cache:
+        env = {
+            'FM_USERNAME': 'bench@fastmail.com',
+            'FM_ME_TOKEN': 'bench-token',
+            'FM_SESSION_URL': server.session_url,
+            'FASTMASK_CACHE_DIR': cache,
+            'FASTMASK_NO_DAEMON': '1',
+        }
+        cases += [(f'fastmask {argv[1]} (fake server)', ['-m', 'fastmask', *argv], args.command_budget_ms, env) for argv in COMMANDS]
+
+        print(f'{"case":<40} {"import ms":>10} {"wall ms":>10}')
+        for label, argv, budget, case_env in cases:
+            import_ms, wall_ms, modules, code = best_of(args.runs, argv, case_env)
+            heavy = sorted(m for m in modules if m in HEAVY_MODULES)
+            flag = ''
+            if code != 0:
+                flag = f'  exited with {code}'
+                failures.append(label)
+            if import_ms > budget:
+                flag = f'  over budget ({budget:.0f} ms)'
+                failures.append(label)
+            if heavy:
+                flag += f'  imports {", ".join(heavy)}'
+                failures.append(label)
+            print(f'{label:<40} {import_ms:>10.1f} {wall_ms:>10.1f}{flag}')
+
+    if failures:
+        print(f'\n{len(failures)} startup regression(s)')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
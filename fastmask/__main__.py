@@ -0,0 +1,16 @@
+import sys
+
+def main() -> None:
+    """Forward the command to a running `fastmask serve` if there is one, otherwise run it here"""
+
+    from fastmask.daemon import forward
+
+    code = forward(sys.argv[1:])
+    if code is not None:
+        sys.exit(code)
+
+    from fastmask.cli import cli
+    cli()
+
+if __name__ == '__main__':
+    main()
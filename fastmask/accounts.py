@@ -0,0 +1,270 @@
+"""
+Masked Email operations across several Fastmail accounts at once
+
+Accounts are listed in a credentials file, one per line as a username and
+an API token separated by whitespace. Blank lines and lines starting with
+# are ignored::
+
+    # username                token
+    alice@fastmail.com        fmu1-...
+    bob@example.com           fmu1-...
+"""
+
+from fastmask.instrument import Instrumentation
+from fastmask.masked_email import MaskedMailClient
+from fastmask.record import MaskedEmail
+from fastmask.scheduler import RequestScheduler
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Iterable, Iterator
+import queue
+import threading
+
+SEPARATOR = ':'
+
+# Records read ahead by MultiAccountClient.iter, across accounts, before workers wait for the consumer
+ITER_QUEUE_SIZE = 1024
+
+# Marks the end of an account's records in MultiAccountClient.iter
+DONE = object()
+
+
+def read_credentials(lines: Iterable[str]) -> list[tuple[str, str]]:
+    """Parse (username, token) pairs from the lines of a credentials file"""
+
+    accounts, seen = [], set()
+    for n, line in enumerate(lines, 1):
+        line = line.strip()
+        if len(line) == 0 or line.startswith('#'):
+            continue
+
+        parts = line.split()
+        if len(parts) != 2:
+            raise ValueError(f'Line {n}: expected a username and a token')
+        username, token = parts
+        if username in seen:
+            raise ValueError(f'Line {n}: {username} is listed more than once')
+
+        seen.add(username)
+        accounts.append((username, token))
+
+    if len(accounts) == 0:
+        raise ValueError('No accounts found')
+    return accounts
+
+def qualify(username: str, id_: str) -> str:
+    """Id of a Masked Email qualified with its account, as used by MultiAccountClient"""
+
+    return f'{username}{SEPARATOR}{id_}'
+
+def unqualify(key: str) -> tuple[str, str]:
+    username, _, id_ = key.rpartition(SEPARATOR)
+    return username, id_
+
+def tag(x: MaskedEmail, username: str) -> MaskedEmail:
+    """
+    A copy of x tagged with its account. Records may still be held by the
+    account's client, so they are never tagged in place
+    """
+
+    x = x.copy()
+    x['account'] = username
+    return x
+
+
+class MultiIdIndex:
+    """
+    IdIndex over several accounts, resolving keys to account-qualified ids
+
+    A key may itself be qualified (username:key) to look only in that account.
+    """
+
+    def __init__(self, indexes: dict[str, Any]):
+        self.indexes = indexes
+
+    def resolve(self, key: str) -> list[str]:
+        username, unqualified = unqualify(key)
+        if username in self.indexes:
+            return [qualify(username, id_) for id_ in self.indexes[username].resolve(unqualified)]
+        return [qualify(username, id_) for username, index in self.indexes.items() for id_ in index.resolve(key)]
+
+
+class MultiAccountClient:
+    """
+    Runs MaskedMailClient calls for several accounts on a bounded thread pool
+
+    Each account gets its own client, created on first use in a worker, and
+    its own RequestScheduler so throttling on one account does not hold back
+    the others. All clients share the pooled HTTP session. Results stream
+    back as each account finishes, or with iter as records arrive, and
+    records are tagged with an 'account' field holding the username.
+
+    Sorting and limits apply within each account, not across the merged results.
+    """
+
+    def __init__(self, accounts: list[tuple[str, str]], max_workers: int = 8, on_error: Callable[[str, Exception], None] | None = None, rate: float | None = None, hooks: list[Callable] | None = None, **options):
+        """
+        accounts: (username, token) pairs, e.g. from read_credentials
+        max_workers [optional]: Accounts worked on at once
+        on_error [optional]: Called with the username and exception when an account fails, after
+        which the others carry on. By default the exception is raised
+        rate [optional]: Maximum requests per second, per account
+        hooks [optional]: Instrumentation hooks given to every client (see fastmask.instrument)
+        options: Other MaskedMailClient arguments, e.g. session_url or mirror
+        """
+
+        self.tokens = dict(accounts)
+        self.max_workers = max_workers
+        self.on_error = on_error
+        self.rate = rate
+        self.hooks = hooks
+        self.options = options
+        self.clients = {}
+        self._lock = threading.Lock()
+        self.instrument = Instrumentation(hooks)
+
+    @property
+    def account_id(self) -> str:
+        return f'across {len(self.tokens)} accounts'
+
+    def client(self, username: str) -> MaskedMailClient:
+        """The client for username, created on first use"""
+
+        with self._lock:
+            client = self.clients.get(username)
+        if client is None:
+            client = MaskedMailClient(
+                username,
+                self.tokens[username],
+                scheduler=RequestScheduler(rate=self.rate),
+                hooks=self.hooks,
+                **self.options,
+            )
+            with self._lock:
+                client = self.clients.setdefault(username, client)
+        return client
+
+    def map(self, fn: Callable[[MaskedMailClient], Any], usernames: Iterable[str] | None = None) -> Iterator[tuple[str, Any]]:
+        """
+        Call fn with each account's client in parallel, yielding (username,
+        result) pairs in the order the accounts finish
+        """
+
+        usernames = list(self.tokens if usernames is None else usernames)
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, max(1, len(usernames)))) as pool:
+            futures = {pool.submit(lambda u=username: fn(self.client(u))): username for username in usernames}
+            for future in as_completed(futures):
+                username = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    if self.on_error is None:
+                        raise
+                    self.on_error(username, e)
+                    continue
+                yield username, result
+
+    def tagged(self, results: Iterator[tuple[str, list[MaskedEmail]]]) -> Iterator[MaskedEmail]:
+        for username, records in results:
+            for x in records:
+                yield tag(x, username)
+
+    def get(self, **kwargs) -> Iterator[MaskedEmail]:
+        """Masked Emails of every account, tagged with 'account'. Takes the arguments of MaskedMailClient.get"""
+
+        return self.tagged(self.map(lambda client: client.get(**kwargs)))
+
+    def iter(self, **kwargs) -> Iterator[MaskedEmail]:
+        """
+        Masked Emails of every account, tagged with 'account', as they are read. Takes the
+        arguments of MaskedMailClient.iter
+
+        Each account's stream is read in parallel on the pool, into a queue
+        holding at most ITER_QUEUE_SIZE records, so records are yielded as
+        soon as any account delivers them while memory stays bounded.
+        """
+
+        usernames = list(self.tokens)
+        results = queue.Queue(maxsize=ITER_QUEUE_SIZE)
+        stop = threading.Event()
+
+        def put(item) -> bool:
+            # Gives up once the consumer has stopped reading, so workers never block on a full queue
+            while not stop.is_set():
+                try:
+                    results.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def produce(username: str) -> None:
+            try:
+                for x in self.client(username).iter(**kwargs):
+                    if not put((username, x, None)):
+                        return
+            except Exception as e:
+                put((username, DONE, e))
+            else:
+                put((username, DONE, None))
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, max(1, len(usernames)))) as pool:
+            for username in usernames:
+                pool.submit(produce, username)
+            try:
+                remaining = len(usernames)
+                while remaining > 0:
+                    username, x, error = results.get()
+                    if x is not DONE:
+                        yield tag(x, username)
+                        continue
+                    remaining -= 1
+                    if error is not None:
+                        if self.on_error is None:
+                            raise error
+                        self.on_error(username, error)
+            finally:
+                stop.set()
+
+    def search(self, query: str, **kwargs) -> Iterator[MaskedEmail]:
+        """Search every account, tagging results with 'account'. Takes the arguments of MaskedMailClient.search"""
+
+        return self.tagged(self.map(lambda client: client.search(query, **kwargs)))
+
+    def stats(self, top_n: int = 10, where: str | None = None) -> dict[str, list[tuple[str, int]]]:
+        """Aggregates over the Masked Emails of every account together. Takes the arguments of MaskedMailClient.stats"""
+
+        from fastmask.stats import account_stats, properties
+        from fastmask.where import compile_where
+
+        if isinstance(where, str):
+            where = compile_where(where)
+        masked_emails = list(self.get(sort_by=None, where=where, properties=properties(where)))
+        with self.instrument.span('stats', records=len(masked_emails)):
+            return account_stats(masked_emails, top_n=top_n)
+
+    def id_index(self) -> MultiIdIndex:
+        """Index resolving emails, descriptions and ids in every account to account-qualified ids"""
+
+        return MultiIdIndex(dict(self.map(lambda client: client.id_index())))
+
+    def resolve(self, key: str) -> list[str]:
+        return self.id_index().resolve(key)
+
+    def update_many(self, changes: dict[str, dict]) -> dict:
+        """
+        Update Masked Emails in several accounts, keyed by account-qualified id
+        (username:masked-id), with one batched update per account in parallel
+        """
+
+        by_account = {}
+        for key, change in changes.items():
+            username, id_ = unqualify(key)
+            by_account.setdefault(username, {})[id_] = change
+
+        result = {'updated': {}, 'notUpdated': {}}
+        for username, response in self.map(lambda client: client.update_many(by_account[client.username]), by_account):
+            result['updated'].update((qualify(username, k), v) for k, v in response['updated'].items())
+            result['notUpdated'].update((qualify(username, k), v) for k, v in response['notUpdated'].items())
+        return result
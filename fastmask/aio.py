@@ -0,0 +1,367 @@
+from fastmask.cache import SessionCache, SESSION_TTL
+from fastmask.codec import Codec, get_codec, accept_encoding
+from fastmask.masked_email import (
+    HOSTNAME,
+    JMAP_CORE,
+    MASKED_EMAIL_SCOPE,
+    DEFAULT_MAX_OBJECTS_IN_SET,
+    DEFAULT_MAX_CALLS_IN_REQUEST,
+    creation_entries,
+    set_result_keys,
+    set_batches,
+    set_method_calls,
+    get_batches,
+    get_method_calls,
+    merge_get_responses,
+    merge_set_responses,
+)
+from fastmask.instrument import Instrumentation, observe_response, timed_query
+from fastmask.query import search_filter, recent_filter
+from fastmask.record import MaskedEmail
+from fastmask.scheduler import RequestScheduler, is_idempotent
+
+from typing import AsyncIterator, Callable, Iterable
+from datetime import timedelta
+from itertools import islice
+import asyncio
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class AsyncMaskedMailClient:
+    """
+    asyncio client for Fastmail's Masked Email JMAP API
+
+    Mirrors the public API of MaskedMailClient on httpx, with a shared
+    connection pool and a semaphore bounding the number of requests in flight.
+    Requires the 'async' extra: pip install fastmask[async]
+
+    Use as an async context manager so the connection pool is closed::
+
+        async with AsyncMaskedMailClient(username, token) as client:
+            await client.new(description='signup')
+    """
+
+    def __init__(self, username: str, token: str, concurrency: int = 16, session_url: str | None = None, cache_session: bool = True, session_ttl: float = SESSION_TTL, http: 'httpx.AsyncClient | None' = None, scheduler: RequestScheduler | None = None, hooks: list[Callable] | None = None, codec: str | Codec | None = None):
+        """Initialize using a username and Fastmail API token
+
+        concurrency [optional]: Maximum number of JMAP requests in flight at once
+        session_url [optional]: JMAP session endpoint, defaults to Fastmail's
+        cache_session [optional]: Cache the JMAP session resource on disk so warm clients skip the session GET
+        session_ttl [optional]: Seconds before a cached session is refetched
+        http [optional]: httpx.AsyncClient to send calls through. One is created (and closed by close()) if not given
+        scheduler [optional]: RequestScheduler pacing and retrying calls
+        hooks [optional]: Callables receiving an event dict for every HTTP request and processing stage (see fastmask.instrument)
+        codec [optional]: JSON codec for requests and responses, 'orjson' or 'json' (see fastmask.codec). Defaults to
+        orjson when installed
+        """
+
+        if httpx is None:
+            raise ImportError('AsyncMaskedMailClient requires httpx: pip install fastmask[async]')
+
+        if not username and not token:
+            raise ValueError('No username/token found')
+
+        self.hostname = HOSTNAME
+        self.session_url = session_url or f'https://{self.hostname}/.well-known/jmap'
+        self.username = username
+        self.token = token
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler()
+        self.instrument = Instrumentation(hooks)
+        self.codec = codec if isinstance(codec, Codec) else get_codec(codec)
+        self.accept_encoding = accept_encoding()
+        self.session_cache = SessionCache(username, token, ttl=session_ttl) if cache_session else None
+        self._owns_http = http is None
+        self.http = http if http is not None else httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+            timeout=30,
+        )
+        self._session_from_cache = False
+        self._session_lock = asyncio.Lock()
+        self.session = None
+        self.api_url = None
+        self.account_id = None
+
+    async def __aenter__(self) -> 'AsyncMaskedMailClient':
+        await self.get_session()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """Close the connection pool, if this client created it"""
+
+        if self._owns_http:
+            await self.http.aclose()
+
+    @property
+    def headers(self) -> dict:
+        return {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.token}",
+            "Accept-Encoding": self.accept_encoding,
+        }
+
+    @property
+    def limits(self) -> dict:
+        """Core capability limits advertised by the JMAP session"""
+
+        return self.session.get('capabilities', {}).get(JMAP_CORE, {})
+
+    async def get_session(self) -> dict:
+        """Return the JMAP Session Resource as a Python dict, fetching it on first use"""
+
+        async with self._session_lock:
+            if self.session:
+                return self.session
+            return await self.__load_session()
+
+    async def __load_session(self) -> dict:
+        """Load the session from the cache or the server. Called holding the session lock"""
+
+        session = self.session_cache.load() if self.session_cache is not None else None
+        self._session_from_cache = session is not None
+
+        if session is None:
+            r = await self.__send(lambda: self.http.get(self.session_url, headers=self.headers), idempotent=True, methods=['session'])
+            r.raise_for_status()
+            with self.instrument.span('decode', bytes=len(r.content)):
+                session = self.codec.loads(r.content)
+            if self.session_cache is not None:
+                self.session_cache.save(session)
+
+        self.session = session
+        self.api_url = session['apiUrl']
+        self.account_id = session['primaryAccounts'][JMAP_CORE]
+        return session
+
+    async def refresh_session(self, stale: dict | None = None) -> dict:
+        """
+        Discard the cached session and fetch a new one from the server
+
+        stale [optional]: The session the caller found out of date. If another coroutine has
+        replaced it in the meantime, its replacement is returned without fetching again
+        """
+
+        async with self._session_lock:
+            if stale is not None and self.session is not stale:
+                return self.session
+            if self.session_cache is not None:
+                self.session_cache.clear()
+            return await self.__load_session()
+
+    async def get_account_id(self) -> str:
+        """Return the accountId for the account matching self.username"""
+
+        await self.get_session()
+        return self.account_id
+
+    async def __jmap_call(self, call: dict) -> dict:
+        """Make a JMAP POST request to the API, returning the reponse as a Python data structure"""
+
+        session = await self.get_session()
+
+        data = self.codec.dumps(call)
+        idempotent = is_idempotent(call)
+        methods = [name for name, _, _ in call['methodCalls']]
+
+        async with self.semaphore:
+            res = await self.__send(lambda: self.http.post(self.api_url, headers=self.headers, content=data), idempotent, methods, len(data))
+
+            if res.status_code == 401 and self._session_from_cache:
+                session = await self.refresh_session(session)
+                res = await self.__send(lambda: self.http.post(self.api_url, headers=self.headers, content=data), idempotent, methods, len(data))
+
+        res.raise_for_status()
+        with self.instrument.span('decode', bytes=len(res.content)):
+            response = self.codec.loads(res.content)
+
+        # Calls running concurrently may all see the change; only the first refetches the session
+        if response.get('sessionState') not in (None, session.get('state')):
+            await self.refresh_session(session)
+
+        return response
+
+    async def __send(self, request: Callable, idempotent: bool, methods: list[str], request_bytes: int = 0) -> 'httpx.Response':
+        """Send a request through the scheduler, retrying transient failures, and emit a call event"""
+
+        with self.instrument.call(methods, request_bytes) as event:
+            response = await self.scheduler.send_async(
+                request,
+                idempotent=idempotent,
+                safe_errors=(httpx.ConnectError, httpx.ConnectTimeout),
+                errors=(httpx.TransportError,),
+            )
+            observe_response(event, response)
+        return response
+
+    async def get(self, ids: list[str] | None = None, filters: Callable | None = None, sort_by: str = 'createdAt', sort_order: str = 'asc', limit: int | None = None, where: str | None = None, properties: list[str] | None = None) -> list[MaskedEmail]:
+        """Get Masked Emails associated with account, fetching id chunks concurrently. See MaskedMailClient.get"""
+
+        await self.get_session()
+
+        async def send(batch):
+            response = await self.__jmap_call({
+                'using': [JMAP_CORE, MASKED_EMAIL_SCOPE],
+                'methodCalls': get_method_calls(batch, self.account_id, properties),
+            })
+            return response['methodResponses']
+
+        responses = await asyncio.gather(*(send(batch) for batch in get_batches(ids, self.limits)))
+
+        masked_email_list = merge_get_responses(responses)['list']
+        with self.instrument.span('load', records=len(masked_email_list)):
+            masked_email_list = [MaskedEmail.from_dict(x) for x in masked_email_list]
+
+        return timed_query(self.instrument, masked_email_list, filters=filters, sort_by=sort_by, sort_order=sort_order, limit=limit, where=where)
+
+    async def new(self, url: str | None = None, domain: str = '', description: str = '', state: str = 'enabled'):
+        'Created a new Masked Email, optionally setting url, forDomain, description'
+
+        await self.get_session()
+        response = await self.__jmap_call({
+            'using': [JMAP_CORE, MASKED_EMAIL_SCOPE],
+            'methodCalls': [
+                [
+                    'MaskedEmail/set',
+                    {
+                        'accountId': self.account_id,
+                        'create': {
+                            'new-masked-email': {
+                                'state': state,
+                                'description': description,
+                                'url': url,
+                                'forDomain': domain,
+                            }
+                        }
+                    },
+                    'a'
+                ]
+            ]
+        })
+        return response['methodResponses'][0]
+
+    async def update(self, masked_id: str, changes: dict) -> dict:
+        """Update an existing Masked Email"""
+
+        await self.get_session()
+        response = await self.__jmap_call({
+            'using': [JMAP_CORE, MASKED_EMAIL_SCOPE],
+            'methodCalls': [
+                [
+                    'MaskedEmail/set',
+                    {
+                        'accountId': self.account_id,
+                        'update': {
+                            masked_id: changes,
+                        }
+                    },
+                    'a'
+                ]
+            ]
+        })
+        return response['methodResponses'][0]
+
+    async def __set_many(self, operation: str, entries: dict) -> dict:
+        """Send MaskedEmail/set entries in batches, running the batches concurrently"""
+
+        await self.get_session()
+        done, not_done = set_result_keys(operation)
+        result = {done: {}, not_done: {}}
+
+        async def send(batch):
+            response = await self.__jmap_call({
+                'using': [JMAP_CORE, MASKED_EMAIL_SCOPE],
+                'methodCalls': set_method_calls(operation, batch, self.account_id)
+            })
+            merge_set_responses(result, operation, batch, response['methodResponses'])
+
+        await asyncio.gather(*(send(batch) for batch in set_batches(entries, self.limits)))
+        return result
+
+    async def update_many(self, changes: dict[str, dict]) -> dict:
+        """Update many Masked Emails. See MaskedMailClient.update_many"""
+
+        return await self.__set_many('update', changes)
+
+    async def new_many(self, masked_emails: list[dict] | dict[str, dict]) -> dict:
+        """Create many Masked Emails. See MaskedMailClient.new_many"""
+
+        return await self.__set_many('create', creation_entries(masked_emails))
+
+    async def new_stream(self, masked_emails: Iterable[tuple[str, dict]], batch_size: int | None = None) -> AsyncIterator[dict]:
+        """Create Masked Emails from a stream of (creation id, properties) pairs, one request at a time. See MaskedMailClient.new_stream"""
+
+        await self.get_session()
+        if batch_size is None:
+            batch_size = self.limits.get('maxObjectsInSet', DEFAULT_MAX_OBJECTS_IN_SET) * self.limits.get('maxCallsInRequest', DEFAULT_MAX_CALLS_IN_REQUEST)
+
+        masked_emails = iter(masked_emails)
+        while batch := dict(islice(masked_emails, batch_size)):
+            yield await self.__set_many('create', creation_entries(batch))
+
+    async def get_active(self) -> list[MaskedEmail]:
+        """Get all active Masked Emails"""
+
+        return await self.get(filters=(
+            lambda x: x.state == 'enabled'
+        ))
+
+    async def get_disabled(self) -> list[MaskedEmail]:
+        """Get all blocked Masked Emails"""
+
+        return await self.get(filters=(
+            lambda x: x.state == 'disabled'
+        ))
+
+    async def get_deleted(self) -> list[MaskedEmail]:
+        """Get all deleted Masked Emails"""
+
+        return await self.get(filters=(
+            lambda x: x.state == 'deleted'
+        ))
+
+    async def get_unused(self) -> list[MaskedEmail]:
+        """Get all active Masked Emails that have not received messages"""
+
+        return await self.get(filters=(
+            lambda x: x.last_message_at is None and x.state == 'enabled'
+        ))
+
+    async def enable(self, masked_id: str) -> dict:
+        """Set Masked Email to active"""
+
+        return await self.update(masked_id=masked_id, changes={'state': 'enabled'})
+
+    async def disable(self, masked_id: str) -> dict:
+        """Set Masked Email to blocked"""
+
+        return await self.update(masked_id=masked_id, changes={'state': 'disabled'})
+
+    async def delete(self, masked_id: str) -> dict:
+        """
+        Delete Masked Email
+
+        Address will appear under 'Review deleted masked address' and will remain recoverable. Does not permanently delete.
+        """
+
+        return await self.update(masked_id=masked_id, changes={'state': 'deleted'})
+
+    async def search(self, query: str, fields: list[str] = ['email', 'description'], limit: int | None = None, where: str | None = None, properties: list[str] | None = None) -> list[MaskedEmail]:
+        """
+        Search for Masked Emails matching query text
+
+        Defaults to searching email and description fields only.
+        """
+
+        return await self.get(filters=search_filter(query, fields), limit=limit, where=where, properties=properties)
+
+    async def get_recent(self, timeframe: timedelta = timedelta(days=3)) -> list[MaskedEmail]:
+        """Get recently created Masked Emails (default is 3 days)"""
+
+        return await self.get(filters=recent_filter(timeframe), sort_by='createdAt', sort_order='desc')
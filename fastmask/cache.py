@@ -0,0 +1,84 @@
+from typing import TYPE_CHECKING
+import json
+import os
+import time
+
+# pathlib and hashlib are imported where they are used, so forwarding a
+# command to `fastmask serve` (see fastmask.daemon) doesn't load them
+if TYPE_CHECKING:
+    from pathlib import Path
+
+SESSION_TTL = 60 * 60 * 24
+
+def cache_location() -> str:
+    """Return the path of the fastmask cache directory, which may not exist yet
+
+    Uses $FASTMASK_CACHE_DIR if set, otherwise $XDG_CACHE_HOME/fastmask (~/.cache/fastmask)
+    """
+
+    path = os.getenv('FASTMASK_CACHE_DIR')
+    if not path:
+        path = os.path.join(os.getenv('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'fastmask')
+    return path
+
+def cache_dir() -> 'Path':
+    """Return the fastmask cache directory, creating it if needed"""
+
+    from pathlib import Path
+
+    path = Path(cache_location())
+    path.mkdir(mode=0o700, parents=True, exist_ok=True)
+    return path
+
+def account_key(username: str, token: str) -> str:
+    """Stable, non-reversible key for a username + token pair"""
+
+    import hashlib
+
+    return hashlib.sha256(f'{username}:{token}'.encode()).hexdigest()[:32]
+
+def write_json(path: 'Path', data) -> None:
+    """Atomically write json to path, readable by the current user only"""
+
+    tmp = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as fh:
+        json.dump(data, fh)
+    os.replace(tmp, path)
+
+def read_json(path: 'Path'):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+class SessionCache:
+    """On-disk cache of the JMAP Session Resource, keyed by username and token hash"""
+
+    def __init__(self, username: str, token: str, ttl: float = SESSION_TTL):
+        self.ttl = ttl
+        self.path = cache_dir() / f'session-{account_key(username, token)}.json'
+
+    def load(self) -> dict | None:
+        """Return the cached session, or None if missing or older than ttl"""
+
+        cached = read_json(self.path)
+        if not isinstance(cached, dict) or 'session' not in cached:
+            return None
+        if time.time() - cached.get('fetched_at', 0) > self.ttl:
+            return None
+        return cached['session']
+
+    def save(self, session: dict) -> None:
+        try:
+            write_json(self.path, {'fetched_at': time.time(), 'session': session})
+        except OSError:
+            pass
+
+    def clear(self) -> None:
+        try:
+            self.path.unlink()
+        except OSError:
+            pass
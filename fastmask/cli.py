@@ -1,41 +1,209 @@
-from fastmask.masked_email import MaskedMailClient
+from __future__ import annotations
+
 from fastmask.utils import (
     error_msg,
     success_msg,
-    to_date,
-    handle_output
+    handle_output,
+    output_properties,
 )
+from fastmask.export import FORMATS
 from fastmask.version import __version__
 
 import click
-from datetime import datetime, timezone, timedelta
+from functools import cache, wraps
+from typing import TYPE_CHECKING
 import os
-import re
 
-skip_dotenv=os.getenv('SKIP_PYTHONDOTENV', 'False').lower() in ('true', '1', 't')
-if not skip_dotenv:
-    from dotenv import load_dotenv
-    load_dotenv()
+if TYPE_CHECKING:
+    from fastmask.accounts import MultiAccountClient
+    from fastmask.masked_email import MaskedMailClient
+    from fastmask.snapshot import Snapshot
+
+# Clients kept warm by `fastmask serve`, keyed by (username, token, session_url),
+# which commands it runs reuse instead of building their own
+warm_clients = {}
+
+@cache
+def load_env() -> None:
+    """Load the nearest .env from the working directory up on first use, unless SKIP_PYTHONDOTENV is set"""
+
+    skip_dotenv=os.getenv('SKIP_PYTHONDOTENV', 'False').lower() in ('true', '1', 't')
+    if not skip_dotenv:
+        from dotenv import find_dotenv, load_dotenv
+        load_dotenv(find_dotenv(usecwd=True))
 
-EMAIL_PATTERN = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
+def getenv(key: str) -> str:
+    load_env()
+    return os.environ.get(key, '')
 
 @click.group()
 @click.version_option(__version__)
 @click.option(
     "--username",
-    default=lambda: os.environ.get("FM_USERNAME", ""),
+    default=lambda: getenv("FM_USERNAME"),
     show_default="FM_USERNAME"
 )
 @click.option(
     "--token",
-    default=lambda: os.environ.get("FM_ME_TOKEN", ""),
+    default=lambda: getenv("FM_ME_TOKEN"),
     show_default="FM_ME_TOKEN",
 )
+@click.option('--no-cache', is_flag=True, default=False, help='Fetch from the server, skipping the mirror and id index')
+@click.option('--refresh', is_flag=True, default=False, help='Rebuild the local mirror from a full fetch')
+@click.option('--rate', type=float, default=None, help='Maximum API requests per second')
+@click.option(
+    '--session-url',
+    default=lambda: getenv('FM_SESSION_URL') or None,
+    show_default='FM_SESSION_URL',
+    help='JMAP session endpoint',
+)
+@click.option('--profile', is_flag=True, default=False, help='Print a per-stage timing breakdown to stderr')
+@click.option(
+    '--accounts',
+    type=click.Path(dir_okay=False),
+    default=lambda: getenv('FM_ACCOUNTS') or None,
+    show_default='FM_ACCOUNTS',
+    help='Credentials file to run list, search and state changes across several accounts',
+)
+@click.option('--jobs', type=int, default=8, help='Accounts worked on at once with --accounts')
 @click.pass_context
-def cli(context, username: str, token: str):
+def cli(context, username: str, token: str, no_cache: bool, refresh: bool, rate: float | None, session_url: str | None, profile: bool, accounts: str | None, jobs: int):
     """Manage Fastmail masked email from the command line"""
 
-    context.obj = MaskedMailClient(username=username,token=token)
+    profiler = None
+    if profile:
+        from fastmask.instrument import Profiler
+        profiler = Profiler()
+        context.call_on_close(profiler.report)
+
+    context.obj = {
+        'username': username,
+        'token': token,
+        'no_cache': no_cache,
+        'refresh': refresh,
+        'rate': rate,
+        'session_url': session_url,
+        'profiler': profiler,
+        'accounts': accounts,
+        'jobs': jobs,
+        'client': None,
+    }
+
+def get_multi_client() -> MultiAccountClient:
+    """Client for every account in the --accounts credentials file"""
+
+    from fastmask.accounts import MultiAccountClient, read_credentials
+
+    obj = click.get_current_context().find_root().obj
+
+    try:
+        with open(obj['accounts']) as fh:
+            accounts = read_credentials(fh)
+    except (OSError, ValueError) as e:
+        error_msg(f'Unable to read accounts from {obj["accounts"]}: {e}')
+
+    def on_error(username: str, e: Exception) -> None:
+        error_msg(f'{username}: {e}', exit_=False)
+
+    client = MultiAccountClient(
+        accounts,
+        max_workers=obj['jobs'],
+        on_error=on_error,
+        rate=obj['rate'],
+        hooks=[obj['profiler']] if obj['profiler'] is not None else None,
+        session_url=obj['session_url'],
+        mirror=not obj['no_cache'],
+        cache_index=not obj['no_cache'],
+    )
+
+    if obj['refresh'] and not obj['no_cache']:
+        for _ in client.map(lambda c: c.mirror.clear()):
+            pass
+
+    return client
+
+def get_client(multi: bool = False) -> MaskedMailClient | MultiAccountClient:
+    """
+    Return the client for the current invocation, creating it on first use
+
+    With --accounts, commands that support it (multi) get a MultiAccountClient.
+    """
+
+    obj = click.get_current_context().find_root().obj
+
+    if obj['accounts'] is not None:
+        if not multi:
+            error_msg(f'fastmask {click.get_current_context().info_name} works on a single account. Use --username/--token instead of --accounts')
+        if obj['client'] is None:
+            obj['client'] = get_multi_client()
+        return obj['client']
+
+    key = (obj['username'], obj['token'], obj['session_url'])
+    if obj['client'] is None and key in warm_clients and not (obj['no_cache'] or obj['refresh']):
+        obj['client'] = warm_clients[key]
+        if obj['profiler'] is not None:
+            obj['client'].instrument.add_hook(obj['profiler'])
+            click.get_current_context().find_root().call_on_close(lambda: obj['client'].instrument.remove_hook(obj['profiler']))
+
+    if obj['client'] is None:
+        from fastmask.masked_email import MaskedMailClient
+        from fastmask.scheduler import RequestScheduler
+
+        obj['client'] = MaskedMailClient(
+            username=obj['username'],
+            token=obj['token'],
+            session_url=obj['session_url'],
+            mirror=not obj['no_cache'],
+            cache_index=not obj['no_cache'],
+            scheduler=RequestScheduler(rate=obj['rate']),
+            hooks=[obj['profiler']] if obj['profiler'] is not None else None,
+        )
+
+        if obj['refresh'] and not obj['no_cache']:
+            obj['client'].mirror.clear()
+
+    return obj['client']
+
+def open_snapshot(path: str) -> Snapshot:
+    """Open a --from-snapshot file, exiting with the reason if it can't be read"""
+
+    from fastmask.snapshot import Snapshot
+
+    profiler = click.get_current_context().find_root().obj['profiler']
+    try:
+        return Snapshot(path, hooks=[profiler] if profiler is not None else None)
+    except (OSError, ValueError) as e:
+        error_msg(f'Unable to read snapshot: {e}')
+
+def pass_client(f=None, *, multi: bool = False, snapshot: bool = False):
+    """
+    Like click.pass_obj, passing the MaskedMailClient as the first argument
+
+    The client (and the requests import behind it) is only built when a
+    command actually runs, so --help needs no credentials or network.
+    Commands declared with multi=True accept --accounts, and are passed a
+    MultiAccountClient when it is given. Commands declared with
+    snapshot=True take a from_snapshot argument, and are passed the
+    Snapshot instead of a client when it is given.
+    """
+
+    if f is None:
+        return lambda f: pass_client(f, multi=multi, snapshot=snapshot)
+
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if snapshot:
+            path = kwargs.pop('from_snapshot')
+            if path is not None:
+                return f(open_snapshot(path), *args, **kwargs)
+        return f(get_client(multi), *args, **kwargs)
+    return wrapper
+
+def multi_account() -> bool:
+    """Whether the command is running on a MultiAccountClient, rather than one account or a snapshot"""
+
+    obj = click.get_current_context().find_root().obj
+    return obj['accounts'] is not None and obj['client'] is not None
 
 @cli.command(name='list')
 @click.option('--limit', default=None, type=int, help='Limit number of results')
@@ -49,59 +217,155 @@ def cli(context, username: str, token: str):
     , case_sensitive=False), default='createdAt', help='Field to sort by')
 @click.option('--desc/--asc', default=False, help='Sort order')
 @click.option('--recent', default=None, type=int, help='Only show items from the past X days')
+@click.option('--where', default=None, type=str, help='Filter expression, e.g. "forDomain endswith .shop"')
 @click.option('-j', '--json', is_flag=True, default=False, help='Print to json instead of table')
-@click.option('-o', '--out', default=None, type=str, help='Output to csv or json file')
-@click.pass_obj
-def list_cmd(client: MaskedMailClient, limit: int | None, state: str | None, recent: int | None, sort: str, desc: bool, json: bool, out: str | None):
+@click.option('-o', '--out', default=None, type=str, help='Output to csv, json or ndjson file')
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), default=None, help='Output format, defaults to the --out extension')
+@click.option('--page', is_flag=True, default=False, help='Show the table in a pager ($PAGER, less by default)')
+@click.option('--from-snapshot', type=click.Path(exists=True, dir_okay=False), default=None, help='Read from a snapshot file instead of the account')
+@pass_client(multi=True, snapshot=True)
+def list_cmd(client: MaskedMailClient | MultiAccountClient | Snapshot, limit: int | None, state: str | None, recent: int | None, where: str | None, sort: str, desc: bool, json: bool, out: str | None, fmt: str | None, page: bool):
     """List masked emails associated with account"""
 
+    from fastmask.instrument import timed_render
+
     state_map = {
-        'active': (lambda x: x['state'] == 'enabled'),
-        'blocked': (lambda x: x['state'] == 'disabled'),
-        'deleted': (lambda x: x['state'] == 'deleted'),
-        'unused': (lambda x: x['lastMessageAt'] is None and x['state'] == 'enabled'),
-        'used': (lambda x: x['lastMessageAt'] is not None),
-        None: (lambda x: x)
+        'active': 'state = enabled',
+        'blocked': 'state = disabled',
+        'deleted': 'state = deleted',
+        'unused': 'lastMessageAt is null and state = enabled',
+        'used': 'lastMessageAt is not null',
+        None: None,
     }
 
-    if recent is not None:
-        now = datetime.now(timezone.utc).replace(tzinfo=None)
-        recent_filter = (lambda x: (now - to_date(x['createdAt'])) < timedelta(days=recent))
-    else:
-        recent_filter = (lambda x: x)
+    clauses = [
+        state_map[state],
+        f'createdAt > now-{recent}d' if recent is not None else None,
+        f'({where})' if where is not None else None,
+    ]
 
-    filters = (lambda x: state_map[state](x) and recent_filter(x))
+    where = compile_filter(' and '.join(c for c in clauses if c is not None))
 
-    results = client.get(filters=filters, limit=limit, sort_by=sort, sort_order='desc' if desc else 'asc')
+    results = client.iter(
+        where=where,
+        limit=limit,
+        sort_by=sort,
+        sort_order='desc' if desc else 'asc',
+        properties=fetch_properties(out, json, fmt, where, [sort]),
+    )
 
-    handle_output(r=results, o=out, j=json, t=f'Masked Emails {client.account_id}')
+    timed_render(client.instrument, results, lambda r: handle_output(r=r, o=out, j=json, t=f'Masked Emails {client.account_id}', f=fmt, page=page, accounts=multi_account()))
 
 @cli.command()
 @click.argument('query', default='')
 @click.option('--blank', is_flag=True)
 @click.option('--field', '-f', 'fields', multiple=True, default=['email', 'description'])
 @click.option('--limit', default=None, type=int, help='Limit number of results')
+@click.option('--ranked', is_flag=True, default=False, help='Order by best match using a search index')
+@click.option('--where', default=None, type=str, help='Filter expression, e.g. "state = enabled"')
 @click.option('-j', '--json', is_flag=True, default=False, help='Print to json instead of table')
-@click.option('-o', '--out', default=None, type=str, help='Output to csv or json file')
-@click.pass_obj
-def search(client: MaskedMailClient, query: str, limit: int, fields: list[str], blank: bool, json: bool, out: str | None):
+@click.option('-o', '--out', default=None, type=str, help='Output to csv, json or ndjson file')
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), default=None, help='Output format, defaults to the --out extension')
+@click.option('--page', is_flag=True, default=False, help='Show the table in a pager ($PAGER, less by default)')
+@click.option('--from-snapshot', type=click.Path(exists=True, dir_okay=False), default=None, help='Read from a snapshot file instead of the account')
+@pass_client(multi=True, snapshot=True)
+def search(client: MaskedMailClient | MultiAccountClient | Snapshot, query: str, limit: int, fields: list[str], blank: bool, ranked: bool, where: str | None, json: bool, out: str | None, fmt: str | None, page: bool):
     """Search for masked emails"""
 
+    from fastmask.instrument import timed_render
+    from fastmask.query import search_filter
+
+    where = compile_filter(where)
+
     if blank:
-        results = client.get(filters=(lambda x: x['description'] == ''), limit=limit)
+        results = client.iter(filters=(lambda x: x.description == ''), limit=limit, where=where, sort_by='createdAt', properties=fetch_properties(out, json, fmt, where, ['description', 'createdAt']))
     elif len(query)==0:
         error_msg('No query provided. Did you mean to use \'fastmask search --blank\'?')
+    elif ranked:
+        results = client.search(query=query, fields=fields, limit=limit, ranked=True, where=where)
     else:
-        results = client.search(query=query, fields=fields)
+        results = client.iter(filters=search_filter(query, fields), limit=limit, where=where, sort_by='createdAt', properties=fetch_properties(out, json, fmt, where, [*fields, 'createdAt']))
 
-    handle_output(r=results, o=out, j=json, t=f'Search results for "{query if query is not None else ""}"')
+    timed_render(client.instrument, results, lambda r: handle_output(r=r, o=out, j=json, t=f'Search results for "{query if query is not None else ""}"', f=fmt, page=page, accounts=multi_account()))
+
+@cli.command()
+@click.option('--top', 'top_n', default=10, type=int, help='Number of most common domains and URLs to show')
+@click.option('--where', default=None, type=str, help='Filter expression, e.g. "createdBy = fastmask"')
+@click.option('-j', '--json', is_flag=True, default=False, help='Print to json instead of table')
+@click.option('-o', '--out', default=None, type=str, help='Output to csv, json or ndjson file')
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), default=None, help='Output format, defaults to the --out extension')
+@click.option('--from-snapshot', type=click.Path(exists=True, dir_okay=False), default=None, help='Read from a snapshot file instead of the account')
+@pass_client(multi=True, snapshot=True)
+def stats(client: MaskedMailClient | MultiAccountClient | Snapshot, top_n: int, where: str | None, json: bool, out: str | None, fmt: str | None):
+    """Summarize masked emails by state, age, domain and activity"""
+
+    from fastmask import config
+    from fastmask.stats import COLUMNS, rows
+
+    result = client.stats(top_n=top_n, where=compile_filter(where))
+
+    with client.instrument.span('render'):
+        handle_output(r=rows(result), o=out, j=json, t=f'Masked Email stats {client.account_id}', f=fmt, columns=COLUMNS, schema=config.stats_schema)
+
+@cli.command()
+@click.option('--block', 'block_rules', multiple=True, help='Block addresses matching this filter expression')
+@click.option('--delete', 'delete_rules', multiple=True, help='Delete addresses matching this filter expression')
+@click.option('--apply', 'apply_', is_flag=True, default=False, help='Make the changes instead of showing them')
+@click.option('-j', '--json', is_flag=True, default=False, help='Print the plan to json instead of table')
+@click.option('-o', '--out', default=None, type=str, help='Output the plan to csv, json or ndjson file')
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), default=None, help='Output format, defaults to the --out extension')
+@pass_client
+def prune(client: MaskedMailClient, block_rules: tuple[str], delete_rules: tuple[str], apply_: bool, json: bool, out: str | None, fmt: str | None):
+    """Block or delete masked emails matching rules, in one pass"""
+
+    from fastmask import config
+    from fastmask.export import COLUMN_ORDER
+    from fastmask.masked_email import StateMismatch
+
+    # Deleting is the stronger action, so it wins when both match
+    rules = [('delete', compile_filter(w)) for w in delete_rules if w] + [('block', compile_filter(w)) for w in block_rules if w]
+    if len(rules) < 1:
+        error_msg('Specify at least one rule with --block or --delete')
+
+    plan = client.plan_prune(rules)
+    if len(plan) == 0:
+        success_msg('Nothing to prune')
+        return
+
+    if not apply_:
+        counts = plan.counts()
+        with client.instrument.span('render'):
+            handle_output(r=plan, o=out, j=json, t=f'Prune plan {client.account_id}', f=fmt, columns=['action', *COLUMN_ORDER], schema={'action': config.action_column, **config.table_schema})
+        if out is None and fmt is None and not json:
+            success_msg(f'{counts["block"]} to block, {counts["delete"]} to delete. Run again with --apply to make these changes')
+        return
+
+    try:
+        result = client.prune(plan)
+    except StateMismatch as e:
+        error_msg(f'Gave up after repeated changes by another client: {e}')
+
+    for k, v in result['notUpdated'].items():
+        error_msg(f'Failed to update email {k}: {v.get("description", v.get("type"))}', exit_=False)
+    if result['replans'] > 0:
+        success_msg(f'Planned again {result["replans"]} times after changes by another client')
+    success_msg(f'Blocked {result["applied"]["block"]} and deleted {result["applied"]["delete"]} masked emails ({len(result["notUpdated"])} failed)')
+
+@cli.command()
+@click.argument('path', type=click.Path(dir_okay=False))
+@pass_client
+def snapshot(client: MaskedMailClient, path: str):
+    """Save masked emails to a file for --from-snapshot"""
+
+    count = client.save_snapshot(path)
+    success_msg(f'Saved {count} masked emails to {path}')
 
 @cli.command()
 @click.argument('description', default='')
 @click.option('--url', type=str)
 @click.option('--domain', default='', type=str)
 @click.option('--pending', is_flag=True, default=False)
-@click.pass_obj
+@pass_client
 def new(client: MaskedMailClient, description: str, url: str, domain: str, pending: bool):
     """Create a new masked email"""
 
@@ -121,44 +385,164 @@ def new(client: MaskedMailClient, description: str, url: str, domain: str, pendi
     except Exception as e:
         error_msg(e)
 
-@click.pass_obj
-def update(client: MaskedMailClient, id_: str, changes: dict):
-    """Update a masked email. Called by edit, activate, block, delete"""
+@cli.command(name='import')
+@click.argument('source', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), default=None, help='Input format, defaults to the file extension')
+@click.option('--results', default=None, type=str, help='Results file, defaults to SOURCE.results.ndjson')
+@click.option('--batch-size', default=None, type=int, help='Masked emails created per request')
+@pass_client
+def import_cmd(client: MaskedMailClient, source: str, fmt: str | None, results: str | None, batch_size: int | None):
+    """Create masked emails from a csv, ndjson or json file"""
+
+    from fastmask.importer import import_masked_emails, load_checkpoint, results_path
+
+    results = results_path(source, results)
+    done = len(load_checkpoint(results))
+    if done > 0:
+        success_msg(f'Resuming: skipping {done} rows already imported (see {results})')
+
+    totals = {'created': 0, 'failed': 0}
+    try:
+        for batch in import_masked_emails(client, source, results=results, fmt=fmt, batch_size=batch_size):
+            totals = batch['totals']
+            success_msg(f'Created {totals["created"]} masked emails ({totals["failed"]} failed)')
+    except (ValueError, KeyError) as e:
+        error_msg(f'Unable to read {source}: {e}')
+
+    if totals['created'] + totals['failed'] == 0:
+        success_msg('Nothing to import')
+    if totals['failed'] > 0:
+        error_msg(f'{totals["failed"]} rows failed, see {results}', exit_=False)
+
+@cli.command()
+@click.option('--interval', default=30.0, type=float, help='Seconds between background refreshes')
+@pass_client
+def serve(client: MaskedMailClient, interval: float):
+    """Keep the account in memory and answer fastmask commands from it"""
+
+    from fastmask.daemon import Daemon
+    import signal
+
+    daemon = Daemon(client, interval=interval)
+    try:
+        daemon.refresh()
+    except Exception as e:
+        error_msg(f'Unable to load masked emails: {e}')
+
+    # Stop cleanly on SIGTERM too, so the socket is removed
+    signal.signal(signal.SIGTERM, lambda *_: exit())
+    success_msg(f'Serving {len(client.get(sort_by=None))} masked emails on {daemon.path}')
+    try:
+        daemon.serve_forever()
+    except RuntimeError as e:
+        error_msg(e)
+    except KeyboardInterrupt:
+        pass
+
+@cli.command()
+@click.option('--since', default=None, type=str, help='Report changes after this state rather than from now')
+@click.option('--ping', default=30, type=int, help='Seconds between keep-alive pings from the server')
+@pass_client
+def watch(client: MaskedMailClient, since: str | None, ping: int):
+    """Print changes to masked emails as they happen, as ndjson"""
+
+    from fastmask.watch import Watcher
+    import json
+    import requests
+
+    try:
+        for event in Watcher(client, since_state=since, ping=ping).events():
+            click.echo(json.dumps(event))
+    except requests.HTTPError as e:
+        error_msg(f'Unable to watch for changes: {e}')
+    except KeyboardInterrupt:
+        pass
+
+def compile_filter(expression: str | None):
+    """Compile a --where expression, exiting with the parse error if it is malformed"""
+
+    if not expression:
+        return None
+
+    from fastmask.where import compile_where, WhereError
+
+    try:
+        return compile_where(expression)
+    except WhereError as e:
+        error_msg(f'Invalid filter expression: {e}')
+
+def fetch_properties(out: str | None, json: bool, fmt: str | None, where=None, fields: list[str] = ()) -> list[str] | None:
+    """
+    Properties list and search need from the server: those the output shows,
+    plus those the filter and sort read. None when the output is whole records
+    """
+
+    from fastmask.record import FIELDS
+
+    shown = output_properties(out, json, fmt)
+    if shown is None:
+        return None
+
+    needed = {'id', *shown, *getattr(where, 'fields', ()), *fields}
+    return [k for k in FIELDS if k in needed]
+
+def read_ids(ids: tuple[str], from_file) -> list[str]:
+    """Combine ids given as arguments with ids read one per line from a file or stdin"""
+
+    ids = list(ids)
+    if from_file is not None:
+        for line in from_file:
+            line = line.strip()
+            if len(line) > 0 and not line.startswith('#'):
+                ids.append(line)
+
+    if len(ids) < 1:
+        error_msg('Specify at least one masked email')
+
+    return ids
+
+@pass_client(multi=True)
+def update(client: MaskedMailClient | MultiAccountClient, ids: list[str], changes: dict) -> dict:
+    """Update masked emails. Called by edit, activate, block, delete"""
 
     def get_masked_email_id(id_):
-        if id_.startswith('masked-') and id_[7:].isnumeric():
-            result = client.get(ids=[id_])
-        elif id_.isnumeric():
-            result = client.get(ids=[f'masked-{id_}'])
-        elif re.match(EMAIL_PATTERN, id_):
-            result = client.get(filters=(lambda x: x['email'] == id_))
-        else:
-            result = client.get(filters=(lambda x: x['description'].lower() == id_))
-
-        if len(result)>0:
-            return result[0]['id']
-        else:
+        result = index.resolve(id_)
+
+        if len(result) == 0:
             error_msg(f'Unable to find Masked Email "{id_}"')
+        elif len(result) > 1:
+            error_msg(f'"{id_}" matches {len(result)} masked emails ({", ".join(result)}). Use an id or email instead')
 
-    masked_email_id = get_masked_email_id(id_)
+        return result[0]
 
     changes = {k:v for k,v in changes.items() if v is not None}
 
     if len(changes)<1:
         error_msg('Specify fields to update')
 
-    response = client.update(masked_id=masked_email_id, changes=changes)
+    index = client.id_index()
+    masked_email_ids = [get_masked_email_id(id_) for id_ in ids]
+
+    return client.update_many({masked_email_id: changes for masked_email_id in masked_email_ids})
+
+def report(response: dict, verb: str) -> None:
+    """Print per-id results of a bulk update"""
+
+    for k in response['updated']:
+        success_msg(f'Successfully {verb} email {k}')
 
-    return response
+    for k, v in response['notUpdated'].items():
+        error_msg(f'Failed to update email {k}: {v.get("description", v.get("type"))}', exit_=False)
 
 @cli.command()
-@click.argument('id_', required=True)
+@click.argument('ids', nargs=-1)
+@click.option('--from-file', type=click.File('r'), default=None, help='Read ids one per line from a file ("-" for stdin)')
 @click.option('--description', type=str)
 @click.option('--url', type=str)
 @click.option('--domain', type=str)
-@click.pass_obj
-def edit(client: MaskedMailClient, id_: str, description: str, url: str | None, domain: str | None):
-    """Edit information associated with a masked email"""
+@pass_client(multi=True)
+def edit(client: MaskedMailClient, ids: tuple[str], from_file, description: str, url: str | None, domain: str | None):
+    """Edit information associated with masked emails"""
 
     changes = {
         'description': description,
@@ -166,55 +550,31 @@ def edit(client: MaskedMailClient, id_: str, description: str, url: str | None,
         'forDomain': domain,
     }
 
-    response = update(id_=id_, changes=changes)
-
-    try:
-        msg = f'Successfully edited email {[k for k,v in response[1]["updated"].items()][0]}'
-        success_msg(msg)
-
-    except Exception as e:
-        error_msg(e)
+    report(update(ids=read_ids(ids, from_file), changes=changes), 'edited')
 
 @cli.command()
-@click.argument('id_', required=True)
-@click.pass_obj
-def activate(client: MaskedMailClient, id_: str):
-    """Set state of masked email to Active"""
+@click.argument('ids', nargs=-1)
+@click.option('--from-file', type=click.File('r'), default=None, help='Read ids one per line from a file ("-" for stdin)')
+@pass_client(multi=True)
+def activate(client: MaskedMailClient, ids: tuple[str], from_file):
+    """Set state of masked emails to Active"""
 
-    response = update(id_=id_, changes={'state': 'enabled'})
-    try:
-        msg = f'Successfully activated email {[k for k,v in response[1]["updated"].items()][0]}'
-        success_msg(msg)
-
-    except Exception as e:
-        error_msg(e)
+    report(update(ids=read_ids(ids, from_file), changes={'state': 'enabled'}), 'activated')
 
 @cli.command()
-@click.argument('id_', required=True)
-@click.pass_obj
-def block(client: MaskedMailClient, id_: str):
-    """Set state of masked email to Blocked"""
-
-    response = update(id_=id_, changes={'state': 'disabled'})
+@click.argument('ids', nargs=-1)
+@click.option('--from-file', type=click.File('r'), default=None, help='Read ids one per line from a file ("-" for stdin)')
+@pass_client(multi=True)
+def block(client: MaskedMailClient, ids: tuple[str], from_file):
+    """Set state of masked emails to Blocked"""
 
-    try:
-        msg = f'Successfully blocked email {[k for k,v in response[1]["updated"].items()][0]}'
-        success_msg(msg)
-
-    except Exception as e:
-        error_msg(e)
+    report(update(ids=read_ids(ids, from_file), changes={'state': 'disabled'}), 'blocked')
 
 @cli.command()
-@click.argument('id_', required=True)
-@click.pass_obj
-def delete(client: MaskedMailClient, id_: str):
-    """Delete masked email"""
+@click.argument('ids', nargs=-1)
+@click.option('--from-file', type=click.File('r'), default=None, help='Read ids one per line from a file ("-" for stdin)')
+@pass_client(multi=True)
+def delete(client: MaskedMailClient, ids: tuple[str], from_file):
+    """Delete masked emails"""
 
-    response = update(id_=id_, changes={'state': 'deleted'})
-
-    try:
-        msg = f'Successfully deleted email {[k for k,v in response[1]["updated"].items()][0]}'
-        success_msg(msg)
-
-    except Exception as e:
-        error_msg(e)
+    report(update(ids=read_ids(ids, from_file), changes={'state': 'deleted'}), 'deleted')
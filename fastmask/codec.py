@@ -0,0 +1,60 @@
+"""
+JSON codecs and response compression for JMAP requests
+
+Requests are encoded and responses decoded by a Codec. orjson is used when
+installed (pip install fastmask[fast]), and is several times faster at
+decoding a large MaskedEmail/get response than the standard library, which
+is the fallback. Streamed responses (see fastmask.stream) are always
+decoded with the standard library.
+"""
+
+from typing import Any, Callable, NamedTuple
+import json
+
+# Response compressions asked for, best first, when they can be decoded here
+PREFERRED_ENCODINGS = ('br', 'gzip')
+
+
+class Codec(NamedTuple):
+    name: str
+    dumps: Callable[[Any], bytes]
+    loads: Callable[[bytes | str], Any]
+
+
+STDLIB = Codec('json', lambda obj: json.dumps(obj, separators=(',', ':')).encode(), json.loads)
+
+
+def get_codec(name: str | None = None) -> Codec:
+    """
+    The codec called name ('orjson' or 'json'), or by default the fastest installed
+
+    orjson is imported here rather than with the module, keeping it off the
+    startup path of commands that never make a request.
+    """
+
+    if name in (None, 'orjson'):
+        try:
+            import orjson
+        except ImportError:
+            if name == 'orjson':
+                raise ImportError('The orjson codec requires orjson: pip install fastmask[fast]') from None
+        else:
+            return Codec('orjson', orjson.dumps, orjson.loads)
+
+    if name in (None, STDLIB.name):
+        return STDLIB
+    raise ValueError(f'Unknown JSON codec: {name}')
+
+def accept_encoding() -> str:
+    """
+    Accept-Encoding value for the compressions urllib3 and httpx can decode
+    here, best first. Brotli needs the brotli (or brotlicffi) package
+    """
+
+    from importlib.util import find_spec
+
+    decodable = {
+        'br': find_spec('brotli') is not None or find_spec('brotlicffi') is not None,
+        'gzip': True,
+    }
+    return ', '.join(e for e in PREFERRED_ENCODINGS if decodable[e])
@@ -5,6 +5,22 @@ TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
 def to_date(d: str) -> datetime:
     return datetime.strptime(d, TIME_FORMAT)
 
+def as_date(d: str | datetime) -> datetime:
+    return d if isinstance(d, datetime) else to_date(d)
+
+account_column = {
+    'header': 'Account',
+    'style': 'magenta',
+}
+
+action_column = {
+    'header': 'Action',
+    'row_style': {
+        'block': 'red',
+        'delete': 'dim',
+    }
+}
+
 table_schema = {
     'description': {
         'header': 'Description',
@@ -24,7 +40,7 @@ table_schema = {
     'createdAt': {
         'header': 'Created',
         'style': 'italic',
-        'transform': (lambda x: datetime.strftime(to_date(x), '%m/%d/%y'))
+        'transform': (lambda x: datetime.strftime(as_date(x), '%m/%d/%y'))
     },
     'lastMessageAt': {
         'header': 'Last Msg',
@@ -32,7 +48,7 @@ table_schema = {
         'row_style': {
             None: 'dim',
         },
-        'transform': (lambda x: datetime.strftime(to_date(x), '%m/%d/%y') if x is not None else
+        'transform': (lambda x: datetime.strftime(as_date(x), '%m/%d/%y') if x is not None else
         'Never')
     },
     'state': {
@@ -60,3 +76,24 @@ table_schema = {
         'hide': True
     },
 }
+
+stats_schema = {
+    'stat': {
+        'header': 'Stat',
+        'style': 'blue',
+    },
+    'key': {
+        'header': 'Value',
+        'style': 'cyan',
+        'row_style': {
+            'enabled': 'green',
+            'disabled': 'red',
+            'deleted': 'dim',
+            'pending': 'yellow',
+        }
+    },
+    'count': {
+        'header': 'Count',
+        'transform': str,
+    },
+}
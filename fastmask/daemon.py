@@ -0,0 +1,273 @@
+"""
+Long-running fastmask process answering CLI commands over a Unix socket
+
+`fastmask serve` keeps an authenticated client, the full list of Masked
+Emails and the id and search indexes in memory, refreshing them in the
+background. The `fastmask` command forwards its arguments to the daemon
+when its socket exists and runs locally otherwise.
+
+Requests and responses are single JSON lines, so editors and scripts can
+talk to the socket directly::
+
+    {"argv": ["list", "--json"], "cwd": "/home/me", "env": {"FM_USERNAME": "..."}, "columns": 120, "tty": false}
+    {"exit": 0, "stdout": "...", "stderr": ""}
+
+env holds the FM_* and terminal variables of the caller, including those
+from the .env file in its working directory, and is exactly the set the
+command runs with: the daemon's own FM_* and terminal variables are unset
+while it runs, so a command never falls back to the daemon's account.
+"""
+
+from fastmask.cache import cache_dir, cache_location
+
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
+from typing import TYPE_CHECKING, Iterator
+import io
+import json
+import os
+import socket
+import sys
+import threading
+
+if TYPE_CHECKING:
+    from fastmask.masked_email import MaskedMailClient
+
+SOCKET_NAME = 'serve.sock'
+
+# Environment passed on to the daemon besides FM_* variables
+TERMINAL_ENV = ('TERM', 'COLORTERM', 'NO_COLOR', 'FORCE_COLOR')
+
+# Arguments that need the caller's terminal or stdin, or run until
+# interrupted, so always run locally
+LOCAL_ARGS = ('serve', 'watch', '--page', '-')
+
+# Fields `fastmask search --ranked` indexes by default, kept warm by the daemon
+SEARCH_FIELDS = ('email', 'description')
+
+
+def socket_path() -> str:
+    return os.path.join(cache_location(), SOCKET_NAME)
+
+def forwarded_env(environ: dict) -> dict:
+    return {k: v for k, v in environ.items() if k.startswith('FM_') or k in TERMINAL_ENV}
+
+def caller_env(environ: dict) -> dict:
+    """
+    The FM_* and terminal variables a local run would see: those in environ,
+    plus FM_* ones from .env (see fastmask.cli.load_env) that environ doesn't set
+    """
+
+    env = forwarded_env(environ)
+    if environ.get('SKIP_PYTHONDOTENV', 'False').lower() not in ('true', '1', 't'):
+        from dotenv import dotenv_values, find_dotenv
+
+        for k, v in dotenv_values(find_dotenv(usecwd=True)).items():
+            if k.startswith('FM_') and v is not None:
+                env.setdefault(k, v)
+    return env
+
+def terminal_columns() -> int | None:
+    try:
+        return os.get_terminal_size(sys.stdout.fileno()).columns
+    except (OSError, ValueError):
+        return None
+
+def forward(argv: list[str], path: str | None = None) -> int | None:
+    """
+    Run a command in the daemon, printing its output and returning its exit code
+
+    Returns None, having sent nothing, when no daemon is listening, when
+    FASTMASK_NO_DAEMON is set, or when argv must run locally.
+    """
+
+    if os.getenv('FASTMASK_NO_DAEMON') or any(arg in LOCAL_ARGS for arg in argv):
+        return None
+
+    path = path or socket_path()
+    if not os.path.exists(path):
+        return None
+
+    request = {
+        'argv': argv,
+        'cwd': os.getcwd(),
+        'env': caller_env(os.environ),
+        'columns': terminal_columns(),
+        'tty': sys.stdout.isatty(),
+    }
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+
+    with sock, sock.makefile('rb') as fh:
+        sock.sendall(json.dumps(request).encode() + b'\n')
+        line = fh.readline()
+
+    # The command may have run, so it is not retried locally
+    if not line:
+        print('fastmask serve closed the connection without a response', file=sys.stderr)
+        return 1
+
+    response = json.loads(line)
+    sys.stdout.write(response['stdout'])
+    sys.stdout.flush()
+    sys.stderr.write(response['stderr'])
+    return response['exit']
+
+@contextmanager
+def environment(env: dict, cwd: str | None) -> Iterator[None]:
+    """Temporarily set environment variables, or unset those given as None, and the working directory"""
+
+    saved = {k: os.environ.get(k) for k in env}
+    old_cwd = os.getcwd()
+    for k, v in env.items():
+        if v is None:
+            os.environ.pop(k, None)
+        else:
+            os.environ[k] = v
+    try:
+        if cwd is not None:
+            os.chdir(cwd)
+        yield
+    finally:
+        os.chdir(old_cwd)
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+def exit_code(e: SystemExit) -> int:
+    if e.code is None or isinstance(e.code, int):
+        return e.code or 0
+    print(e.code, file=sys.stderr)
+    return 1
+
+
+class Daemon:
+    """
+    Serves CLI commands over a Unix socket from a client kept warm in memory
+
+    Commands run one at a time in the daemon process, with the caller's
+    arguments, working directory and environment, and their output captured.
+    A background thread reloads the account every interval seconds, sharing
+    a lock with the commands so neither sees the client mid-update.
+    """
+
+    def __init__(self, client: 'MaskedMailClient', interval: float = 30.0, path: str | None = None):
+        """
+        client: Client to keep warm. Its snapshot_ttl is set to twice interval, so commands fall
+        back to the network if background refreshes stop succeeding
+        interval [optional]: Seconds between background refreshes
+        path [optional]: Socket path, defaults to serve.sock in the cache dir
+        """
+
+        self.client = client
+        self.client.snapshot_ttl = 2 * interval
+        self.interval = interval
+        self.path = path or os.path.join(cache_dir(), SOCKET_NAME)
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def refresh(self) -> None:
+        """Reload the account and bring the indexes up to date"""
+
+        with self.lock:
+            self.client.refresh_snapshot()
+            self.client.id_index()
+            self.client.search_index(SEARCH_FIELDS)
+
+    def refresher(self) -> None:
+        while not self.stopped.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                # Commands may be redirecting sys.stderr
+                print(f'Refresh failed: {e}', file=sys.__stderr__)
+
+    def run(self, request: dict) -> dict:
+        """Run the command in request, returning its exit code and output"""
+
+        from fastmask import cli
+
+        # Only the caller's FM_* and terminal variables, not the daemon's, apply
+        env = dict.fromkeys(forwarded_env(os.environ))
+        env.update(forwarded_env(request.get('env', {})))
+        if request.get('columns'):
+            env['COLUMNS'] = str(request['columns'])
+        if request.get('tty') and 'NO_COLOR' not in env:
+            env['FORCE_COLOR'] = '1'
+
+        out, err = io.StringIO(), io.StringIO()
+        with self.lock, environment(env, request.get('cwd')), redirect_stdout(out), redirect_stderr(err):
+            try:
+                cli.cli.main(args=list(request['argv']), prog_name='fastmask', color=bool(request.get('tty')))
+                code = 0
+            except SystemExit as e:
+                code = exit_code(e)
+            except Exception as e:
+                print(f'{type(e).__name__}: {e}', file=sys.stderr)
+                code = 1
+
+        return {'exit': code, 'stdout': out.getvalue(), 'stderr': err.getvalue()}
+
+    def handle(self, conn: socket.socket) -> None:
+        with conn, conn.makefile('rb') as fh:
+            line = fh.readline()
+            if not line:
+                return
+            try:
+                response = self.run(json.loads(line))
+            except (ValueError, KeyError, TypeError) as e:
+                response = {'exit': 2, 'stdout': '', 'stderr': f'Bad request: {e}\n'}
+            conn.sendall(json.dumps(response).encode() + b'\n')
+
+    def bind(self) -> socket.socket:
+        """Listen on the socket path, readable by the current user only"""
+
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except OSError:
+                os.unlink(self.path)
+            else:
+                raise RuntimeError(f'fastmask serve is already running on {self.path}')
+            finally:
+                probe.close()
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o177)
+        try:
+            server.bind(self.path)
+        finally:
+            os.umask(umask)
+        server.listen()
+        return server
+
+    def serve_forever(self) -> None:
+        """Accept commands until interrupted, removing the socket on the way out"""
+
+        from fastmask import cli
+
+        server = self.bind()
+        cli.warm_clients[(self.client.username, self.client.token, self.client.session_url)] = self.client
+        thread = threading.Thread(target=self.refresher, name='fastmask-refresh', daemon=True)
+        thread.start()
+        try:
+            while True:
+                conn, _ = server.accept()
+                try:
+                    self.handle(conn)
+                except OSError:
+                    pass
+        finally:
+            self.stopped.set()
+            server.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
@@ -0,0 +1,90 @@
+from functools import partial
+from typing import Iterable, TextIO
+import csv
+import json
+import sys
+
+COLUMN_ORDER = [
+    'email',
+    'forDomain',
+    'description',
+    'state',
+    'lastMessageAt',
+    'url',
+    'id',
+    'createdAt',
+    'createdBy',
+]
+
+EXTENSIONS = {
+    '.csv': 'csv',
+    '.json': 'json',
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+}
+
+FORMATS = ['csv', 'json', 'ndjson']
+
+
+def write_csv(records: Iterable[dict], fh: TextIO, columns: list[str] = COLUMN_ORDER) -> None:
+    """Write records as CSV, one row at a time"""
+
+    writer = csv.DictWriter(fh, fieldnames=columns, extrasaction='ignore', lineterminator='\n')
+    writer.writeheader()
+    for x in records:
+        writer.writerow(x)
+
+def write_json(records: Iterable[dict], fh: TextIO, indent: int = 4) -> None:
+    """Write records as a pretty-printed JSON array without building it in memory"""
+
+    pad = ' ' * indent
+    fh.write('[')
+    first = True
+    for x in records:
+        fh.write('\n' if first else ',\n')
+        fh.write(pad + json.dumps(dict(x), indent=indent).replace('\n', '\n' + pad))
+        first = False
+    fh.write('\n]\n' if not first else ']\n')
+
+def write_ndjson(records: Iterable[dict], fh: TextIO) -> None:
+    """Write records as newline-delimited JSON, one compact object per line"""
+
+    for x in records:
+        fh.write(json.dumps(dict(x), separators=(',', ':')))
+        fh.write('\n')
+
+WRITERS = {
+    'csv': write_csv,
+    'json': write_json,
+    'ndjson': write_ndjson,
+}
+
+def format_for(path: str) -> str | None:
+    """Output format implied by a file extension, None if unsupported"""
+
+    for ext, fmt in EXTENSIONS.items():
+        if path.lower().endswith(ext):
+            return fmt
+    return None
+
+def export(records: Iterable[dict], fmt: str, out: str | None = None, columns: list[str] = COLUMN_ORDER) -> None:
+    """Stream records to the file out, or stdout, in fmt (csv, json or ndjson). columns sets the csv columns"""
+
+    writer = WRITERS[fmt] if fmt != 'csv' else partial(write_csv, columns=columns)
+
+    if out is None:
+        writer(records, sys.stdout)
+        return
+
+    with open(out, 'w', newline='') as fh:
+        writer(records, fh)
+
+def to_dataframe(records: Iterable[dict]):
+    """Return records as a pandas DataFrame in export column order. Requires the 'pandas' extra"""
+
+    try:
+        import pandas as pd
+    except ImportError:
+        raise ImportError('to_dataframe requires pandas: pip install fastmask[pandas]') from None
+
+    return pd.DataFrame(list(records), columns=COLUMN_ORDER)
@@ -0,0 +1,144 @@
+"""
+Bulk creation of Masked Emails from csv, ndjson or json files
+
+Input uses the columns written by `fastmask list -o`: description, url,
+forDomain and state are sent on create (plus emailPrefix, if present), and
+other columns such as email or id are ignored. Row n is created with the
+creation id row-n.
+
+Results are appended to an ndjson file, one line per row, after each
+request completes::
+
+    {"row": 3, "id": "masked-123", "email": "alias@fastmail.com", "description": "shop"}
+    {"row": 4, "error": {"type": "invalidProperties", "description": "..."}}
+
+Rows with an id in the results file are skipped when the import is run
+again, so an interrupted import resumes where it stopped. Only a request
+that was sent but whose response never arrived can create duplicates.
+"""
+
+from fastmask.export import format_for
+
+from typing import TYPE_CHECKING, Iterator, TextIO
+import csv
+import json
+import os
+
+if TYPE_CHECKING:
+    from fastmask.masked_email import MaskedMailClient
+
+IMPORT_FIELDS = ('description', 'url', 'forDomain', 'state', 'emailPrefix')
+
+# CSV has no null, so an empty cell means unset for these
+NULLABLE_FIELDS = ('url', 'state', 'emailPrefix')
+
+
+def creation_id(row: int) -> str:
+    return f'row-{row}'
+
+def row_properties(record: dict) -> dict:
+    """MaskedEmail/set create properties for an input record"""
+
+    props = {}
+    for k in IMPORT_FIELDS:
+        v = record.get(k)
+        if v is None or (v == '' and k in NULLABLE_FIELDS):
+            continue
+        props[k] = v
+    return props
+
+def read_records(fh: TextIO, fmt: str) -> Iterator[dict]:
+    """Stream records from a csv or ndjson file. json arrays are loaded whole"""
+
+    if fmt == 'csv':
+        yield from csv.DictReader(fh)
+    elif fmt == 'ndjson':
+        for line in fh:
+            if line.strip():
+                yield json.loads(line)
+    elif fmt == 'json':
+        yield from json.load(fh)
+    else:
+        raise ValueError(f'Unsupported import format {fmt!r}')
+
+def read_rows(fh: TextIO, fmt: str, skip: set[int] = frozenset()) -> Iterator[tuple[int, dict]]:
+    """Yield (row number, create properties) for each record, numbered from 1, leaving out rows in skip"""
+
+    for n, record in enumerate(read_records(fh, fmt), 1):
+        if n not in skip:
+            yield n, row_properties(record)
+
+def results_path(source: str, results: str | None = None) -> str:
+    return results or f'{source}.results.ndjson'
+
+def load_checkpoint(path: str) -> set[int]:
+    """Rows already created according to a results file. A line cut short by an interruption is ignored"""
+
+    done = set()
+    if not os.path.exists(path):
+        return done
+
+    with open(path) as fh:
+        for line in fh:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            if 'id' in result:
+                done.add(result['row'])
+    return done
+
+def import_masked_emails(client: 'MaskedMailClient', source: str, results: str | None = None, fmt: str | None = None, batch_size: int | None = None) -> Iterator[dict]:
+    """
+    Create a Masked Email for each row of source, appending a line per row to results
+
+    source: csv, ndjson or json file, with the columns of `fastmask list -o`
+    results [optional]: ndjson results file, defaults to source + '.results.ndjson'. Rows it already records are skipped
+    fmt [optional]: csv, ndjson or json. Defaults to the source file extension
+    batch_size [optional]: Rows per request, defaults to the most the session limits allow
+
+    Yields a summary after each request: rows created and failed in it, and
+    the running totals, including rows skipped as already imported.
+    """
+
+    fmt = fmt or format_for(source)
+    if fmt is None:
+        raise ValueError('Import is supported for csv, json or ndjson files')
+    results = results_path(source, results)
+
+    done = load_checkpoint(results)
+    totals = {'created': 0, 'failed': 0, 'skipped': len(done)}
+
+    # Properties of rows sent but not yet answered, to echo descriptions into the results
+    pending = {}
+
+    def rows(src):
+        for n, props in read_rows(src, fmt, done):
+            pending[n] = props
+            yield creation_id(n), props
+
+    with open(source, newline='') as src, open(results, 'a+') as out:
+        end = out.seek(0, os.SEEK_END)
+        if end > 0:
+            out.seek(end - 1)
+            if out.read(1) != '\n':
+                out.write('\n')
+
+        for response in client.new_stream(rows(src), batch_size=batch_size):
+            lines = []
+            for key, created in response['created'].items():
+                n = int(key[len('row-'):])
+                lines.append({'row': n, 'id': created.get('id'), 'email': created.get('email'), 'description': pending.pop(n, {}).get('description', '')})
+            for key, error in response['notCreated'].items():
+                n = int(key[len('row-'):])
+                pending.pop(n, None)
+                lines.append({'row': n, 'error': error})
+
+            lines.sort(key=lambda x: x['row'])
+            out.writelines(json.dumps(x) + '\n' for x in lines)
+            out.flush()
+            os.fsync(out.fileno())
+
+            totals['created'] += len(response['created'])
+            totals['failed'] += len(response['notCreated'])
+            yield {'created': len(response['created']), 'failed': len(response['notCreated']), 'totals': dict(totals)}
@@ -0,0 +1,75 @@
+from fastmask.cache import read_json, write_json
+
+from pathlib import Path
+import re
+
+# MaskedEmail properties an index is built from
+PROPERTIES = ('id', 'email', 'description')
+
+# Bumped when the saved format changes, so older files are rebuilt rather than misread
+FORMAT_VERSION = 1
+
+EMAIL_PATTERN = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
+
+
+class IdIndex:
+    """
+    Lookup from email address, lowercased description and numeric id to
+    Masked Email ids, tagged with the JMAP state it was built at
+    """
+
+    def __init__(self, state: str | None, by_email: dict[str, str], by_description: dict[str, list[str]], ids: set[str]):
+        self.state = state
+        self.by_email = by_email
+        self.by_description = by_description
+        self.ids = ids
+
+    @classmethod
+    def build(cls, masked_emails: list[dict], state: str | None) -> 'IdIndex':
+        """Build an index from a full list of Masked Emails fetched at state"""
+
+        by_email, by_description, ids = {}, {}, set()
+        for x in masked_emails:
+            ids.add(x['id'])
+            by_email[x['email']] = x['id']
+            by_description.setdefault((x['description'] or '').lower(), []).append(x['id'])
+        return cls(state, by_email, by_description, ids)
+
+    @classmethod
+    def load(cls, path: Path) -> 'IdIndex | None':
+        """The index saved at path, or None if it is missing, unreadable or in another format"""
+
+        data = read_json(path)
+        if not isinstance(data, dict) or data.get('version') != FORMAT_VERSION:
+            return None
+        try:
+            return cls(data.get('state'), data['email'], data['description'], set(data['ids']))
+        except (KeyError, TypeError):
+            return None
+
+    def save(self, path: Path) -> None:
+        try:
+            write_json(path, {
+                'version': FORMAT_VERSION,
+                'state': self.state,
+                'email': self.by_email,
+                'description': self.by_description,
+                'ids': list(self.ids),
+            })
+        except OSError:
+            pass
+
+    def resolve(self, key: str) -> list[str]:
+        """
+        Return ids matching key, which may be a Masked Email id (with or
+        without the 'masked-' prefix), an email address, or a description
+        (case-insensitive). More than one id means the key is ambiguous.
+        """
+
+        if key.startswith('masked-') and key[7:].isnumeric():
+            return [key] if key in self.ids else []
+        if key.isnumeric():
+            return [f'masked-{key}'] if f'masked-{key}' in self.ids else []
+        if re.match(EMAIL_PATTERN, key):
+            return [self.by_email[key]] if key in self.by_email else []
+        return list(self.by_description.get(key.lower(), []))
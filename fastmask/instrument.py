@@ -0,0 +1,214 @@
+"""
+Instrumentation events for Masked Email clients
+
+Clients emit an event to each registered hook for every HTTP request and
+around each processing stage. Events are plain dicts so they can be
+forwarded to any metrics or tracing system as they are::
+
+    client = MaskedMailClient(username, token, hooks=[print])
+    client.instrument.add_hook(lambda event: statsd.timing(event['name'], event['duration']))
+
+Every event has 'type', 'name', 'start' (epoch seconds) and 'duration'
+(seconds). Call events ('type': 'call') are emitted once per HTTP request,
+after any retries, and add:
+
+- methods: JMAP method names in the request, or ['session'] for the session GET
+- status: HTTP status, None if the request failed without a response
+- request_bytes, response_bytes: body sizes, as sent when known
+- retries: retries taken by the RequestScheduler
+- error: repr of the exception raised, if any
+
+Span events ('type': 'span') time a stage such as decode, load, filter,
+sort, search, fetch or render, and may carry counts such as records.
+
+With no hooks registered, instrumentation costs one attribute check per
+stage and filtering and sorting keep their single streaming pass.
+"""
+
+from fastmask.query import apply_query
+
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, TextIO
+import sys
+import threading
+import time
+
+
+class Instrumentation:
+    """Registry of hooks called with each instrumentation event"""
+
+    def __init__(self, hooks: Iterable[Callable[[dict], None]] | None = None):
+        self.hooks = list(hooks or [])
+
+    @property
+    def enabled(self) -> bool:
+        return len(self.hooks) > 0
+
+    def add_hook(self, hook: Callable[[dict], None]) -> Callable[[dict], None]:
+        """Register hook to be called with every event. Returns hook, so it can be used as a decorator"""
+
+        self.hooks.append(hook)
+        return hook
+
+    def remove_hook(self, hook: Callable[[dict], None]) -> None:
+        self.hooks.remove(hook)
+
+    def emit(self, event: dict) -> None:
+        for hook in self.hooks:
+            hook(event)
+
+    @contextmanager
+    def span(self, name: str, **attrs) -> Iterator[dict]:
+        """
+        Time the enclosed block as a span event named name
+
+        Yields the event's attribute dict, so counts known only at the end
+        can be added to it.
+        """
+
+        if not self.hooks:
+            yield attrs
+            return
+
+        start, t0 = time.time(), time.perf_counter()
+        try:
+            yield attrs
+        finally:
+            self.emit({'type': 'span', 'name': name, 'start': start, 'duration': time.perf_counter() - t0, **attrs})
+
+    @contextmanager
+    def call(self, methods: list[str], request_bytes: int = 0) -> Iterator[dict]:
+        """
+        Time the enclosed HTTP request as a call event
+
+        Fill in the response with observe_response(event, response).
+        """
+
+        if not self.hooks:
+            yield {}
+            return
+
+        event = {
+            'type': 'call',
+            'name': ', '.join(dict.fromkeys(methods)),
+            'methods': list(methods),
+            'status': None,
+            'request_bytes': request_bytes,
+            'response_bytes': 0,
+            'retries': 0,
+            'error': None,
+        }
+        start, t0 = time.time(), time.perf_counter()
+        try:
+            yield event
+        except Exception as e:
+            event['error'] = repr(e)
+            raise
+        finally:
+            event['start'], event['duration'] = start, time.perf_counter() - t0
+            self.emit(event)
+
+
+def observe_response(event: dict, response, streamed: bool = False) -> None:
+    """
+    Record the status, size and retry count of a requests or httpx response on a call event
+
+    The size is as sent, before decompression, when the response has a
+    Content-Length. Otherwise it is the decoded body, or 0 for a streamed
+    response, whose body has not been read yet.
+    """
+
+    if event:
+        event['status'] = response.status_code
+        length = response.headers.get('Content-Length')
+        event['response_bytes'] = int(length) if length is not None else 0 if streamed else len(response.content)
+        event['retries'] = getattr(response, 'fastmask_retries', 0)
+
+
+def timed_query(instrument: Instrumentation, masked_emails: list, **query) -> list:
+    """
+    apply_query, split into filter and sort spans when instrumentation is enabled
+
+    Timing the stages separately means materializing the matches between
+    them, so the single streaming pass is kept when nobody is listening.
+    """
+
+    if not instrument.enabled:
+        return apply_query(masked_emails, **query)
+
+    sorting = {k: query.pop(k) for k in ('sort_by', 'sort_order', 'limit') if k in query}
+    with instrument.span('filter', records=len(masked_emails)) as span:
+        matches = apply_query(masked_emails, sort_by=None, **query)
+        span['matches'] = len(matches)
+    with instrument.span('sort', records=len(matches)):
+        return apply_query(matches, **sorting)
+
+
+def timed_render(instrument: Instrumentation, records: Iterable, render: Callable[[Iterable], None]) -> None:
+    """
+    render(records) for records read lazily, timed as separate fetch and render spans
+
+    Pulling a record from an iterator can mean reading and decoding the
+    response, filtering and sorting, so time spent in next() is reported
+    as fetch, and only the rest as render.
+    """
+
+    if not instrument.hooks:
+        render(records)
+        return
+
+    fetch = {'duration': 0.0, 'records': 0}
+
+    def pulled():
+        it = iter(records)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                x = next(it)
+            except StopIteration:
+                return
+            finally:
+                fetch['duration'] += time.perf_counter() - t0
+            fetch['records'] += 1
+            yield x
+
+    start, t0 = time.time(), time.perf_counter()
+    try:
+        render(pulled())
+    finally:
+        duration = time.perf_counter() - t0
+        instrument.emit({'type': 'span', 'name': 'fetch', 'start': start, 'duration': fetch['duration'], 'records': fetch['records']})
+        instrument.emit({'type': 'span', 'name': 'render', 'start': start, 'duration': duration - fetch['duration']})
+
+
+class Profiler:
+    """
+    Hook collecting events into a per-stage timing breakdown, as printed
+    by fastmask --profile
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, event: dict) -> None:
+        name = event['name'] if event['type'] == 'span' else f'{event["name"]} ({event["status"] or "failed"})'
+        with self.lock:
+            stage = self.stages.setdefault(name, {'type': event['type'], 'count': 0, 'duration': 0.0, 'bytes': 0, 'retries': 0})
+            stage['count'] += 1
+            stage['duration'] += event['duration']
+            stage['bytes'] += event.get('request_bytes', 0) + event.get('response_bytes', 0)
+            stage['retries'] += event.get('retries', 0)
+
+    def report(self, file: TextIO | None = None) -> None:
+        file = file or sys.stderr
+
+        total = time.perf_counter() - self.start
+        width = max([len(name) for name in self.stages] + [20])
+        print(f'\n{"stage":<{width}} {"count":>6} {"ms":>10} {"KiB":>10} {"retries":>8}', file=file)
+        for name, s in sorted(self.stages.items(), key=lambda kv: -kv[1]['duration']):
+            size = f'{s["bytes"] / 1024:.1f}' if s['type'] == 'call' else ''
+            retries = str(s['retries']) if s['type'] == 'call' else ''
+            print(f'{name:<{width}} {s["count"]:>6} {s["duration"] * 1000:>10.1f} {size:>10} {retries:>8}', file=file)
+        print(f'{"total":<{width}} {"":>6} {total * 1000:>10.1f}', file=file)
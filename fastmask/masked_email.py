@@ -1,13 +1,166 @@
-from typing import Callable, Any
-import json
+from fastmask.cache import SessionCache, SESSION_TTL, cache_dir, account_key
+from fastmask.codec import Codec, get_codec, accept_encoding
+from fastmask.index import IdIndex, PROPERTIES as INDEX_PROPERTIES
+from fastmask.instrument import Instrumentation, observe_response, timed_query
+from fastmask.mirror import Mirror
+from fastmask.prune import Plan
+from fastmask.record import MaskedEmail
+from fastmask.scheduler import RequestScheduler, is_idempotent
+from fastmask.query import apply_query, matching, search_filter, recent_filter
+from fastmask.where import compile_where
+from fastmask.search_index import SearchIndex, DEFAULT_FIELDS as DEFAULT_SEARCH_FIELDS
+from fastmask.stream import GetStream
+
+from collections import Counter
+from typing import Callable, Iterable, Iterator
+from itertools import islice
+import threading
+import time
 import requests
-from datetime import datetime, timezone, timedelta
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from datetime import timedelta
 
 
 HOSTNAME = 'api.fastmail.com'
 JMAP_CORE = 'urn:ietf:params:jmap:core'
 MASKED_EMAIL_SCOPE = 'https://www.fastmail.com/dev/maskedemail'
 
+DEFAULT_MAX_OBJECTS_IN_SET = 500
+DEFAULT_MAX_CALLS_IN_REQUEST = 16
+DEFAULT_MAX_OBJECTS_IN_GET = 500
+DEFAULT_MAX_CONCURRENT_REQUESTS = 4
+
+# Bytes read from the socket at a time when streaming a response
+STREAM_CHUNK_SIZE = 1 << 16
+
+
+class ConnectFailed(requests.exceptions.ConnectionError):
+    """The connection could not be opened (refused, unresolvable or timed out), so nothing was sent"""
+
+
+def connecting(request: Callable[[], requests.Response]) -> Callable[[], requests.Response]:
+    """request, raising ConnectFailed instead of ConnectionError when it failed before being sent"""
+
+    def send() -> requests.Response:
+        try:
+            return request()
+        except requests.exceptions.ConnectionError as e:
+            reason = getattr(e.args[0] if e.args else None, 'reason', None)
+            if isinstance(e, requests.exceptions.ConnectTimeout) or isinstance(reason, NewConnectionError):
+                raise ConnectFailed(*e.args, request=e.request, response=e.response) from e
+            raise
+    return send
+
+_http_session = None
+
+def http_session() -> requests.Session:
+    """Return the process-wide keep-alive HTTP session shared by clients"""
+
+    global _http_session
+    if _http_session is None:
+        _http_session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        _http_session.mount('https://', adapter)
+        _http_session.mount('http://', adapter)
+    return _http_session
+
+def creation_entries(masked_emails: list[dict] | dict[str, dict]) -> dict[str, dict]:
+    """Key Masked Emails to create by creation id, defaulting state to enabled"""
+
+    if not isinstance(masked_emails, dict):
+        masked_emails = {str(i): x for i, x in enumerate(masked_emails)}
+    return {k: {'state': 'enabled', **v} for k, v in masked_emails.items()}
+
+def set_result_keys(operation: str) -> tuple[str, str]:
+    return ('created', 'notCreated') if operation == 'create' else ('updated', 'notUpdated')
+
+def set_batches(entries: dict, limits: dict) -> list[list[dict]]:
+    """
+    Split MaskedEmail/set entries into requests of up to maxCallsInRequest
+    calls, each holding up to maxObjectsInSet entries
+    """
+
+    per_call = limits.get('maxObjectsInSet', DEFAULT_MAX_OBJECTS_IN_SET)
+    per_request = limits.get('maxCallsInRequest', DEFAULT_MAX_CALLS_IN_REQUEST)
+
+    items = list(entries.items())
+    chunks = [dict(items[i:i+per_call]) for i in range(0, len(items), per_call)]
+    return [chunks[i:i+per_request] for i in range(0, len(chunks), per_request)]
+
+def get_batches(ids: list[str] | None, limits: dict) -> list[list[list[str] | None]]:
+    """
+    Split ids for MaskedEmail/get into requests of up to maxCallsInRequest
+    calls, each for up to maxObjectsInGet ids. None (every id) is one call
+    """
+
+    if ids is None:
+        return [[None]]
+
+    per_call = limits.get('maxObjectsInGet', DEFAULT_MAX_OBJECTS_IN_GET)
+    per_request = limits.get('maxCallsInRequest', DEFAULT_MAX_CALLS_IN_REQUEST)
+
+    chunks = [ids[i:i+per_call] for i in range(0, len(ids), per_call)] or [[]]
+    return [chunks[i:i+per_request] for i in range(0, len(chunks), per_request)]
+
+def get_method_calls(batch: list[list[str] | None], account_id: str, properties: list[str] | None = None) -> list[list]:
+    projection = {'properties': list(properties)} if properties is not None else {}
+    return [
+        [
+            'MaskedEmail/get',
+            {
+                'accountId': account_id,
+                'ids': chunk,
+                **projection,
+            },
+            str(n)
+        ]
+        for n, chunk in enumerate(batch)
+    ]
+
+def merge_get_responses(responses: list[list]) -> dict:
+    """Combine the method responses of each get request into one MaskedEmail/get result, keeping request and call order"""
+
+    result = {'state': None, 'list': [], 'notFound': []}
+    for method_responses in responses:
+        for (_, args, _) in method_responses:
+            result['state'] = result['state'] or args['state']
+            result['list'].extend(args['list'])
+            result['notFound'].extend(args.get('notFound') or [])
+    return result
+
+def set_method_calls(operation: str, batch: list[dict], account_id: str) -> list[list]:
+    return [
+        [
+            'MaskedEmail/set',
+            {
+                'accountId': account_id,
+                operation: chunk,
+            },
+            str(n)
+        ]
+        for n, chunk in enumerate(batch)
+    ]
+
+def merge_set_responses(result: dict, operation: str, batch: list[dict], method_responses: list) -> None:
+    """Merge MaskedEmail/set responses for batch into result, failing every entry of a call that errored"""
+
+    done, not_done = set_result_keys(operation)
+    for (name, args, call_id) in method_responses:
+        if name == 'error':
+            result[not_done].update((k, args) for k in batch[int(call_id)])
+        else:
+            result[done].update(args.get(done) or {})
+            result[not_done].update(args.get(not_done) or {})
+
+
+class ChangesUnavailable(ValueError):
+    """The server cannot calculate changes from a state, e.g. because it is too old"""
+
+
+class StateMismatch(ValueError):
+    """A MaskedEmail/set guarded by ifInState was refused because the account has changed"""
+
 
 class MaskedMailClient:
     """
@@ -18,8 +171,23 @@ class MaskedMailClient:
     https://jmap.io/
     """
 
-    def __init__(self, username: str, token: str):
-        """Initialize using a username and Fastmail API token"""
+    def __init__(self, username: str, token: str, session_url: str | None = None, cache_session: bool = True, session_ttl: float = SESSION_TTL, http: requests.Session | None = None, mirror: bool = False, scheduler: RequestScheduler | None = None, hooks: list[Callable] | None = None, snapshot_ttl: float = 0, codec: str | Codec | None = None, cache_index: bool = True):
+        """Initialize using a username and Fastmail API token
+
+        session_url [optional]: JMAP session endpoint, defaults to Fastmail's
+        cache_session [optional]: Cache the JMAP session resource on disk so warm clients skip the session GET
+        session_ttl [optional]: Seconds before a cached session is refetched
+        http [optional]: requests.Session to send calls through. Defaults to a pooled session shared by all clients
+        mirror [optional]: Keep a local SQLite mirror of the account, refreshed with MaskedEmail/changes, and serve reads from it
+        scheduler [optional]: RequestScheduler pacing and retrying calls. Share one between clients to share its rate limit
+        hooks [optional]: Callables receiving an event dict for every HTTP request and processing stage (see fastmask.instrument)
+        snapshot_ttl [optional]: Seconds a full list stays in memory and answers get, state and the indexes without
+        a request. For long-running processes that call refresh_snapshot themselves; writes through the client expire it
+        codec [optional]: JSON codec for requests and responses, 'orjson' or 'json' (see fastmask.codec). Defaults to
+        orjson when installed
+        cache_index [optional]: Persist the id index in the cache dir so later clients reuse it. Otherwise it is kept
+        in memory only
+        """
 
         if username is not None and token is not None:
             if len(username) == 0 and len(token) == 0:
@@ -30,39 +198,91 @@ class MaskedMailClient:
             exit()
 
         self.hostname = HOSTNAME
+        self.session_url = session_url or f'https://{self.hostname}/.well-known/jmap'
         self.username = username
         self.token = token
+        self.http = http if http is not None else http_session()
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler()
+        self.instrument = Instrumentation(hooks)
+        self.codec = codec if isinstance(codec, Codec) else get_codec(codec)
+        self.accept_encoding = accept_encoding()
+        self.session_cache = SessionCache(username, token, ttl=session_ttl) if cache_session else None
+        self._session_from_cache = False
+        self._session_lock = threading.Lock()
+        self.session = None
         self.session = self.get_session()
         self.api_url = self.session['apiUrl']
         self.account_id = self.get_account_id()
+        self.mirror = Mirror.for_account(username, token, loads=self.codec.loads) if mirror else None
+        self.index_path = cache_dir() / f'index-{account_key(username, token)}.json' if cache_index else None
+        self._index = None
+        self._snapshot = None
+        self._snapshot_at = None
+        self.snapshot_ttl = snapshot_ttl
+        self._search_indexes = {}
+
+    @property
+    def headers(self) -> dict:
+        return {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.token}",
+            "Accept-Encoding": self.accept_encoding,
+        }
 
     def get_session(self) -> dict:
         """Return the JMAP Session Resource as a Python dict
 
+        Served from the on-disk session cache when a fresh copy is available.
+
         Borrowed from Fastmail's tiny_jmap_library.py: https://github.com/fastmail/JMAP-Samples
         """
 
-        try:
-            if self.session:
-                return self.session
-        except:
-            pass
-
-        r = requests.get(
-            "https://" + self.hostname + "/.well-known/jmap",
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.token}",
-            },
-        )
+        if self.session:
+            return self.session
+        return self.__load_session()
+
+    def __load_session(self) -> dict:
+        if self.session_cache is not None:
+            cached = self.session_cache.load()
+            if cached is not None:
+                self._session_from_cache = True
+                return cached
+
+        r = self.__send(lambda: self.http.get(self.session_url, headers=self.headers), idempotent=True, methods=['session'])
         r.raise_for_status()
-        return r.json()
+        with self.instrument.span('decode', bytes=len(r.content)):
+            session = self.codec.loads(r.content)
+        self._session_from_cache = False
+
+        if self.session_cache is not None:
+            self.session_cache.save(session)
+
+        return session
+
+    def refresh_session(self, stale: dict | None = None) -> dict:
+        """
+        Discard the cached session and fetch a new one from the server
+
+        stale [optional]: The session the caller found out of date. If another thread has
+        replaced it in the meantime, its replacement is returned without fetching again
+        """
+
+        with self._session_lock:
+            if stale is not None and self.session is not stale:
+                return self.session
+            if self.session_cache is not None:
+                self.session_cache.clear()
+            session = self.__load_session()
+            self.api_url = session['apiUrl']
+            self.account_id = session['primaryAccounts'][JMAP_CORE]
+            self.session = session
+            return session
 
     def get_api_url(self) -> str:
         """Get API URL from session"""
 
         if not self.session:
-            self.get_session()
+            self.session = self.get_session()
         return self.session['apiUrl']
 
     def get_account_id(self) -> str:
@@ -71,11 +291,8 @@ class MaskedMailClient:
 
         Borrowed from Fastmail's tiny_jmap_library.py: https://github.com/fastmail/JMAP-Samples
         """
-        try:
-            if self.account_id:
-                return self.account_id
-        except:
-            pass
+        if getattr(self, 'account_id', None):
+            return self.account_id
 
         session = self.get_session()
 
@@ -86,64 +303,329 @@ class MaskedMailClient:
         Make a JMAP POST request to the API, returning the reponse as a
         Python data structure.
 
+        A 401 from a cached session, or a sessionState that no longer matches
+        the session resource, causes the session to be refetched.
+
         Borrowed from Fastmail's tiny_jmap_library.py https://github.com/fastmail/JMAP-Samples
         """
-        res = requests.post(
-            self.api_url,
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.token}",
-            },
-            data=json.dumps(call),
-        )
+        session = self.session
+        res = self.__post(call)
+        with self.instrument.span('decode', bytes=len(res.content)):
+            response = self.codec.loads(res.content)
+
+        self.__check_session_state(response.get('sessionState'), session)
+        return response
+
+    def __post(self, call: dict, stream: bool = False) -> requests.Response:
+        """POST a JMAP request, refetching the session and retrying once on a 401 from a cached session"""
+
+        data = self.codec.dumps(call)
+        idempotent = is_idempotent(call)
+        methods = [name for name, _, _ in call['methodCalls']]
+        if any(name.endswith('/set') for name in methods):
+            self._snapshot_at = None
+
+        session = self.session
+        res = self.__send(lambda: self.http.post(self.api_url, headers=self.headers, data=data, stream=stream), idempotent, methods, len(data), stream)
+
+        if res.status_code == 401 and self._session_from_cache:
+            res.close()
+            self.refresh_session(session)
+            res = self.__send(lambda: self.http.post(self.api_url, headers=self.headers, data=data, stream=stream), idempotent, methods, len(data), stream)
+
         res.raise_for_status()
-        return res.json()
+        return res
 
-    def get(self, ids: list[str] | None = None, filters: Callable | None = None, sort_by: str = 'createdAt', sort_order: str = 'asc', limit: int | None = None) -> list[dict]:
+    def __check_session_state(self, session_state: str | None, session: dict) -> None:
+        """Refetch session if a response's sessionState shows it has changed, unless another thread already has"""
+
+        if session_state not in (None, session.get('state')):
+            self.refresh_session(session)
+
+    def __send(self, request: Callable, idempotent: bool, methods: list[str], request_bytes: int = 0, stream: bool = False) -> requests.Response:
+        """Send a request through the scheduler, retrying transient failures, and emit a call event"""
+
+        with self.instrument.call(methods, request_bytes) as event:
+            response = self.scheduler.send(
+                connecting(request),
+                idempotent=idempotent,
+                safe_errors=(ConnectFailed,),
+                errors=(requests.exceptions.ConnectionError, requests.exceptions.Timeout),
+            )
+            observe_response(event, response, streamed=stream)
+        return response
+
+    def __stream_get(self, properties: list[str] | None = None) -> GetStream:
+        """
+        Request every Masked Email, returning a GetStream that decodes them as the body arrives
+
+        The connection goes back to the pool once the stream is exhausted, and is closed if
+        the stream is abandoned part way.
+        """
+
+        session = self.session
+        res = self.__post({
+            'using': [JMAP_CORE, MASKED_EMAIL_SCOPE],
+            'methodCalls': get_method_calls([None], self.account_id, properties),
+        }, stream=True)
+
+        def chunks():
+            with res:
+                yield from res.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+            self.__check_session_state(stream.response.get('sessionState'), session)
+
+        stream = GetStream(chunks())
+        return stream
+
+    def get(self, ids: list[str] | None = None, filters: Callable | None = None, sort_by: str = 'createdAt', sort_order: str = 'asc', limit: int | None = None, where: str | None = None, properties: list[str] | None = None) -> list[MaskedEmail]:
         """Get Masked Emails associated with account.
 
-        ids [optional]: Return Masked Emails matching IDs
+        ids [optional]: Return Masked Emails matching IDs. Long lists are fetched in maxObjectsInGet
+        chunks, several requests at once, and returned in order
         filters [optional]: Optionally filter list results by field (see https://www.fastmail.com/developer/maskedemail/#object for options)
         sort_by [optional]: Field to sort results by
         sort_order [optional]: Whether to sort ascending or descending. Accepted values: 'asc' or 'desc'
         limit: Number of results to return
+        properties [optional]: Only fetch these properties from the server (id is always included).
+        Records from the mirror, or from a list still in memory, are complete
         """
 
-        response = self.__jmap_call({
-            'using': [JMAP_CORE, MASKED_EMAIL_SCOPE],
-            'methodCalls': [
-                [
-                    'MaskedEmail/get',
-                    {
-                        'accountId': self.account_id,
-                        'ids': ids,
-                    },
-                    'a'
-                ]
-            ]
-        })
+        if ids is None and self.snapshot_fresh():
+            masked_email_list = self._snapshot[1]
+        else:
+            state, masked_email_list = self.__load(ids, properties)
+            if ids is None and properties is None:
+                self._snapshot = (state, masked_email_list)
+                self._snapshot_at = time.monotonic()
+
+        return timed_query(self.instrument, masked_email_list, filters=filters, sort_by=sort_by, sort_order=sort_order, limit=limit, where=where)
+
+    def __load(self, ids: list[str] | None = None, properties: list[str] | None = None) -> tuple[str, list[MaskedEmail]]:
+        """Return the state and Masked Emails from the mirror, or from the server without one"""
 
-        masked_email_list = response['methodResponses'][0][1]['list']
+        state, masked_email_list = self.__records(ids, properties)
+        with self.instrument.span('load', records=len(masked_email_list)):
+            return state, [MaskedEmail.from_dict(x) for x in masked_email_list]
 
-        if filters is not None:
-            masked_email_list = list(filter(filters, masked_email_list))
+    def __records(self, ids: list[str] | None = None, properties: list[str] | None = None) -> tuple[str, list[dict]]:
+        """Return the state and Masked Emails as JMAP dicts, from the mirror or from the server without one"""
 
-        if sort_by is not None:
-            if sort_order == 'desc':
-                masked_email_list = sorted(masked_email_list, key=lambda x: (x[sort_by] is not None, x[sort_by]), reverse=True)
+        if self.mirror is not None:
+            state = self.sync()
+            with self.instrument.span('mirror'):
+                return state, self.mirror.records(ids)
+
+        result = self.__fetch(ids, properties)
+        return result['state'], result['list']
+
+    def iter(self, ids: list[str] | None = None, filters: Callable | None = None, sort_by: str | None = None, sort_order: str = 'asc', limit: int | None = None, where: str | None = None, properties: list[str] | None = None) -> Iterator[MaskedEmail]:
+        """
+        Yield Masked Emails one at a time as they are read, taking the arguments of get
+
+        Records stream from the mirror, sorted by SQLite, or from the server
+        response as it is decoded, and are filtered on the way, so memory use
+        does not grow with the account. Without a mirror, a sort goes through
+        a temporary SQLite file, or with a limit, a heap of the best limit
+        records. Unlike get, it does not sort by default.
+        """
+
+        presorted, spill = False, None
+        if ids is None and self.snapshot_fresh():
+            masked_emails = self._snapshot[1]
+        elif ids is not None:
+            masked_emails = self.get(ids=ids, sort_by=None, properties=properties)
+        elif self.mirror is not None:
+            self.sync()
+            masked_emails = map(MaskedEmail.from_dict, self.mirror.stream(sort_by, sort_order))
+            presorted = True
+        elif sort_by is not None and limit is None:
+            stream = self.__stream_get(properties)
+            spill = Mirror.temporary(loads=self.codec.loads)
+            spill.replace(stream, lambda: stream.state)
+            masked_emails = map(MaskedEmail.from_dict, spill.stream(sort_by, sort_order))
+            presorted = True
+        else:
+            masked_emails = map(MaskedEmail.from_dict, self.__stream_get(properties))
+
+        try:
+            matches = matching(masked_emails, filters=filters, where=where)
+            if sort_by is None or presorted:
+                yield from (matches if limit is None else islice(matches, limit))
             else:
-                masked_email_list = sorted(masked_email_list, key=lambda x: (self.__empty_or_none(x[sort_by]), x[sort_by]))
+                yield from apply_query(matches, sort_by=sort_by, sort_order=sort_order, limit=limit)
+        finally:
+            if spill is not None:
+                spill.close()
+
+    def snapshot_fresh(self) -> bool:
+        """Whether the in-memory list is younger than snapshot_ttl and no write has been made since"""
 
-        if limit is not None:
-            return masked_email_list[:limit]
+        return self._snapshot_at is not None and time.monotonic() - self._snapshot_at < self.snapshot_ttl
 
-        return masked_email_list
+    def refresh_snapshot(self) -> str:
+        """Reload the in-memory list of every Masked Email, returning its state"""
+
+        state, masked_email_list = self.__load()
+        self._snapshot = (state, masked_email_list)
+        self._snapshot_at = time.monotonic()
+        return state
+
+    def __fetch(self, ids: list[str] | None = None, properties: list[str] | None = None) -> dict:
+        """
+        Fetch Masked Emails from the server, returning the merged MaskedEmail/get response
+
+        Requests beyond the first are sent in parallel, up to maxConcurrentRequests at once.
+        """
+
+        def send(batch):
+            return self.__jmap_call({
+                'using': [JMAP_CORE, MASKED_EMAIL_SCOPE],
+                'methodCalls': get_method_calls(batch, self.account_id, properties),
+            })['methodResponses']
+
+        batches = get_batches(ids, self.limits)
+        if len(batches) == 1:
+            return merge_get_responses([send(batches[0])])
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        workers = min(len(batches), self.limits.get('maxConcurrentRequests', DEFAULT_MAX_CONCURRENT_REQUESTS))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return merge_get_responses(list(pool.map(send, batches)))
+
+    def state(self) -> str:
+        """Return the current MaskedEmail state string without fetching any records"""
+
+        if self.snapshot_fresh():
+            return self._snapshot[0]
+        if self.mirror is not None:
+            return self.sync()
+        return self.__fetch([])['state']
+
+    def id_index(self) -> IdIndex:
+        """
+        Return an index of email, description and id to Masked Email id
+
+        The index is built from the last full list fetched and, with
+        cache_index, persisted in the cache dir. It is reused for as long as
+        the account's MaskedEmail state is unchanged, and rebuilt otherwise,
+        from a fetch of only the properties it needs.
+        """
 
-    @staticmethod
-    def __empty_or_none(val: Any) -> bool:
-        if val is None: return True
-        if len(val) == 0: return True
-        return False
+        state = self.state()
+
+        if self.index_path is not None and (self._index is None or self._index.state != state):
+            self._index = IdIndex.load(self.index_path)
+
+        if self._index is None or self._index.state != state:
+            if self._snapshot is not None and self._snapshot[0] == state:
+                state, masked_email_list = self._snapshot
+            else:
+                state, masked_email_list = self.__load(properties=INDEX_PROPERTIES)
+            with self.instrument.span('index', records=len(masked_email_list)):
+                self._index = IdIndex.build(masked_email_list, state)
+            if self.index_path is not None:
+                self._index.save(self.index_path)
+
+        return self._index
+
+    def resolve(self, key: str) -> list[str]:
+        """
+        Return the ids of Masked Emails matching key: an id (with or without
+        the 'masked-' prefix), an email address, or a case-insensitive
+        description. Several ids are returned when a description is shared.
+        """
+
+        return self.id_index().resolve(key)
+
+    def sync(self, full: bool = False) -> str:
+        """
+        Bring the local mirror up to date, returning the new state string
+
+        Only ids created, updated or destroyed since the mirrored state are
+        fetched. Falls back to a full fetch when the mirror is empty, when
+        full is set, or when the server cannot calculate changes.
+        """
+
+        if self.mirror is None:
+            raise ValueError('Client was created without a mirror')
+
+        state = None if full else self.mirror.state
+
+        if state is not None:
+            try:
+                for page in self.changes(state):
+                    if page['newState'] != page['oldState']:
+                        changed = page['created'] + page['updated']
+                        self.mirror.apply(changed, page['destroyed'], page['newState'])
+                        for index in self._search_indexes.values():
+                            if index.state == page['oldState']:
+                                index.update([MaskedEmail.from_dict(x) for x in changed], page['destroyed'], page['newState'])
+                    state = page['newState']
+                return state
+            except ChangesUnavailable:
+                pass
+
+        stream = self.__stream_get()
+        self.mirror.replace(stream, lambda: stream.state)
+        return stream.state
+
+    def changes(self, since_state: str) -> Iterator[dict]:
+        """
+        Yield what changed since since_state, a MaskedEmail/changes page at a time
+
+        Each page has oldState and newState, the created and updated Masked
+        Emails as dicts, fetched in the same request, and destroyed ids.
+
+        Raises ChangesUnavailable if the server cannot calculate changes from since_state
+        """
+
+        state = since_state
+        while True:
+            response = self.__jmap_call({
+                'using': [JMAP_CORE, MASKED_EMAIL_SCOPE],
+                'methodCalls': [
+                    [
+                        'MaskedEmail/changes',
+                        {
+                            'accountId': self.account_id,
+                            'sinceState': state,
+                        },
+                        'a'
+                    ],
+                    [
+                        'MaskedEmail/get',
+                        {
+                            'accountId': self.account_id,
+                            '#ids': {'resultOf': 'a', 'name': 'MaskedEmail/changes', 'path': '/created'},
+                        },
+                        'b'
+                    ],
+                    [
+                        'MaskedEmail/get',
+                        {
+                            'accountId': self.account_id,
+                            '#ids': {'resultOf': 'a', 'name': 'MaskedEmail/changes', 'path': '/updated'},
+                        },
+                        'c'
+                    ],
+                ]
+            })
+            (name, changes, _), created, updated = response['methodResponses']
+            if name == 'error':
+                raise ChangesUnavailable(changes.get('description') or changes.get('type'))
+
+            yield {
+                'oldState': state,
+                'newState': changes['newState'],
+                'created': created[1]['list'],
+                'updated': updated[1]['list'],
+                'destroyed': changes['destroyed'],
+            }
+            state = changes['newState']
+
+            if not changes['hasMoreChanges']:
+                return
 
     def new(self, url: str | None = None, domain: str = '', description: str = '', state: str = 'enabled'):
         'Created a new Masked Email, optionally setting url, forDomain, description'
@@ -190,32 +672,182 @@ class MaskedMailClient:
         })
         return response['methodResponses'][0]
 
-    def get_active(self) -> list[dict]:
+    @property
+    def limits(self) -> dict:
+        """Core capability limits advertised by the JMAP session"""
+
+        return self.session.get('capabilities', {}).get(JMAP_CORE, {})
+
+    def __set_many(self, operation: str, entries: dict) -> dict:
+        """
+        Send MaskedEmail/set create or update entries in as few requests as
+        maxObjectsInSet and maxCallsInRequest allow, merging per-id results
+        """
+
+        done, not_done = set_result_keys(operation)
+        result = {done: {}, not_done: {}}
+
+        for batch in set_batches(entries, self.limits):
+            response = self.__jmap_call({
+                'using': [JMAP_CORE, MASKED_EMAIL_SCOPE],
+                'methodCalls': set_method_calls(operation, batch, self.account_id)
+            })
+            merge_set_responses(result, operation, batch, response['methodResponses'])
+
+        return result
+
+    def update_many(self, changes: dict[str, dict]) -> dict:
+        """
+        Update many Masked Emails, batching into as few requests as the session limits allow
+
+        changes: Mapping of Masked Email id to the changes to apply to it
+
+        Returns a dict with 'updated' and 'notUpdated' mappings keyed by id
+        """
+
+        return self.__set_many('update', changes)
+
+    def update_in_state(self, changes: dict[str, dict], state: str) -> dict:
+        """
+        Update Masked Emails in a single MaskedEmail/set call, applied only if the account is still at state (ifInState)
+
+        changes: Mapping of Masked Email id to the changes to apply to it, at most maxObjectsInSet of them
+
+        Returns the call's result, with newState and the 'updated' and 'notUpdated' mappings keyed by id
+        Raises StateMismatch if the account has changed since state
+        """
+
+        response = self.__jmap_call({
+            'using': [JMAP_CORE, MASKED_EMAIL_SCOPE],
+            'methodCalls': [
+                [
+                    'MaskedEmail/set',
+                    {
+                        'accountId': self.account_id,
+                        'ifInState': state,
+                        'update': changes,
+                    },
+                    'a'
+                ]
+            ]
+        })
+        name, args, _ = response['methodResponses'][0]
+        if name == 'error':
+            if args.get('type') == 'stateMismatch':
+                raise StateMismatch(f'MaskedEmail state is no longer {state}')
+            raise ValueError(f'MaskedEmail/set failed: {args.get("description") or args.get("type")}')
+        return args
+
+    def plan_prune(self, rules: list[tuple[str, str | Callable]]) -> Plan:
+        """
+        Plan blocking and deleting Masked Emails by rules, in one read of the account (see fastmask.prune)
+
+        rules: (action, filter expression) pairs, where action is 'block' or 'delete'. The first rule
+        a Masked Email matches decides its action
+        """
+
+        state, masked_email_list = self.__load()
+        with self.instrument.span('plan', records=len(masked_email_list)):
+            return Plan(rules, state).scan(masked_email_list)
+
+    def prune(self, plan: Plan, max_replans: int = 10) -> dict:
+        """
+        Apply a plan from plan_prune, one MaskedEmail/set call of up to maxObjectsInSet changes per
+        request, each guarded by ifInState with the state the plan is at
+
+        When another client changed the account in between, only the Masked Emails changed since are
+        planned again (from MaskedEmail/changes, or a fresh read if the server cannot tell) before retrying.
+        Entries are removed from plan as they are sent.
+
+        max_replans [optional]: Give up with StateMismatch after this many conflicts
+
+        Returns a dict with 'updated' and 'notUpdated' mappings keyed by id, 'applied', the number of
+        Masked Emails updated per action, and 'replans', the number of conflicts
+        """
+
+        result = {'updated': {}, 'notUpdated': {}, 'applied': Counter(), 'replans': 0}
+        size = self.limits.get('maxObjectsInSet', DEFAULT_MAX_OBJECTS_IN_SET)
+
+        while len(plan) > 0:
+            batch = plan.batch(size)
+            try:
+                args = self.update_in_state(batch, plan.state)
+            except StateMismatch:
+                if result['replans'] == max_replans:
+                    raise
+                result['replans'] += 1
+                try:
+                    plan.replan(self.changes(plan.state))
+                except ChangesUnavailable:
+                    plan.entries.clear()
+                    plan.state, masked_email_list = self.__load()
+                    plan.scan(masked_email_list)
+                continue
+
+            updated = args.get('updated') or {}
+            result['applied'].update(plan.entries[k]['action'] for k in updated if k in plan.entries)
+            result['updated'].update(updated)
+            result['notUpdated'].update(args.get('notUpdated') or {})
+            plan.discard(batch)
+            plan.state = args['newState']
+
+        return result
+
+    def new_many(self, masked_emails: list[dict] | dict[str, dict]) -> dict:
+        """
+        Create many Masked Emails, batching into as few requests as the session limits allow
+
+        masked_emails: Masked Email properties (state, description, url, forDomain) for each address. A list is
+        assigned creation ids by position ('0', '1', ...); pass a dict to choose creation ids
+
+        Returns a dict with 'created' and 'notCreated' mappings keyed by creation id
+        """
+
+        return self.__set_many('create', creation_entries(masked_emails))
+
+    def new_stream(self, masked_emails: Iterable[tuple[str, dict]], batch_size: int | None = None) -> Iterator[dict]:
+        """
+        Create Masked Emails from a stream of (creation id, properties) pairs, one request at a time
+
+        batch_size [optional]: Masked Emails per request, defaults to maxObjectsInSet * maxCallsInRequest
+
+        Yields the 'created' and 'notCreated' mappings of each request as soon as it completes, so
+        arbitrarily long inputs are never held in memory and progress can be checkpointed
+        """
+
+        if batch_size is None:
+            batch_size = self.limits.get('maxObjectsInSet', DEFAULT_MAX_OBJECTS_IN_SET) * self.limits.get('maxCallsInRequest', DEFAULT_MAX_CALLS_IN_REQUEST)
+
+        masked_emails = iter(masked_emails)
+        while batch := dict(islice(masked_emails, batch_size)):
+            yield self.__set_many('create', creation_entries(batch))
+
+    def get_active(self) -> list[MaskedEmail]:
         """Get all active Masked Emails"""
 
         return self.get(filters=(
-            lambda x: x['state'] == 'enabled'
+            lambda x: x.state == 'enabled'
         ))
 
-    def get_disabled(self) -> list[dict]:
+    def get_disabled(self) -> list[MaskedEmail]:
         """Get all blocked Masked Emails"""
 
         return self.get(filters=(
-            lambda x: x['state'] == 'disabled'
+            lambda x: x.state == 'disabled'
         ))
 
-    def get_deleted(self) -> list[dict]:
+    def get_deleted(self) -> list[MaskedEmail]:
         """Get all deleted Masked Emails"""
 
         return self.get(filters=(
-            lambda x: x['state'] == 'deleted'
+            lambda x: x.state == 'deleted'
         ))
 
-    def get_unused(self) -> list[dict]:
+    def get_unused(self) -> list[MaskedEmail]:
         """Get all active Masked Emails that have not received messages"""
 
         return self.get(filters=(
-            lambda x: x['lastMessageAt'] is None and x['state'] == 'enabled'
+            lambda x: x.last_message_at is None and x.state == 'enabled'
         ))
 
     def enable(self, masked_id: str) -> dict:
@@ -252,27 +884,85 @@ class MaskedMailClient:
             }
         )
 
-    def search(self, query: str, fields: list[str] = ['email', 'description']) -> list[dict]:
+    def search(self, query: str, fields: list[str] = ['email', 'description'], limit: int | None = None, ranked: bool = False, where: str | None = None, properties: list[str] | None = None) -> list[MaskedEmail]:
         """
         Search for Masked Emails matching query text
 
         Defaults to searching email and description fields only.
+
+        limit [optional]: Number of results to return
+        ranked [optional]: Answer from a trigram search index, best matches first, instead of
+        scanning every record. The index is kept between calls and updated as records change
+        where [optional]: Filter expression results must also match (see fastmask.where)
+        properties [optional]: Only fetch these properties, which must include fields and those where reads.
+        Ranked searches answer from complete records
         """
 
-        query = query.lower()
-        return self.get(filters=(
-            lambda x: any(query in x[f].lower() for f in fields if x[f] is not None)
-        ))
+        if ranked:
+            if isinstance(where, str):
+                where = compile_where(where)
+            index = self.search_index(fields)
+            with self.instrument.span('search'):
+                return index.search(query, limit=limit, filters=where)
 
-    def get_recent(self, timeframe: timedelta = timedelta(days=3)) -> list[dict]:
-        """Get recently created Masked Emails (default is 3 days)"""
+        return self.get(filters=search_filter(query, fields), limit=limit, where=where, properties=properties)
 
-        t_format = "%Y-%m-%dT%H:%M:%SZ"
-        now = datetime.now(timezone.utc).replace(tzinfo=None)
+    def search_index(self, fields: list[str] = DEFAULT_SEARCH_FIELDS) -> SearchIndex:
+        """
+        Return a trigram search index over fields for the current state of the account
 
-        return self.get(
-            filters=(
-                lambda x: (now - datetime.strptime(x['createdAt'], t_format)) < timeframe
-            ),
-            sort_by='createdAt', sort_order='desc'
-        )
+        Indexes are built once per snapshot. With a mirror, they are updated
+        in place from MaskedEmail/changes rather than rebuilt.
+        """
+
+        key = tuple(fields)
+        state = self.state()
+        index = self._search_indexes.get(key)
+
+        if index is None or index.state != state:
+            if self._snapshot is None or self._snapshot[0] != state:
+                self.get(sort_by=None)
+            with self.instrument.span('index', records=len(self._snapshot[1])):
+                index = SearchIndex.build(self._snapshot[1], fields, self._snapshot[0])
+            self._search_indexes[key] = index
+
+        return index
+
+    def stats(self, top_n: int = 10, where: str | None = None) -> dict[str, list[tuple[str, int]]]:
+        """
+        Account-level aggregates: counts by state, unused addresses by age, top domains and
+        URLs, creations per month and time since the last message (see fastmask.stats.account_stats)
+
+        top_n [optional]: Number of most common domains and URLs to return
+        where [optional]: Only count Masked Emails matching this filter expression (see fastmask.where)
+        """
+
+        from fastmask.stats import PROPERTIES, account_stats, properties
+
+        if isinstance(where, str):
+            where = compile_where(where)
+        if where is None and not self.snapshot_fresh():
+            # Plain dicts skip building MaskedEmails and parsing their timestamps one at a time
+            masked_emails = self.__records(properties=PROPERTIES)[1]
+        else:
+            masked_emails = self.get(sort_by=None, where=where, properties=properties(where))
+        with self.instrument.span('stats', records=len(masked_emails)):
+            return account_stats(masked_emails, top_n=top_n)
+
+    def save_snapshot(self, path: str) -> int:
+        """
+        Write the account to a columnar snapshot file, to query offline with fastmask.snapshot.Snapshot
+
+        Returns the number of Masked Emails written
+        """
+
+        from fastmask.snapshot import write_snapshot
+
+        state, masked_emails = self.__records()
+        with self.instrument.span('snapshot', records=len(masked_emails)):
+            return write_snapshot(path, masked_emails, state, self.account_id)
+
+    def get_recent(self, timeframe: timedelta = timedelta(days=3)) -> list[MaskedEmail]:
+        """Get recently created Masked Emails (default is 3 days)"""
+
+        return self.get(filters=recent_filter(timeframe), sort_by='createdAt', sort_order='desc')
@@ -0,0 +1,127 @@
+from fastmask.cache import cache_dir, account_key
+
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+import json
+import sqlite3
+
+
+class Mirror:
+    """
+    Local SQLite copy of an account's Masked Emails and the JMAP state string
+    it was taken at, kept current with MaskedEmail/changes
+
+    A mirror may be used from any thread, but only by one at a time.
+    """
+
+    def __init__(self, path: str | Path, loads: Callable[[str], dict] = json.loads):
+        """
+        path: Database file, or '' for a temporary one deleted on close
+        loads [optional]: Decoder for stored records, e.g. a faster JSON codec's
+        """
+
+        self.path = Path(path) if path else None
+        self.loads = loads
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS masked_email (id TEXT PRIMARY KEY, data TEXT NOT NULL)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.db.commit()
+
+    @classmethod
+    def for_account(cls, username: str, token: str, **options) -> 'Mirror':
+        """Open the mirror for username + token under the user cache dir"""
+
+        return cls(cache_dir() / f'mirror-{account_key(username, token)}.sqlite', **options)
+
+    @classmethod
+    def temporary(cls, **options) -> 'Mirror':
+        """Open a mirror in a temporary file, for sorting more records than fit in memory"""
+
+        return cls('', **options)
+
+    @property
+    def state(self) -> str | None:
+        """JMAP MaskedEmail state the mirror is current as of, None if never synced"""
+
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'state'").fetchone()
+        return row[0] if row else None
+
+    def records(self, ids: list[str] | None = None) -> list[dict]:
+        """Return mirrored Masked Emails, optionally only those matching ids"""
+
+        if ids is None:
+            rows = self.db.execute('SELECT data FROM masked_email ORDER BY rowid')
+            return [self.loads(data) for data, in rows]
+
+        found = {}
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i+500]
+            rows = self.db.execute(
+                f'SELECT id, data FROM masked_email WHERE id IN ({",".join("?" * len(chunk))})',
+                chunk
+            )
+            found.update((id_, self.loads(data)) for id_, data in rows)
+        return [found[id_] for id_ in ids if id_ in found]
+
+    def stream(self, sort_by: str | None = None, sort_order: str = 'asc') -> Iterator[dict]:
+        """
+        Yield every mirrored Masked Email one at a time, optionally sorted by SQLite
+
+        Sorting matches fastmask.query.sort_key: ascending puts None and
+        empty values last, descending puts None last, and ties keep mirror order.
+        """
+
+        if sort_by is None:
+            rows = self.db.execute('SELECT data FROM masked_email ORDER BY rowid')
+        else:
+            order = 'v IS NULL, v DESC' if sort_order == 'desc' else "v IS NULL OR v = '', CASE WHEN v = '' THEN NULL ELSE v END"
+            rows = self.db.execute(
+                f'SELECT data FROM (SELECT data, rowid AS n, json_extract(data, ?) AS v FROM masked_email) ORDER BY {order}, n',
+                (f'$."{sort_by}"',)
+            )
+        for data, in rows:
+            yield self.loads(data)
+
+    def replace(self, records: Iterable[dict], state: str | Callable[[], str]) -> None:
+        """
+        Replace the mirror contents with a full snapshot taken at state
+
+        records may be a stream, and state a function called once it is
+        exhausted, for when the state only arrives after the records.
+        """
+
+        with self.db:
+            self.db.execute('DELETE FROM masked_email')
+            self.db.executemany(
+                'INSERT INTO masked_email (id, data) VALUES (?, ?)',
+                ((x['id'], json.dumps(x)) for x in records)
+            )
+            self.__set_state(state() if callable(state) else state)
+
+    def apply(self, changed: list[dict], destroyed: list[str], state: str) -> None:
+        """Upsert changed records, drop destroyed ids and move the mirror to state"""
+
+        with self.db:
+            self.db.executemany(
+                'INSERT INTO masked_email (id, data) VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET data = excluded.data',
+                ((x['id'], json.dumps(x)) for x in changed)
+            )
+            self.db.executemany('DELETE FROM masked_email WHERE id = ?', ((id_,) for id_ in destroyed))
+            self.__set_state(state)
+
+    def clear(self) -> None:
+        """Forget all mirrored data, forcing a full fetch on the next sync"""
+
+        with self.db:
+            self.db.execute('DELETE FROM masked_email')
+            self.db.execute('DELETE FROM meta')
+
+    def close(self) -> None:
+        self.db.close()
+
+    def __set_state(self, state: str) -> None:
+        self.db.execute(
+            "INSERT INTO meta (key, value) VALUES ('state', ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (state,)
+        )
@@ -0,0 +1,101 @@
+"""
+Bulk state changes planned from rules, for clearing out stale addresses
+
+A rule pairs an action (block or delete) with a filter expression (see
+fastmask.where). A plan is made in one pass over the account: each Masked
+Email takes the action of the first rule it matches, and is left out if it
+is already in that action's state::
+
+    plan = client.plan_prune([
+        ('delete', 'state = disabled and lastMessageAt < now-180d'),
+        ('block', 'state = enabled and lastMessageAt is null and createdAt < now-365d'),
+    ])
+    result = client.prune(plan)
+
+The plan remembers the MaskedEmail state it was made at. MaskedMailClient.prune
+sends it with ifInState, so nothing is changed if another client changed the
+account since; only the Masked Emails in MaskedEmail/changes are then planned
+again, and the rest of the plan stands.
+"""
+
+from fastmask.record import MaskedEmail
+from fastmask.where import compile_where
+
+from collections import Counter
+from itertools import chain, islice
+from typing import Callable, Iterable, Iterator
+
+# Masked Email state each action sets
+ACTIONS = {'block': 'disabled', 'delete': 'deleted'}
+
+
+class Plan:
+    """
+    Masked Emails to change, keyed by id and tagged with their 'action', and the state they were planned at
+    """
+
+    def __init__(self, rules: list[tuple[str, str | Callable]], state: str):
+        """
+        rules: (action, filter expression) pairs, in order of precedence. Expressions may be given compiled
+        state: MaskedEmail state the records about to be scanned were read at
+        """
+
+        for action, _ in rules:
+            if action not in ACTIONS:
+                raise ValueError(f'Unknown prune action: {action}')
+
+        self.rules = [(action, compile_where(w) if isinstance(w, str) else w) for action, w in rules]
+        self.state = state
+        self.entries: dict[str, MaskedEmail] = {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self) -> Iterator[MaskedEmail]:
+        return iter(self.entries.values())
+
+    def action(self, x: MaskedEmail) -> str | None:
+        """Action of the first rule x matches, if any"""
+
+        for action, where in self.rules:
+            if where(x):
+                return action
+        return None
+
+    def consider(self, x: MaskedEmail) -> None:
+        """Add x to the plan, or drop it, according to its current properties"""
+
+        action = self.action(x)
+        if action is None or x.state == ACTIONS[action]:
+            self.entries.pop(x.id, None)
+        else:
+            x['action'] = action
+            self.entries[x.id] = x
+
+    def scan(self, masked_emails: Iterable[MaskedEmail]) -> 'Plan':
+        for x in masked_emails:
+            self.consider(x)
+        return self
+
+    def discard(self, ids: Iterable[str]) -> None:
+        for id_ in ids:
+            self.entries.pop(id_, None)
+
+    def replan(self, pages: Iterable[dict]) -> None:
+        """Plan again the Masked Emails in MaskedEmail.changes pages, moving the plan to their newState"""
+
+        for page in pages:
+            self.discard(page['destroyed'])
+            for d in chain(page['created'], page['updated']):
+                self.consider(MaskedEmail.from_dict(d))
+            self.state = page['newState']
+
+    def batch(self, size: int) -> dict[str, dict]:
+        """Changes for the first size entries, as MaskedEmail/set update entries"""
+
+        return {k: {'state': ACTIONS[x['action']]} for k, x in islice(self.entries.items(), size)}
+
+    def counts(self) -> Counter:
+        """Number of entries per action"""
+
+        return Counter(x['action'] for x in self.entries.values())
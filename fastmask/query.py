@@ -0,0 +1,85 @@
+from fastmask.record import field_value
+from fastmask.where import compile_where
+
+from typing import Any, Callable, Iterable, Iterator
+from datetime import datetime, timezone, timedelta
+from itertools import islice
+import heapq
+
+
+def empty_or_none(val: Any) -> bool:
+    if val is None: return True
+    if isinstance(val, str) and len(val) == 0: return True
+    return False
+
+def sort_key(sort_by: str, sort_order: str = 'asc') -> Callable:
+    """
+    Key function computing a record's sort key in one call
+
+    Ascending puts None and empty values last; descending puts None last.
+    Missing values compare equal to each other, so ties keep input order.
+    """
+
+    if sort_order == 'desc':
+        def key(x):
+            v = field_value(x, sort_by)
+            return (True, v) if v is not None else (False, '')
+    else:
+        def key(x):
+            v = field_value(x, sort_by)
+            return (False, v) if not empty_or_none(v) else (True, '')
+    return key
+
+def value_key(sort_order: str = 'asc') -> Callable:
+    """sort_key for values already read from records, such as a column of them"""
+
+    if sort_order == 'desc':
+        return lambda v: (True, v) if v is not None else (False, '')
+    return lambda v: (False, v) if not empty_or_none(v) else (True, '')
+
+def matching(masked_emails: Iterable[dict], filters: Callable | None = None, where: str | Callable | None = None) -> Iterator:
+    """Lazily yield the Masked Emails passing filters and a where expression, compiled once"""
+
+    if where is not None:
+        predicate = compile_where(where) if isinstance(where, str) else where
+        if filters is None:
+            filters = predicate
+        else:
+            filters = (lambda x, f=filters: f(x) and predicate(x))
+
+    return iter(masked_emails) if filters is None else filter(filters, masked_emails)
+
+def apply_query(masked_emails: Iterable[dict], filters: Callable | None = None, sort_by: str | None = 'createdAt', sort_order: str = 'asc', limit: int | None = None, where: str | Callable | None = None) -> list:
+    """
+    Filter, sort and limit Masked Emails the way MaskedMailClient.get does
+
+    Records stream through filters. With a limit, a heap keeps only the
+    top results (O(n log k)) instead of sorting everything, and without a
+    sort the first matches are taken and the rest never filtered. A where
+    expression is compiled once and combined with filters.
+    """
+
+    masked_emails = matching(masked_emails, filters, where)
+
+    if sort_by is None:
+        return list(masked_emails if limit is None else islice(masked_emails, limit))
+
+    key = sort_key(sort_by, sort_order)
+
+    if limit is None:
+        return sorted(masked_emails, key=key, reverse=(sort_order == 'desc'))
+    if sort_order == 'desc':
+        return heapq.nlargest(limit, masked_emails, key=key)
+    return heapq.nsmallest(limit, masked_emails, key=key)
+
+def search_filter(query: str, fields: list[str]) -> Callable:
+    """Case-insensitive substring match of query against fields"""
+
+    query = query.lower()
+    return (lambda x: any(query in x[f].lower() for f in fields if x[f] is not None))
+
+def recent_filter(timeframe: timedelta) -> Callable:
+    """Match Masked Emails created within timeframe of now"""
+
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return (lambda x: (now - x.created_at) < timeframe)
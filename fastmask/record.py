@@ -0,0 +1,170 @@
+from fastmask.config import TIME_FORMAT
+
+from datetime import datetime
+import sys
+
+FIELDS = (
+    'id',
+    'email',
+    'description',
+    'state',
+    'url',
+    'forDomain',
+    'createdAt',
+    'lastMessageAt',
+    'createdBy',
+)
+
+ATTRIBUTES = {
+    'id': 'id',
+    'email': 'email',
+    'description': 'description',
+    'state': 'state',
+    'url': 'url',
+    'forDomain': 'for_domain',
+    'createdAt': 'created_at',
+    'lastMessageAt': 'last_message_at',
+    'createdBy': 'created_by',
+}
+
+DATE_FIELDS = ('createdAt', 'lastMessageAt')
+
+
+def parse_date(d: str | datetime | None) -> datetime | None:
+    """Parse a JMAP UTCDate to a naive UTC datetime"""
+
+    if d is None or isinstance(d, datetime):
+        return d
+    if len(d) == 20 and d[-1] == 'Z':
+        return datetime(int(d[0:4]), int(d[5:7]), int(d[8:10]), int(d[11:13]), int(d[14:16]), int(d[17:19]))
+    return datetime.strptime(d[:19] + 'Z', TIME_FORMAT)
+
+def format_date(d: datetime | None) -> str | None:
+    return d.strftime(TIME_FORMAT) if d is not None else None
+
+
+class MaskedEmail:
+    """
+    A Masked Email, with timestamps parsed and state interned once at ingest
+
+    Attributes use Python names (for_domain, created_at, ...) and hold native
+    values; created_at and last_message_at are naive UTC datetimes. For
+    backward compatibility it also behaves like the JMAP dict it came from:
+    x['createdAt'], x.get('url'), dict(x) and json-style iteration all use
+    the JMAP property names and string timestamps.
+    """
+
+    __slots__ = tuple(ATTRIBUTES.values()) + ('extra',)
+
+    def __init__(self, id: str, email: str, description: str = '', state: str = 'enabled', url: str | None = None, for_domain: str | None = '', created_at: datetime | None = None, last_message_at: datetime | None = None, created_by: str | None = None, extra: dict | None = None):
+        self.id = id
+        self.email = email
+        self.description = description
+        self.state = sys.intern(state) if state is not None else None
+        self.url = url
+        self.for_domain = for_domain
+        self.created_at = created_at
+        self.last_message_at = last_message_at
+        self.created_by = created_by
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, d: dict) -> 'MaskedEmail':
+        """Build a record from a MaskedEmail object as returned by the JMAP API"""
+
+        if isinstance(d, cls):
+            return d
+
+        extra = {k: v for k, v in d.items() if k not in ATTRIBUTES}
+        return cls(
+            id=d.get('id'),
+            email=d.get('email'),
+            description=d.get('description'),
+            state=d.get('state'),
+            url=d.get('url'),
+            for_domain=d.get('forDomain'),
+            created_at=parse_date(d.get('createdAt')),
+            last_message_at=parse_date(d.get('lastMessageAt')),
+            created_by=d.get('createdBy'),
+            extra=extra or None,
+        )
+
+    def copy(self) -> 'MaskedEmail':
+        """A shallow copy, whose extra keys can be set without touching this record"""
+
+        x = MaskedEmail.__new__(MaskedEmail)
+        for attr in self.__slots__:
+            setattr(x, attr, getattr(self, attr))
+        return x
+
+    def value(self, key: str):
+        """Native value of a JMAP property: datetimes for timestamps, None if unset"""
+
+        attr = ATTRIBUTES.get(key)
+        if attr is not None:
+            return getattr(self, attr)
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def to_dict(self) -> dict:
+        """Return the record as a JMAP MaskedEmail dict"""
+
+        return {k: self[k] for k in self.keys()}
+
+    def __getitem__(self, key: str):
+        v = self.value(key)
+        return format_date(v) if key in DATE_FIELDS else v
+
+    def __setitem__(self, key: str, value) -> None:
+        attr = ATTRIBUTES.get(key)
+        if attr is None:
+            self.extra = {**(self.extra or {}), key: value}
+        elif key in DATE_FIELDS:
+            setattr(self, attr, parse_date(value))
+        elif key == 'state':
+            setattr(self, attr, sys.intern(value) if value is not None else None)
+        else:
+            setattr(self, attr, value)
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self) -> list[str]:
+        return list(FIELDS) + list(self.extra or ())
+
+    def values(self) -> list:
+        return [self[k] for k in self.keys()]
+
+    def items(self) -> list[tuple]:
+        return [(k, self[k]) for k in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(FIELDS) + len(self.extra or ())
+
+    def __contains__(self, key: str) -> bool:
+        return key in ATTRIBUTES or (self.extra is not None and key in self.extra)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (MaskedEmail, dict)):
+            return self.to_dict() == dict(other)
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        # Equal records share an id, so records stay usable in sets and as dict keys
+        return hash(self.id)
+
+    def __repr__(self) -> str:
+        return f'MaskedEmail({self.to_dict()!r})'
+
+
+def field_value(x: MaskedEmail | dict, key: str):
+    """Native value of key for a record or a plain dict"""
+
+    return x.value(key) if isinstance(x, MaskedEmail) else x[key]
@@ -0,0 +1,199 @@
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Callable
+import asyncio
+import random
+import threading
+import time
+
+# The server did not act on the request, so it is always safe to send again
+RETRY_ALWAYS = (429, 503)
+# The request may or may not have been applied
+RETRY_IF_IDEMPOTENT = (500, 502, 504)
+
+READ_METHODS = ('/get', '/changes', '/query', '/queryChanges')
+
+
+def is_idempotent(call: dict) -> bool:
+    """
+    Whether replaying a JMAP request after an ambiguous failure is safe
+
+    Reads are. So are /set updates and destroys, which converge on the same
+    result when applied twice. Creates are not: creation ids only live for
+    one request, so a replay after a lost response makes duplicates.
+    """
+
+    for name, args, _ in call.get('methodCalls', []):
+        if name.endswith(READ_METHODS):
+            continue
+        if name.endswith('/set') and not args.get('create'):
+            continue
+        return False
+    return True
+
+def retry_after(headers) -> float | None:
+    """Seconds to wait from a Retry-After header, given as seconds or an HTTP date"""
+
+    value = headers.get('Retry-After')
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing rate requests per second, in bursts of up to burst"""
+
+    def __init__(self, rate: float | None = None, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token, returning how many seconds to wait before using it"""
+
+        with self.lock:
+            now = time.monotonic()
+            wait = max(0.0, self.paused_until - now)
+
+            if self.rate is None:
+                return wait
+
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens < 0:
+                wait = max(wait, -self.tokens / self.rate)
+            return wait
+
+    def pause(self, seconds: float) -> None:
+        """Hold every caller back for seconds, e.g. after the server asked to slow down"""
+
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class RequestScheduler:
+    """
+    Paces JMAP requests through a token bucket and retries transient
+    failures with jittered exponential backoff
+
+    429 and 503 responses and failures to connect are always retried,
+    waiting at least as long as Retry-After asks, and hold back every
+    request sharing the scheduler. Other 5xx responses and dropped
+    connections are only retried when the request is idempotent.
+    Each call gets up to max_retries retries, within max_wait seconds of waiting.
+    """
+
+    def __init__(self, rate: float | None = None, burst: int = 1, max_retries: int = 5, backoff: float = 0.5, max_backoff: float = 30, max_wait: float = 120):
+        """
+        rate [optional]: Maximum requests per second, unlimited by default
+        burst [optional]: Requests allowed back to back before rate applies
+        max_retries [optional]: Retries allowed per call
+        backoff [optional]: Base delay in seconds, doubled on each retry
+        max_backoff [optional]: Cap on a single backoff delay
+        max_wait [optional]: Total seconds a call may spend waiting to retry
+        """
+
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_wait = max_wait
+
+    def delay(self, attempt: int, status: int | None, headers, idempotent: bool, safe_error: bool = False) -> float | None:
+        """Seconds to wait before retry number attempt, or None to give up"""
+
+        if status is None:
+            retryable = safe_error or idempotent
+        else:
+            retryable = status in RETRY_ALWAYS or (status in RETRY_IF_IDEMPOTENT and idempotent)
+
+        if not retryable or attempt > self.max_retries:
+            return None
+
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+        if status in RETRY_ALWAYS:
+            after = retry_after(headers) if headers is not None else None
+            if after is not None:
+                delay = after + random.uniform(0, self.backoff)
+            self.bucket.pause(delay)
+
+        return delay
+
+    def send(self, request: Callable, idempotent: bool = True, safe_errors: tuple = (), errors: tuple = ()):
+        """
+        Call request() until it returns a response worth keeping
+
+        safe_errors: exceptions raised before the request reached the server
+        errors: other transient exceptions, retried only when idempotent
+
+        Returns the last response, with the number of retries taken as its
+        fastmask_retries attribute, or raises the last exception.
+        """
+
+        attempt, waited = 0, 0.0
+        while True:
+            time.sleep(self.bucket.reserve())
+            try:
+                response = request()
+                status, headers, failure = response.status_code, response.headers, None
+            except safe_errors + errors as e:
+                response, status, headers, failure = None, None, None, e
+
+            if failure is None and status not in RETRY_ALWAYS + RETRY_IF_IDEMPOTENT:
+                response.fastmask_retries = attempt
+                return response
+
+            attempt += 1
+            delay = self.delay(attempt, status, headers, idempotent, isinstance(failure, safe_errors))
+            if delay is None or waited + delay > self.max_wait:
+                if failure is not None:
+                    raise failure
+                response.fastmask_retries = attempt - 1
+                return response
+
+            # Hand the pooled connection back before trying again
+            if response is not None:
+                response.close()
+            waited += delay
+            time.sleep(delay)
+
+    async def send_async(self, request: Callable, idempotent: bool = True, safe_errors: tuple = (), errors: tuple = ()):
+        """Coroutine version of send, for a request() returning an awaitable"""
+
+        attempt, waited = 0, 0.0
+        while True:
+            await asyncio.sleep(self.bucket.reserve())
+            try:
+                response = await request()
+                status, headers, failure = response.status_code, response.headers, None
+            except safe_errors + errors as e:
+                response, status, headers, failure = None, None, None, e
+
+            if failure is None and status not in RETRY_ALWAYS + RETRY_IF_IDEMPOTENT:
+                response.fastmask_retries = attempt
+                return response
+
+            attempt += 1
+            delay = self.delay(attempt, status, headers, idempotent, isinstance(failure, safe_errors))
+            if delay is None or waited + delay > self.max_wait:
+                if failure is not None:
+                    raise failure
+                response.fastmask_retries = attempt - 1
+                return response
+
+            if response is not None:
+                await response.aclose()
+            waited += delay
+            await asyncio.sleep(delay)
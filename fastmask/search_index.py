@@ -0,0 +1,132 @@
+from typing import Callable
+import heapq
+
+DEFAULT_FIELDS = ('email', 'description', 'url', 'forDomain')
+
+
+def trigrams(text: str) -> set[str]:
+    return {text[i:i+3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    """
+    Trigram inverted index over Masked Email text fields, answering
+    case-insensitive substring and prefix queries with ranked results
+
+    Records can be added and removed incrementally as they change.
+    """
+
+    def __init__(self, fields: list[str] | tuple[str, ...] = DEFAULT_FIELDS, state: str | None = None):
+        self.fields = tuple(fields)
+        self.state = state
+        self.records = {}
+        self.text = {}
+        self.postings = {}
+
+    @classmethod
+    def build(cls, masked_emails: list[dict], fields: list[str] | tuple[str, ...] = DEFAULT_FIELDS, state: str | None = None) -> 'SearchIndex':
+        index = cls(fields, state)
+        for x in masked_emails:
+            index.add(x)
+        return index
+
+    def add(self, masked_email: dict) -> None:
+        """Index a Masked Email, replacing any previous version with the same id"""
+
+        id_ = masked_email['id']
+        if id_ in self.records:
+            self.remove(id_)
+
+        values = tuple(
+            str(masked_email[f]).lower() if masked_email.get(f) is not None else ''
+            for f in self.fields
+        )
+        self.records[id_] = masked_email
+        self.text[id_] = values
+
+        for gram in set().union(*(trigrams(v) for v in values)):
+            self.postings.setdefault(gram, set()).add(id_)
+
+    def remove(self, id_: str) -> None:
+        values = self.text.pop(id_, None)
+        self.records.pop(id_, None)
+        if values is None:
+            return
+
+        for gram in set().union(*(trigrams(v) for v in values)):
+            ids = self.postings.get(gram)
+            if ids is not None:
+                ids.discard(id_)
+                if len(ids) == 0:
+                    del self.postings[gram]
+
+    def update(self, changed: list[dict], destroyed: list[str] = [], state: str | None = None) -> None:
+        """Apply a set of changed and destroyed records, moving the index to state"""
+
+        for id_ in destroyed:
+            self.remove(id_)
+        for x in changed:
+            self.add(x)
+        self.state = state
+
+    def candidates(self, query: str) -> set[str] | dict:
+        """Ids that contain every trigram of query. Short queries match everything"""
+
+        grams = trigrams(query)
+        if len(grams) == 0:
+            return self.text
+
+        postings = sorted((self.postings.get(g, ()) for g in grams), key=len)
+        result = set(postings[0])
+        for ids in postings[1:]:
+            result.intersection_update(ids)
+            if len(result) == 0:
+                break
+        return result
+
+    def rank(self, id_: str, query: str) -> tuple | None:
+        """
+        Sort key for a match: exact field matches first, then prefixes, then
+        word prefixes, then other substrings; ties go to earlier fields and
+        shorter values. None if the record does not match.
+        """
+
+        best = None
+        for n, value in enumerate(self.text[id_]):
+            pos = value.find(query)
+            if pos < 0:
+                continue
+            if value == query:
+                kind = 0
+            elif pos == 0:
+                kind = 1
+            else:
+                # Any occurrence that starts a word makes a word prefix match
+                kind = 3
+                while pos >= 0:
+                    if not value[pos-1].isalnum():
+                        kind = 2
+                        break
+                    pos = value.find(query, pos + 1)
+            key = (kind, n, len(value))
+            if best is None or key < best:
+                best = key
+        return best
+
+    def search(self, query: str, limit: int | None = None, filters: Callable | None = None) -> list[dict]:
+        """Return records containing query in any indexed field and matching filters, best matches first"""
+
+        query = query.lower()
+        ranked = (
+            (key, id_)
+            for id_ in self.candidates(query)
+            if (key := self.rank(id_, query)) is not None
+            and (filters is None or filters(self.records[id_]))
+        )
+
+        if limit is not None:
+            ranked = heapq.nsmallest(limit, ranked)
+        else:
+            ranked = sorted(ranked)
+
+        return [self.records[id_] for _, id_ in ranked]
@@ -0,0 +1,307 @@
+"""
+Columnar snapshot files, for querying a point-in-time copy of an account offline
+
+A snapshot holds every Masked Email property as one typed column:
+
+- createdAt and lastMessageAt as int64 epoch seconds (NULL_TIME when unset)
+- state and createdBy as uint8 codes into a list of values kept in the header
+- other strings as int64 offsets into a UTF-8 blob, plus a uint8 null mask
+  for columns that have unset values
+
+The file is a magic line, the length of a JSON header, the header (state,
+account, count and where each buffer starts) and the buffers, each aligned
+to 8 bytes. Opening one maps the file and casts memoryviews over the
+buffers, so nothing is parsed or copied until a value is read::
+
+    client.save_snapshot('account.fmsnap')
+    snapshot = Snapshot('account.fmsnap')
+    snapshot.stats()                        # from the mapped columns
+    list(snapshot.iter(where='state = enabled', limit=10))
+
+Snapshots take the query arguments of MaskedMailClient (iter, get,
+search, stats), which is how fastmask list --from-snapshot uses them.
+"""
+
+from fastmask.config import TIME_FORMAT
+from fastmask.instrument import Instrumentation, timed_query
+from fastmask.query import matching, search_filter, value_key
+from fastmask.record import DATE_FIELDS, FIELDS, MaskedEmail
+from fastmask.search_index import SearchIndex, DEFAULT_FIELDS as DEFAULT_SEARCH_FIELDS
+from fastmask.stats import EPOCH, SECOND, Columns
+from fastmask.where import compile_where
+
+from array import array
+from collections.abc import Sequence
+from datetime import datetime, timezone
+from itertools import accumulate, islice, repeat
+from operator import is_
+from typing import Callable, Iterable, Iterator
+import json
+import mmap
+import os
+import struct
+import sys
+
+MAGIC = b'FMSNAP1\n'
+HEADER_LENGTH = struct.Struct('<Q')
+ALIGNMENT = 8
+
+# Stand-in for unset timestamps, which int64 columns cannot hold as None
+NULL_TIME = -(1 << 63)
+NULLS = {NULL_TIME: None}
+
+# Properties stored as codes into a list of values, while they have few enough of them
+CATEGORIES = ('state', 'createdBy')
+MAX_CATEGORIES = 256
+
+
+class TimeColumn(Sequence):
+    """int64 epoch seconds, read as None where unset"""
+
+    def __init__(self, values: Sequence[int]):
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __getitem__(self, i: int) -> int | None:
+        v = self.values[i]
+        return None if v == NULL_TIME else v
+
+    def __iter__(self) -> Iterator[int | None]:
+        # NULLS.get(v, v) is v, or None for NULL_TIME, without a Python-level call per value
+        return map(NULLS.get, self.values, self.values)
+
+
+class CategoryColumn(Sequence):
+    """uint8 codes, read as the values they index"""
+
+    def __init__(self, codes: Sequence[int], values: list):
+        self.codes = codes
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, i: int):
+        return self.values[self.codes[i]]
+
+    def __iter__(self) -> Iterator:
+        return map(self.values.__getitem__, self.codes)
+
+
+class StringColumn(Sequence):
+    """UTF-8 strings sliced from a blob by offsets, decoded as they are read"""
+
+    def __init__(self, data: memoryview, offsets: Sequence[int], nulls: Sequence[int] | None = None):
+        self.data = data
+        self.offsets = offsets
+        self.nulls = nulls
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str | None:
+        if self.nulls is not None and self.nulls[i]:
+            return None
+        return str(self.data[self.offsets[i]:self.offsets[i + 1]], 'utf-8')
+
+    def __iter__(self) -> Iterator[str | None]:
+        texts = map(str, map(self.data.__getitem__, map(slice, self.offsets, self.offsets[1:])), repeat('utf-8'))
+        if self.nulls is None:
+            return texts
+        return (None if null else text for null, text in zip(self.nulls, texts))
+
+
+def encode_column(key: str, values: list) -> tuple[dict, dict[str, bytes]]:
+    """The header entry and buffers for one column of values"""
+
+    if key in DATE_FIELDS:
+        return {'type': 'time'}, {'values': array('q', [NULL_TIME if v is None else v for v in values]).tobytes()}
+
+    if key in CATEGORIES:
+        categories = list(dict.fromkeys(values))
+        if len(categories) <= MAX_CATEGORIES:
+            codes = dict(zip(categories, range(len(categories))))
+            return {'type': 'category', 'values': categories}, {'codes': bytes(map(codes.__getitem__, values))}
+
+    encoded = [v.encode() if v is not None else b'' for v in values]
+    buffers = {
+        'offsets': array('q', accumulate(map(len, encoded), initial=0)).tobytes(),
+        'data': b''.join(encoded),
+    }
+    if None in values:
+        buffers['nulls'] = bytes(map(is_, values, repeat(None)))
+    return {'type': 'string'}, buffers
+
+def write_snapshot(path: str, records: Iterable[MaskedEmail | dict], state: str, account_id: str | None = None) -> int:
+    """
+    Write Masked Emails, as records or JMAP dicts, to a snapshot file at path
+
+    The file is written next to path and moved into place, so readers never
+    see a partial snapshot. Returns the number of Masked Emails written.
+    """
+
+    columns = Columns.from_records(records, FIELDS)
+    header = {
+        'version': 1,
+        'byteorder': sys.byteorder,
+        'state': state,
+        'accountId': account_id,
+        'savedAt': datetime.now(timezone.utc).strftime(TIME_FORMAT),
+        'count': len(columns),
+        'columns': {},
+    }
+
+    buffers = []
+    for key in FIELDS:
+        entry, data = encode_column(key, columns[key])
+        entry['buffers'] = {}
+        for name, buffer in data.items():
+            entry['buffers'][name] = len(buffers)
+            buffers.append(buffer)
+        header['columns'][key] = entry
+
+    # Buffers start at 8-byte boundaries, counted from the first one, which follows the header
+    header['spans'] = spans = []
+    position = 0
+    for buffer in buffers:
+        spans.append([position, len(buffer)])
+        position = padded(position + len(buffer))
+    encoded = json.dumps(header).encode()
+    start = padded(len(MAGIC) + HEADER_LENGTH.size + len(encoded))
+
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as fh:
+        fh.write(MAGIC + HEADER_LENGTH.pack(len(encoded)) + encoded)
+        for (offset, _), buffer in zip(spans, buffers):
+            fh.write(bytes(start + offset - fh.tell()))
+            fh.write(buffer)
+    os.replace(temporary, path)
+    return header['count']
+
+def padded(position: int) -> int:
+    return -(-position // ALIGNMENT) * ALIGNMENT
+
+
+class Snapshot:
+    """
+    A snapshot file, memory-mapped and read in place
+
+    Answers the query methods of MaskedMailClient (iter, get, search, stats)
+    from the file. Records are complete whatever properties are asked for.
+    """
+
+    def __init__(self, path: str, hooks: list[Callable] | None = None):
+        """
+        path: Snapshot file written by write_snapshot or MaskedMailClient.save_snapshot
+        hooks [optional]: Instrumentation hooks, as for MaskedMailClient
+        Raises ValueError if path is not a snapshot this version can read
+        """
+
+        self.path = path
+        self.instrument = Instrumentation(hooks)
+
+        with self.instrument.span('open'), open(path, 'rb') as fh:
+            view = memoryview(mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ))
+
+            start = len(MAGIC) + HEADER_LENGTH.size
+            if bytes(view[:len(MAGIC)]) != MAGIC:
+                raise ValueError(f'{path} is not a fastmask snapshot')
+            (length,) = HEADER_LENGTH.unpack_from(view, len(MAGIC))
+            header = json.loads(bytes(view[start:start + length]))
+            if header['version'] != 1 or header['byteorder'] != sys.byteorder:
+                raise ValueError(f'{path} was written by an incompatible version of fastmask')
+
+            start = padded(start + length)
+            buffers = [view[start + offset:start + offset + size] for offset, size in header['spans']]
+            self.header = header
+            self.columns = Columns({k: load_column(v, buffers) for k, v in header['columns'].items()})
+
+    @property
+    def state(self) -> str:
+        return self.header['state']
+
+    @property
+    def account_id(self) -> str:
+        return self.header['accountId'] or os.path.basename(self.path)
+
+    def __len__(self) -> int:
+        return self.header['count']
+
+    def records(self) -> Iterator[MaskedEmail]:
+        """Every Masked Email in the snapshot, in the order they were written"""
+
+        columns = [self.columns[k] for k in FIELDS]
+        for k in DATE_FIELDS:
+            columns[FIELDS.index(k)] = map(to_datetime, self.columns[k])
+        return map(MaskedEmail, *columns)
+
+    def record(self, i: int) -> MaskedEmail:
+        """The Masked Email in row i"""
+
+        return MaskedEmail(*[to_datetime(self.columns[k][i]) if k in DATE_FIELDS else self.columns[k][i] for k in FIELDS])
+
+    def order(self, sort_by: str, sort_order: str = 'asc') -> list[int]:
+        """Rows sorted the way MaskedMailClient.get sorts records, from sort_by's column alone"""
+
+        keys = list(map(value_key(sort_order), self.columns[sort_by]))
+        return sorted(range(len(keys)), key=keys.__getitem__, reverse=(sort_order == 'desc'))
+
+    def iter(self, ids: list[str] | None = None, filters: Callable | None = None, sort_by: str | None = None, sort_order: str = 'asc', limit: int | None = None, where: str | None = None, properties: list[str] | None = None) -> Iterator[MaskedEmail]:
+        """
+        Yield Masked Emails one at a time, taking the arguments of MaskedMailClient.iter
+
+        A sort orders rows by one column, and records are only built as they are read.
+        """
+
+        masked_emails = self.records() if sort_by is None else map(self.record, self.order(sort_by, sort_order))
+        if ids is not None:
+            wanted = set(ids)
+            masked_emails = (x for x in masked_emails if x.id in wanted)
+
+        matches = matching(masked_emails, filters=filters, where=where)
+        return matches if limit is None else islice(matches, limit)
+
+    def get(self, ids: list[str] | None = None, filters: Callable | None = None, sort_by: str = 'createdAt', sort_order: str = 'asc', limit: int | None = None, where: str | None = None, properties: list[str] | None = None) -> list[MaskedEmail]:
+        """Masked Emails in the snapshot, taking the arguments of MaskedMailClient.get"""
+
+        masked_emails = list(self.iter(ids=ids))
+        return timed_query(self.instrument, masked_emails, filters=filters, sort_by=sort_by, sort_order=sort_order, limit=limit, where=where)
+
+    def search(self, query: str, fields: list[str] = ['email', 'description'], limit: int | None = None, ranked: bool = False, where: str | None = None, properties: list[str] | None = None) -> list[MaskedEmail]:
+        """Search the snapshot, taking the arguments of MaskedMailClient.search"""
+
+        if ranked:
+            if isinstance(where, str):
+                where = compile_where(where)
+            masked_emails = list(self.records())
+            with self.instrument.span('index', records=len(masked_emails)):
+                index = SearchIndex.build(masked_emails, fields or DEFAULT_SEARCH_FIELDS, self.state)
+            with self.instrument.span('search'):
+                return index.search(query, limit=limit, filters=where)
+
+        return self.get(filters=search_filter(query, fields), limit=limit, where=where)
+
+    def stats(self, top_n: int = 10, where: str | None = None) -> dict[str, list[tuple[str, int]]]:
+        """Aggregates over the snapshot, taking the arguments of MaskedMailClient.stats"""
+
+        from fastmask.stats import account_stats
+
+        columns = self.columns if where is None else Columns.from_records(self.iter(where=where))
+        with self.instrument.span('stats', records=len(columns)):
+            return account_stats(columns, top_n=top_n)
+
+
+def load_column(entry: dict, buffers: list[memoryview]) -> Sequence:
+    """A column read in place from its buffers"""
+
+    buffer = {name: buffers[n] for name, n in entry['buffers'].items()}
+    if entry['type'] == 'time':
+        return TimeColumn(buffer['values'].cast('q'))
+    if entry['type'] == 'category':
+        return CategoryColumn(buffer['codes'], entry['values'])
+    return StringColumn(buffer['data'], buffer['offsets'].cast('q'), buffer.get('nulls'))
+
+def to_datetime(seconds: int | None) -> datetime | None:
+    return EPOCH + seconds * SECOND if seconds is not None else None
@@ -0,0 +1,187 @@
+"""
+Account-level aggregates over Masked Emails
+
+Records are turned into columns once, one sequence per property. This is
+the only per-row Python work: each value is read off its record, and each
+timestamp converted to epoch seconds (parsed, for JMAP dicts). Each
+aggregate is then a pass over one or two columns done by C code: Counter
+for counts, itertools.compress with operator maps for selecting rows, and
+for time buckets a count of the values past each edge, or for months one
+sort and a bisect per month. Snapshot columns (see fastmask.snapshot) are
+already in this form, so aggregating them skips the conversion::
+
+    from fastmask.stats import account_stats
+    stats = account_stats(client.get(sort_by=None, properties=PROPERTIES))
+    stats['state']              # [('enabled', 812), ('disabled', 140), ...]
+    stats['unused_by_age']      # [('< 30 days', 12), ('30-90 days', 40), ...]
+"""
+
+from fastmask.record import ATTRIBUTES, DATE_FIELDS, MaskedEmail
+
+from bisect import bisect_left
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from itertools import compress, repeat
+from operator import and_, attrgetter, eq, ge, is_, is_not
+from typing import Iterable, Iterator, Sequence
+
+# Properties the aggregates read
+PROPERTIES = ['id', 'state', 'forDomain', 'url', 'createdAt', 'lastMessageAt']
+
+# Columns of the rows written by rows(), for csv output
+COLUMNS = ['stat', 'key', 'count']
+
+# Age buckets in days, youngest first; older ones fall in the last bucket
+AGE_BUCKETS = ((30, '< 30 days'), (90, '30-90 days'), (365, '90-365 days'))
+OLDEST_BUCKET = '> 1 year'
+
+EPOCH = datetime(1970, 1, 1)
+SECOND = timedelta(seconds=1)
+DAY = 86400
+
+fromisoformat = datetime.fromisoformat
+
+
+class Columns:
+    """
+    Masked Emails as one sequence per property
+
+    createdAt and lastMessageAt hold epoch seconds, None when unset, and
+    other properties their JMAP values. Any sequence will do, so columns
+    can be lists built from records or arrays read from a file.
+    """
+
+    def __init__(self, columns: dict[str, Sequence]):
+        self.columns = columns
+
+    def __getitem__(self, key: str) -> Sequence:
+        return self.columns[key]
+
+    def __len__(self) -> int:
+        return len(self.columns['id'])
+
+    @classmethod
+    def from_records(cls, records: Iterable[MaskedEmail | dict], properties: Sequence[str] = PROPERTIES) -> 'Columns':
+        """Columns of properties (by default PROPERTIES) from MaskedEmail records, or from JMAP dicts"""
+
+        records = records if isinstance(records, list) else list(records)
+        if records and isinstance(records[0], MaskedEmail):
+            column = lambda key: list(map(attrgetter(ATTRIBUTES[key]), records))
+            to_epoch = epoch_seconds
+        else:
+            column = lambda key: [x.get(key) for x in records]
+            to_epoch = parse_epoch_seconds
+
+        columns = {k: column(k) for k in properties}
+        for k in DATE_FIELDS:
+            if k in columns:
+                columns[k] = to_epoch(columns[k])
+        return cls(columns)
+
+
+# Both conversions are cheaper than dividing the timedelta by a second
+
+def epoch_seconds(dates: Iterable[datetime | None]) -> list[int | None]:
+    """Naive UTC datetimes as integer epoch seconds"""
+
+    return [(t := d - EPOCH).days * DAY + t.seconds if d is not None else None for d in dates]
+
+def parse_epoch_seconds(dates: Iterable[str | None]) -> list[int | None]:
+    """JMAP UTCDate strings as integer epoch seconds, parsed by datetime.fromisoformat"""
+
+    return [(t := fromisoformat(d[:19]) - EPOCH).days * DAY + t.seconds if d is not None else None for d in dates]
+
+def present(column: Sequence) -> list:
+    """The values of column that are not None"""
+
+    return list(compress(column, map(is_not, column, repeat(None))))
+
+def histogram(values: list, edges: Sequence) -> list[int]:
+    """
+    Number of sorted values below edges[0], in each interval between
+    consecutive edges, and from edges[-1] on
+    """
+
+    positions = [0, *(bisect_left(values, e) for e in edges), len(values)]
+    return [b - a for a, b in zip(positions, positions[1:])]
+
+def age_buckets(timestamps: list[int], now: int) -> list[tuple[str, int]]:
+    """
+    Count timestamps by how long before now they are, youngest bucket first
+
+    With so few buckets, counting the values past each edge beats sorting them.
+    """
+
+    after = [sum(map(ge, timestamps, repeat(now - days * DAY))) for days, _ in AGE_BUCKETS]
+    counts = [b - a for a, b in zip([0, *after], [*after, len(timestamps)])]
+    return list(zip([label for _, label in AGE_BUCKETS] + [OLDEST_BUCKET], counts))
+
+def month_starts(first: int, last: int) -> Iterator[datetime]:
+    """Start of each month from the one holding first to the one holding last"""
+
+    month = datetime.fromtimestamp(first, timezone.utc).replace(day=1, hour=0, minute=0, second=0, tzinfo=None)
+    end = EPOCH + last * SECOND
+    while month <= end:
+        yield month
+        month = month.replace(year=month.year + month.month // 12, month=month.month % 12 + 1)
+
+def per_month(timestamps: list[int]) -> list[tuple[str, int]]:
+    """Count timestamps per calendar month (UTC), oldest first, including empty months"""
+
+    if not timestamps:
+        return []
+    timestamps = sorted(timestamps)
+    months = list(month_starts(timestamps[0], timestamps[-1]))
+    counts = histogram(timestamps, epoch_seconds(months[1:]))
+    return [(m.strftime('%Y-%m'), n) for m, n in zip(months, counts)]
+
+def top(column: Sequence, n: int) -> list[tuple[str, int]]:
+    """The n most common values of column, ignoring unset and empty ones"""
+
+    counts = Counter(column)
+    counts.pop(None, None)
+    counts.pop('', None)
+    return counts.most_common(n)
+
+def account_stats(records: Iterable[MaskedEmail | dict] | Columns, now: datetime | None = None, top_n: int = 10) -> dict[str, list[tuple[str, int]]]:
+    """
+    Aggregate Masked Emails, given as records or Columns
+
+    Returns (key, count) pairs for each of:
+
+    - state: count by state, most common first
+    - unused_by_age: enabled addresses that never received mail, by age
+    - top_domains, top_urls: the top_n most common forDomain and url values
+    - created_per_month: addresses created each month (UTC), oldest first
+    - last_message: time since the last message received, or never
+
+    now [optional]: Naive UTC time ages are measured from, defaults to the current time
+    """
+
+    columns = records if isinstance(records, Columns) else Columns.from_records(records)
+    now = epoch_seconds([now or datetime.now(timezone.utc).replace(tzinfo=None)])[0]
+    state, created, last = columns['state'], columns['createdAt'], columns['lastMessageAt']
+
+    unused = map(and_, map(eq, state, repeat('enabled')), map(is_, last, repeat(None)))
+    received = present(last)
+
+    return {
+        'state': Counter(state).most_common(),
+        'unused_by_age': age_buckets(present(list(compress(created, unused))), now),
+        'top_domains': top(columns['forDomain'], top_n),
+        'top_urls': top(columns['url'], top_n),
+        'created_per_month': per_month(present(created)),
+        'last_message': [*age_buckets(received, now), ('never', len(columns) - len(received))],
+    }
+
+def properties(where=None) -> list[str]:
+    """Properties to fetch for account_stats, plus those a compiled where filter reads"""
+
+    return list(dict.fromkeys([*PROPERTIES, *getattr(where, 'fields', ())]))
+
+def rows(stats: dict[str, list[tuple[str, int]]]) -> Iterator[dict]:
+    """Flatten account_stats into {'stat', 'key', 'count'} rows for output"""
+
+    for stat, pairs in stats.items():
+        for key, count in pairs:
+            yield {'stat': stat, 'key': key, 'count': count}
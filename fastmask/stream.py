@@ -0,0 +1,156 @@
+"""
+Incremental decoding of MaskedEmail/get responses
+
+The response body is parsed as it arrives, and each object in the list of
+its first method response is yielded as soon as it is complete, so neither
+the body nor the decoded list is ever held whole. Everything else in the
+response is small and decoded as usual once reached.
+"""
+
+from typing import Any, Iterable, Iterator
+import codecs
+import json
+
+DECODER = json.JSONDecoder()
+WHITESPACE = ' \t\n\r'
+
+# Consumed text is dropped from the buffer once it grows past this many characters
+COMPACT_AT = 1 << 16
+
+
+class GetStream:
+    """
+    Iterates over the Masked Emails of a MaskedEmail/get response, given as chunks of the body
+
+    The other arguments of the method response (state, notFound, ...) are
+    in args once iteration reaches them, and the other top-level members of
+    the response (sessionState) in response. Iterating a second time yields nothing.
+    """
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.bytes = 0
+        self.name = None
+        self.args = {}
+        self.response = {}
+
+    @property
+    def state(self) -> str | None:
+        return self.args.get('state')
+
+    def fill(self) -> bool:
+        """Add the next chunk of the body to the buffer, returning False at the end"""
+
+        if self.pos > COMPACT_AT:
+            self.buf, self.pos = self.buf[self.pos:], 0
+
+        for chunk in self.chunks:
+            if chunk:
+                self.bytes += len(chunk)
+                self.buf += self.decoder.decode(chunk)
+                return True
+
+        if not self.eof:
+            self.buf += self.decoder.decode(b'', final=True)
+            self.eof = True
+        return False
+
+    def peek(self) -> str:
+        """The next character that isn't whitespace, without consuming it"""
+
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                raise ValueError('Response ended unexpectedly')
+
+    def expect(self, chars: str) -> str:
+        c = self.peek()
+        if c not in chars:
+            raise ValueError(f'Expected {" or ".join(repr(x) for x in chars)} in response, got {c!r}')
+        self.pos += 1
+        return c
+
+    def value(self) -> Any:
+        """Decode the next complete JSON value"""
+
+        self.peek()
+        while True:
+            try:
+                value, end = DECODER.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # A number may carry on in the next chunk
+            if end == len(self.buf) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def members(self) -> Iterator[str]:
+        """Yield each key of the object starting here, with the position at its value"""
+
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.expect(',}') == '}':
+                return
+
+    def elements(self) -> Iterator[int]:
+        """Yield the index of each element of the array starting here, with the position at it"""
+
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        n = 0
+        while True:
+            yield n
+            n += 1
+            if self.expect(',]') == ']':
+                return
+
+    def __iter__(self) -> Iterator[dict]:
+        for key in self.members():
+            if key != 'methodResponses':
+                self.response[key] = self.value()
+                continue
+
+            for n in self.elements():
+                if n > 0:
+                    self.value()
+                    continue
+                yield from self.method_response()
+
+        if self.name == 'error':
+            raise ValueError(f'MaskedEmail/get failed: {self.args.get("description") or self.args.get("type")}')
+
+    def method_response(self) -> Iterator[dict]:
+        """Yield the list of a [name, arguments, call id] method response, keeping the rest"""
+
+        for i in self.elements():
+            if i == 0:
+                self.name = self.value()
+            elif i == 1 and self.name != 'error':
+                for arg in self.members():
+                    if arg == 'list':
+                        for _ in self.elements():
+                            yield self.value()
+                    else:
+                        self.args[arg] = self.value()
+            elif i == 1:
+                self.args = self.value()
+            else:
+                self.value()
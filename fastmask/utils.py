@@ -1,20 +1,29 @@
-from fastmask import config
+from fastmask import config, export
+from fastmask.record import ATTRIBUTES, MaskedEmail, field_value, parse_date
 
-from typing import Any
-from rich import print, box
-from rich.table import Table
-from rich.console import Console
+from typing import Any, Callable, Iterable, Iterator
 from datetime import datetime
-import pandas as pd
+from itertools import chain, islice
+from operator import attrgetter
+import os
+
+# rich is imported where it is used so commands that never render
+# a table or print a message don't pay for loading it
+
+# Messages get a new Console each time rather than rich's global one, which
+# fixes its colors and width on first use and would keep them in `fastmask serve`
 
 def error_msg(msg: str, exit_: bool = True) -> None:
-    print(f'[red bold]{msg}')
+    from rich.console import Console
+    console = Console()
+    console.print(f'[red bold]{msg}')
     if exit_:
-        print("[white]Exiting...\n")
+        console.print("[white]Exiting...\n")
         exit()
 
 def success_msg(msg: str) -> None:
-    print(f'[green]{msg}')
+    from rich.console import Console
+    Console().print(f'[green]{msg}')
 
 def try_get(k: str, src: dict, default=None) -> Any:
     return src[k] if k in src else default
@@ -23,78 +32,202 @@ def is_none(val) -> bool:
     return val is None or len(val) == 0
 
 def to_date(d: str) -> datetime:
-    return datetime.strptime(d, config.TIME_FORMAT)
-
-def handle_output(r: list[dict], o: str, j: bool, t: str) -> None:
-
-    column_order = [
-        'email',
-        'forDomain',
-        'description',
-        'state',
-        'lastMessageAt',
-        'url',
-        'id',
-        'createdAt',
-        'createdBy',
-    ]
+    return parse_date(d)
+
+def handle_output(r: Iterable[dict], o: str | None, j: bool, t: str, f: str | None = None, page: bool = False, accounts: bool = False, columns: list[str] | None = None, schema: dict | None = None) -> None:
+    """
+    Print results as a table, or stream them as csv/json/ndjson to the file
+    o or stdout. The format is f if given, else implied by o's extension;
+    j prints json to stdout. page sends the table through $PAGER. accounts
+    adds an account column for results from several accounts. columns and
+    schema replace the csv columns and table schema for rows other than Masked Emails.
+    """
+
+    if columns is None:
+        columns = ['account', *export.COLUMN_ORDER] if accounts else export.COLUMN_ORDER
 
     if o is not None:
-        if o.lower().endswith('.csv'):
-            pd.DataFrame(r).to_csv(o, index=False, columns=column_order)
-        elif o.lower().endswith('.json'):
-            pd.DataFrame(r).to_json(o, orient='records', indent=4)
-        else:
-            error_msg('Output is supported for json or csv format.')
-    elif j:
-        print(pd.DataFrame(r).to_json(orient='records', indent=4))
+        f = f or export.format_for(o)
+        if f is None:
+            error_msg('Output is supported for csv, json or ndjson format.')
+        export.export(r, f, o, columns)
+    elif f is not None or j:
+        export.export(r, f or 'json', columns=columns)
     else:
-        PrettyTable(r, title=t).out()
+        if schema is None and accounts:
+            schema = {'account': config.account_column, **config.table_schema}
+        PrettyTable(r, title=t, schema=schema).out(page=page)
+
+def output_properties(o: str | None, j: bool, f: str | None = None) -> list[str] | None:
+    """JMAP properties handle_output shows for the same arguments, None when it writes whole records"""
+
+    f = f or (export.format_for(o) if o is not None else None) or ('json' if j else None)
+    if f == 'csv':
+        return list(export.COLUMN_ORDER)
+    if f is not None:
+        return None
+    return [k for k, v in config.table_schema.items() if not try_get('hide', v, False)]
+
+# Control characters, including ESC, are dropped so values can't inject terminal escapes
+CONTROL_CODES = dict.fromkeys([*range(32), 127])
+
+def compile_column(key: str, ref: dict) -> Callable[[Any], tuple[str, str]]:
+    """
+    Compile a table_schema entry into a function returning a record's
+    (text, style) for that column, so per-cell work is one lookup, one
+    transform and one dict get
+    """
+
+    attr = ATTRIBUTES.get(key)
+    get = attrgetter(attr) if attr is not None else None
+    transform = try_get('transform', ref, (lambda x: x if x is not None else ''))
+    column_style = try_get('style', ref) or ''
+    row_style = {k: f'{column_style} {v}'.strip() for k, v in try_get('row_style', ref, {}).items()}
+
+    def render(x) -> tuple[str, str]:
+        datum = get(x) if get is not None and type(x) is MaskedEmail else field_value(x, key)
+        return transform(datum).translate(CONTROL_CODES), row_style.get(datum, column_style)
+    return render
+
+def compile_schema(schema: dict) -> list[tuple[str, dict, Callable]]:
+    """(key, schema entry, renderer) for each visible column of schema"""
+
+    return [(k, v, compile_column(k, v)) for k, v in schema.items() if not try_get('hide', v, False)]
+
+def fit_cell(text: str, width: int) -> str:
+    """Pad text to width cells, or cut it with an ellipsis"""
+
+    from rich.cells import cell_len, set_cell_size
+
+    size = cell_len(text)
+    if size <= width:
+        return text + ' ' * (width - size)
+    return set_cell_size(text, width - 1) + '…'
+
+def fit_widths(widths: list[int], available: int, minimum: int = 3) -> list[int]:
+    """Narrow the widest columns first until widths fit in available cells"""
+
+    widths = list(widths)
+    excess = sum(widths) - available
+    while excess > 0:
+        widest = max(widths)
+        if widest <= minimum:
+            break
+        n = widths.index(widest)
+        widths[n] -= 1
+        excess -= 1
+    return widths
+
+def pager_console():
+    """
+    Console writing into $PAGER (less by default), or (None, None) if no
+    pager can be started
+
+    Returns (console, process). Rows are piped as they are rendered, so the
+    first page shows before the rest of the table is built.
+    """
+
+    import shlex
+    import shutil
+    import subprocess
+    from rich.console import Console
+
+    command = shlex.split(os.environ.get('PAGER') or 'less')
+    if len(command) == 0 or shutil.which(command[0]) is None:
+        return None, None
+
+    env = dict(os.environ)
+    env.setdefault('LESS', 'FRSX')
+    width = shutil.get_terminal_size().columns
+    proc = subprocess.Popen(command, stdin=subprocess.PIPE, env=env, text=True, encoding='utf-8')
+    return Console(file=proc.stdin, force_terminal=True, width=width), proc
 
 class PrettyTable():
-
-    def __init__(self, data_: list[dict], title: str | None = None):
-        self.table = Table(title=title, box=box.MINIMAL, header_style='italic')
-        self.generate_cols()
-        self.generate_rows(data_)
-
-    @staticmethod
-    def compute_style(datum: str, ref: dict) -> str:
-        style = try_get(
-            datum,
-            try_get(
-                'row_style',
-                ref,
-                {}
-            ),
-            ''
-        )
-        return f'[{style}]' if len(style) > 0 else style
-
-    @staticmethod
-    def compute_value(datum: Any, ref: dict) -> str:
-        return try_get(
-            'transform',
-            ref,
-            (lambda x: x.replace('[','\[') if x is not None else '') # escape brackets for Rich rendering
-        )(datum)
-
-    def generate_rows(self, data_: list[dict]) -> None:
+    """
+    Renders records as a table, streaming rows as they are formatted
+
+    The title and header are drawn by Rich. Rows are formatted by the
+    compiled column renderers into lines with each style's escape codes
+    looked up once, and written in chunks, so time to first row and memory
+    do not grow with the number of records. Column widths are measured on
+    the first measure rows; a longer value further down is cut with an
+    ellipsis.
+    """
+
+    def __init__(self, data_: Iterable[dict], title: str | None = None, schema: dict | None = None, measure: int = 1000, chunk_size: int = 200):
+        self.data = data_
+        self.title = title
+        self.columns = compile_schema(schema if schema is not None else config.table_schema)
+        self.measure = measure
+        self.chunk_size = chunk_size
+
+    def generate_rows(self, data_: Iterable[dict]) -> Iterator[list[tuple[str, str]]]:
+        renderers = [render for _, _, render in self.columns]
         for x in data_:
-            row = []
-            for k,v in config.table_schema.items():
-                if not try_get('hide',v,False):
-                    style = self.compute_style(x[k], v)
-                    value = self.compute_value(x[k], v)
-                    row.append(style + value)
-            self.table.add_row(*row)
-
-    def generate_cols(self) -> None:
-        for k,v in config.table_schema.items():
-            if not try_get('hide',v,False):
-                self.table.add_column(try_get('header',v,k), style=try_get('style',v), no_wrap=True)
-
-    def out(self) -> None:
-        console = Console()
-        print()
-        console.print(self.table)
+            yield [render(x) for render in renderers]
+
+    def generate_header(self, widths: list[int]):
+        """Rich table with the title and column headers, and no rows"""
+
+        from rich import box
+        from rich.table import Table
+
+        table = Table(title=self.title, box=box.MINIMAL, header_style='italic', show_edge=False)
+        for (k, v, _), width in zip(self.columns, widths):
+            table.add_column(try_get('header', v, k), width=width, no_wrap=True, overflow='ellipsis')
+        return table
+
+    def generate_lines(self, rows: Iterable[list[tuple[str, str]]], widths: list[int], console) -> Iterator[str]:
+        from rich.text import Text
+
+        codes = {}
+        def style_codes(style: str) -> tuple[str, str]:
+            if style not in codes:
+                with console.capture() as capture:
+                    console.print(Text('X', style=style), end='')
+                before, _, after = capture.get().partition('X')
+                codes[style] = (before, after)
+            return codes[style]
+
+        for row in rows:
+            cells = []
+            for (text, style), width in zip(row, widths):
+                before, after = style_codes(style)
+                cells.append(before + fit_cell(text, width) + after)
+            yield ' ' + ' │ '.join(cells) + ' '
+
+    def out(self, page: bool = False) -> None:
+        """Print the table, through the pager if page is set and stdout is a terminal"""
+
+        from rich.cells import cell_len
+        from rich.console import Console
+
+        console, proc = Console(), None
+        if page and console.is_terminal:
+            console, proc = pager_console()
+            console = console or Console()
+
+        rows = self.generate_rows(self.data)
+        head = list(islice(rows, self.measure))
+        widths = [len(try_get('header', v, k)) for k, v, _ in self.columns]
+        for row in head:
+            widths = [max(w, cell_len(text)) for w, (text, _) in zip(widths, row)]
+        # Each column is padded by a cell on both sides and separated by a rule
+        widths = fit_widths(widths, console.width - 3 * len(widths) + 1)
+
+        try:
+            console.print()
+            console.print(self.generate_header(widths))
+            lines = self.generate_lines(chain(head, rows), widths, console)
+            while chunk := list(islice(lines, self.chunk_size)):
+                console.file.write('\n'.join(chunk) + '\n')
+                console.file.flush()
+        except BrokenPipeError:
+            pass
+        finally:
+            if proc is not None:
+                try:
+                    proc.stdin.close()
+                except BrokenPipeError:
+                    pass
+                proc.wait()
@@ -0,0 +1,204 @@
+"""
+Live Masked Email changes from the JMAP event source
+
+A Watcher holds the session's eventSourceUrl open. When the server reports
+a new MaskedEmail state, only what changed since the last state seen is
+fetched, with MaskedEmail/changes, and turned into one event per Masked
+Email, which `fastmask watch` prints as ndjson::
+
+    {"type": "created", "id": "masked-123", "state": "42", "record": {"id": "masked-123", "email": "...", ...}}
+    {"type": "updated", "id": "masked-99", "state": "42", "record": {...}}
+    {"type": "destroyed", "id": "masked-7", "state": "42"}
+
+If the server can no longer calculate changes from that state, a reset
+event carries the new state and no records. Dropped connections are
+reopened with backoff, and changes made in between are still reported.
+"""
+
+from fastmask.masked_email import ChangesUnavailable
+
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator
+from urllib.parse import urlencode
+import json
+import requests
+import threading
+import urllib3
+
+if TYPE_CHECKING:
+    from fastmask.masked_email import MaskedMailClient
+
+DATA_TYPE = 'MaskedEmail'
+DEFAULT_PING = 30
+
+
+def event_source_url(session: dict, ping: int = DEFAULT_PING) -> str:
+    """
+    The session's event source URL for every type of change, without closing after
+    the first. Expands the RFC 8620 URL template, or adds the query string if it has none
+    """
+
+    url = session['eventSourceUrl']
+    params = {'types': '*', 'closeafter': 'no', 'ping': str(ping)}
+    if '{' in url:
+        for k, v in params.items():
+            url = url.replace(f'{{{k}}}', v)
+        return url
+    return f'{url}{"&" if "?" in url else "?"}{urlencode(params, safe="*")}'
+
+def read_events(lines: Iterable[bytes]) -> Iterator[tuple[str, str]]:
+    """Parse (event type, data) pairs from server-sent event stream lines"""
+
+    event, data = 'message', []
+    for line in lines:
+        line = line.decode('utf-8').rstrip('\r\n')
+        if line == '':
+            if data:
+                yield event, '\n'.join(data)
+            event, data = 'message', []
+            continue
+        if line.startswith(':'):
+            continue
+        field, _, value = line.partition(':')
+        value = value[1:] if value.startswith(' ') else value
+        if field == 'event':
+            event = value
+        elif field == 'data':
+            data.append(value)
+
+def change_events(page: dict) -> Iterator[dict]:
+    """One event per Masked Email in a page from MaskedMailClient.changes"""
+
+    state = page['newState']
+    for kind in ('created', 'updated'):
+        for record in page[kind]:
+            yield {'type': kind, 'id': record['id'], 'state': state, 'record': record}
+    for id_ in page['destroyed']:
+        yield {'type': 'destroyed', 'id': id_, 'state': state}
+
+
+class Watcher:
+    """
+    Follows changes to the Masked Emails of an account as they happen
+
+        watcher = Watcher(client)
+        for event in watcher.events():
+            print(event['type'], event['id'])
+
+    or with callbacks, on a background thread:
+
+        watcher = Watcher(client, callbacks=[print])
+        watcher.start()
+        ...
+        watcher.stop()
+    """
+
+    def __init__(self, client: 'MaskedMailClient', since_state: str | None = None, callbacks: list[Callable[[dict], None]] | None = None, ping: int = DEFAULT_PING, max_backoff: float = 60):
+        """
+        client: Client for the account to watch
+        since_state [optional]: Report changes after this MaskedEmail state. Defaults to the state when watching starts
+        callbacks [optional]: Called with each event by run and start
+        ping [optional]: Seconds between keep-alive pings requested from the server. A connection silent
+        for twice as long is considered dead and reopened
+        max_backoff [optional]: Longest wait in seconds before reconnecting after a failure
+        """
+
+        self.client = client
+        self.state = since_state
+        self.callbacks = list(callbacks or [])
+        self.ping = ping
+        self.max_backoff = max_backoff
+        self.stopped = threading.Event()
+        self._response = None
+
+    def subscribe(self, callback: Callable[[dict], None]) -> None:
+        self.callbacks.append(callback)
+
+    def catch_up(self) -> Iterator[dict]:
+        """Events for everything that changed since the last state seen"""
+
+        try:
+            for page in self.client.changes(self.state):
+                yield from change_events(page)
+                self.state = page['newState']
+        except ChangesUnavailable:
+            self.state = self.client.state()
+            yield {'type': 'reset', 'state': self.state}
+
+    def state_changed(self, data: str) -> bool:
+        try:
+            changed = json.loads(data).get('changed', {})
+        except (ValueError, AttributeError):
+            return False
+        state = changed.get(self.client.account_id, {}).get(DATA_TYPE)
+        return state is not None and state != self.state
+
+    def stream(self) -> Iterator[tuple[str, str]]:
+        """Open the event source, yielding its events until it closes"""
+
+        self._response = self.client.http.get(
+            event_source_url(self.client.session, self.ping),
+            headers={'Authorization': f'Bearer {self.client.token}', 'Accept': 'text/event-stream'},
+            stream=True,
+            timeout=(10, 2 * self.ping),
+        )
+        with self._response as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            yield from read_events(iter(response.raw.readline, b''))
+
+    def events(self) -> Iterator[dict]:
+        """
+        Yield change events until stop is called
+
+        Connection failures are retried with exponential backoff. HTTP
+        errors other than 429 and 5xx are raised.
+        """
+
+        if self.state is None:
+            self.state = self.client.state()
+
+        backoff, reconnecting = 1, False
+        while not self.stopped.is_set():
+            try:
+                if reconnecting:
+                    # Changes made while disconnected
+                    yield from self.catch_up()
+                reconnecting = True
+
+                for event, data in self.stream():
+                    backoff = 1
+                    if event == 'state' and self.state_changed(data):
+                        yield from self.catch_up()
+                    if self.stopped.is_set():
+                        return
+            except requests.HTTPError as e:
+                if e.response is None or (e.response.status_code != 429 and e.response.status_code < 500):
+                    raise
+            # Reading the stream raises urllib3's errors rather than requests'
+            except (requests.RequestException, urllib3.exceptions.HTTPError, OSError):
+                if self.stopped.is_set():
+                    return
+
+            self.stopped.wait(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    def run(self) -> None:
+        """Call every callback with each event until stop is called"""
+
+        for event in self.events():
+            for callback in self.callbacks:
+                callback(event)
+
+    def start(self) -> threading.Thread:
+        """Run in a background thread"""
+
+        thread = threading.Thread(target=self.run, name='fastmask-watch', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self) -> None:
+        """Stop watching, closing the event stream"""
+
+        self.stopped.set()
+        if self._response is not None:
+            self._response.close()
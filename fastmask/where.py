@@ -0,0 +1,218 @@
+"""
+Filter expressions for Masked Emails, as used by `fastmask list --where`
+
+An expression is compiled once into a single predicate over MaskedEmail
+records. Comparisons take the form ``field op value`` and can be combined
+with ``and``, ``or``, ``not`` and parentheses::
+
+    state = enabled and forDomain endswith .shop and (lastMessageAt is null or lastMessageAt < now-90d)
+
+Fields are JMAP property names (case-insensitive). Operators:
+
+- ``=``, ``!=``: exact match
+- ``<``, ``<=``, ``>``, ``>=``: ordering; never true for unset values
+- ``contains``, ``startswith``, ``endswith``: case-insensitive text match
+- ``~``: case-insensitive regular expression search
+- ``is null``, ``is empty`` (null or ''), and their ``is not`` forms
+
+Values may be quoted ('...' or "...") or bare words. For createdAt and
+lastMessageAt, values are dates (2024-01-31), timestamps
+(2024-01-31T12:00:00Z) or times relative to now (now, now-90d, now+2h;
+units s, m, h, d, w). A date stands for the whole day (UTC) when compared
+with ``=`` or ``!=``, and for its first second otherwise.
+"""
+
+from fastmask.record import ATTRIBUTES, DATE_FIELDS, parse_date
+
+from datetime import datetime, timezone, timedelta
+from typing import Callable
+import re
+
+FIELD_NAMES = {k.lower(): k for k in ATTRIBUTES}
+
+TEXT_OPERATORS = ('contains', 'startswith', 'endswith')
+COMPARISONS = ('=', '==', '!=', '<', '<=', '>', '>=', '~') + TEXT_OPERATORS
+
+UNITS = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days', 'w': 'weeks'}
+
+TOKEN = re.compile(r'''
+    \s*(?:
+        (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+      | (?P<op><=|>=|!=|==|=|<|>|~|\(|\))
+      | (?P<word>[^\s()'"<>=!~]+)
+    )''', re.VERBOSE)
+
+RELATIVE = re.compile(r'^now(?:([-+])(\d+(?:\.\d+)?)([smhdw]))?$')
+DAY = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+
+class WhereError(ValueError):
+    """Raised for a malformed filter expression"""
+
+
+def tokenize(expression: str) -> list[tuple[str, str]]:
+    tokens, pos = [], 0
+    expression = expression.rstrip()
+    while pos < len(expression):
+        m = TOKEN.match(expression, pos)
+        if m is None or m.end() == pos:
+            raise WhereError(f'Unexpected character at position {pos}: {expression[pos:pos+10]!r}')
+        kind = m.lastgroup
+        text = m.group(kind)
+        if kind == 'string':
+            text = re.sub(r'\\(.)', r'\1', text[1:-1])
+        tokens.append((kind, text))
+        pos = m.end()
+    return tokens
+
+
+def parse_date_value(text: str, now: datetime) -> datetime:
+    m = RELATIVE.match(text.lower())
+    if m is not None:
+        sign, amount, unit = m.groups()
+        if sign is None:
+            return now
+        delta = timedelta(**{UNITS[unit]: float(amount)})
+        return now - delta if sign == '-' else now + delta
+    try:
+        if DAY.match(text):
+            return datetime.strptime(text, '%Y-%m-%d')
+        return parse_date(text)
+    except ValueError:
+        raise WhereError(f'Expected a date, timestamp or now-<n><unit>, got {text!r}') from None
+
+
+class Compiler:
+    """Recursive descent parser emitting the source of one Python expression"""
+
+    def __init__(self, expression: str):
+        self.tokens = tokenize(expression)
+        self.pos = 0
+        self.constants = {}
+        self.fields = set()
+        self.now = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    def peek(self) -> tuple[str, str] | None:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def next(self, expected: str | None = None) -> tuple[str, str]:
+        token = self.peek()
+        if token is None:
+            raise WhereError('Unexpected end of expression' + (f', expected {expected!r}' if expected else ''))
+        if expected is not None and token[1].lower() != expected:
+            raise WhereError(f'Expected {expected!r}, got {token[1]!r}')
+        self.pos += 1
+        return token
+
+    def accept(self, keyword: str) -> bool:
+        token = self.peek()
+        if token is not None and token[0] != 'string' and token[1].lower() == keyword:
+            self.pos += 1
+            return True
+        return False
+
+    def constant(self, value) -> str:
+        name = f'_c{len(self.constants)}'
+        self.constants[name] = value
+        return name
+
+    def compile(self) -> str:
+        if len(self.tokens) == 0:
+            raise WhereError('Empty expression')
+        source = self.or_expr()
+        if self.peek() is not None:
+            raise WhereError(f'Unexpected {self.peek()[1]!r}')
+        return source
+
+    def or_expr(self) -> str:
+        parts = [self.and_expr()]
+        while self.accept('or'):
+            parts.append(self.and_expr())
+        return parts[0] if len(parts) == 1 else '(' + ' or '.join(parts) + ')'
+
+    def and_expr(self) -> str:
+        parts = [self.not_expr()]
+        while self.accept('and'):
+            parts.append(self.not_expr())
+        return parts[0] if len(parts) == 1 else '(' + ' and '.join(parts) + ')'
+
+    def not_expr(self) -> str:
+        if self.accept('not'):
+            return f'(not {self.not_expr()})'
+        if self.accept('('):
+            source = self.or_expr()
+            self.next(')')
+            return source
+        return self.comparison()
+
+    def comparison(self) -> str:
+        kind, text = self.next()
+        if kind != 'word':
+            raise WhereError(f'Expected a field name, got {text!r}')
+        field = FIELD_NAMES.get(text.lower())
+        if field is None:
+            raise WhereError(f'Unknown field {text!r}. Fields: {", ".join(ATTRIBUTES)}')
+        self.fields.add(field)
+        attr = f'x.{ATTRIBUTES[field]}'
+
+        if self.accept('is'):
+            negate = self.accept('not')
+            if self.accept('null'):
+                source = f'{attr} is None'
+            elif self.accept('empty'):
+                source = f'(not {attr})'
+            else:
+                raise WhereError(f'Expected null or empty after "{field} is"')
+            return f'(not {source})' if negate else source
+
+        kind, op = self.next()
+        op = op.lower()
+        if kind == 'string' or op not in COMPARISONS:
+            raise WhereError(f'Unknown operator {op!r}. Operators: {", ".join(COMPARISONS)}, is [not] null|empty')
+
+        kind, value = self.next()
+        if kind == 'op':
+            raise WhereError(f'Expected a value after "{field} {op}", got {value!r}')
+
+        if field in DATE_FIELDS:
+            if op in TEXT_OPERATORS or op == '~':
+                raise WhereError(f'{field} is a date and does not support {op!r}')
+            day = DAY.match(value) is not None
+            value = parse_date_value(value, self.now)
+            if day and op in ('=', '==', '!='):
+                start, end = self.constant(value), self.constant(value + timedelta(days=1))
+                source = f'({attr} is not None and {start} <= {attr} < {end})'
+                return f'(not {source})' if op == '!=' else source
+
+        if op in ('=', '=='):
+            return f'{attr} == {self.constant(value)}'
+        if op == '!=':
+            return f'{attr} != {self.constant(value)}'
+        if op == '~':
+            try:
+                pattern = re.compile(value, re.IGNORECASE)
+            except re.error as e:
+                raise WhereError(f'Invalid regular expression {value!r}: {e}') from None
+            return f'({attr} is not None and {self.constant(pattern)}.search({attr}) is not None)'
+        if op in TEXT_OPERATORS:
+            c = self.constant(value.lower())
+            if op == 'contains':
+                return f'({attr} is not None and {c} in {attr}.lower())'
+            return f'({attr} is not None and {attr}.lower().{op}({c}))'
+        return f'({attr} is not None and {attr} {op} {self.constant(value)})'
+
+
+def compile_where(expression: str) -> Callable:
+    """
+    Compile a filter expression into a predicate over MaskedEmail records.
+    The predicate's fields attribute holds the JMAP properties it reads
+
+    Raises WhereError if the expression is malformed.
+    """
+
+    compiler = Compiler(expression)
+    source = compiler.compile()
+    predicate = eval(f'lambda x: {source}', {'__builtins__': {}, **compiler.constants})
+    predicate.source = source
+    predicate.fields = frozenset(compiler.fields)
+    return predicate
@@ -22,11 +22,15 @@ setup(
         'requests',
         'python-dotenv',
         'rich',
-        'pandas',
     ],
+    extras_require={
+        'async': ['httpx'],
+        'pandas': ['pandas'],
+        'fast': ['orjson', 'brotli'],
+    },
     entry_points={
         'console_scripts': [
-            'fastmask = fastmask.cli:cli',
+            'fastmask = fastmask.__main__:main',
         ],
     },
 )
\ No newline at end of file
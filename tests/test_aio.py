@@ -0,0 +1,46 @@
+from pathlib import Path
+import asyncio
+import sys
+import pytest
+
+httpx = pytest.importorskip('httpx')
+
+from fastmask.aio import AsyncMaskedMailClient  # noqa: E402
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'benchmarks'))
+from fake_server import FakeJMAP, FakeServer  # noqa: E402
+
+
+class MovingSession(FakeJMAP):
+    """A FakeJMAP whose session state can be moved on, counting session fetches"""
+
+    session_state = 'session-1'
+    fetches = 0
+
+    def session(self, base_url: str) -> dict:
+        self.fetches += 1
+        return {**super().session(base_url), 'state': self.session_state}
+
+    def api(self, request: dict) -> dict:
+        return {**super().api(request), 'sessionState': self.session_state}
+
+
+def test_session_change_refetches_once(tmp_path, monkeypatch):
+    monkeypatch.setenv('FASTMASK_CACHE_DIR', str(tmp_path))
+    jmap = MovingSession(size=50)
+    ids = list(jmap.objects)
+
+    async def run():
+        async with AsyncMaskedMailClient('u', 't', session_url=server.session_url, cache_session=False) as client:
+            assert jmap.fetches == 1
+            jmap.session_state = 'session-2'
+
+            # Each id in its own call, all seeing the new sessionState at about the same time
+            results = await asyncio.gather(*(client.get(ids=[id_]) for id_ in ids[:8]))
+
+            assert [x[0]['id'] for x in results] == ids[:8]
+            assert client.session['state'] == 'session-2'
+            assert jmap.fetches == 2
+
+    with FakeServer(jmap) as server:
+        asyncio.run(run())
@@ -0,0 +1,70 @@
+from fastmask.cache import SessionCache, account_key, read_json, write_json
+
+import os
+import stat
+import time
+import pytest
+
+SESSION = {'apiUrl': 'https://api.example/jmap/api/', 'primaryAccounts': {'urn:ietf:params:jmap:core': 'u1'}}
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv('FASTMASK_CACHE_DIR', str(tmp_path / 'cache'))
+    return tmp_path / 'cache'
+
+
+def test_round_trip(cache_dir):
+    cache = SessionCache('user', 'token')
+    assert cache.load() is None
+
+    cache.save(SESSION)
+    assert cache.load() == SESSION
+    assert cache.path.parent == cache_dir
+
+
+def test_ttl(monkeypatch):
+    cache = SessionCache('user', 'token', ttl=60)
+    cache.save(SESSION)
+
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 59)
+    assert cache.load() == SESSION
+    monkeypatch.setattr(time, 'time', lambda: now + 61)
+    assert cache.load() is None
+
+
+def test_keyed_by_token():
+    SessionCache('user', 'token').save(SESSION)
+
+    assert SessionCache('user', 'other').load() is None
+    assert 'token' not in SessionCache('user', 'token').path.name
+    assert account_key('user', 'token') != account_key('user', 'other')
+
+
+def test_clear():
+    cache = SessionCache('user', 'token')
+    cache.save(SESSION)
+    cache.clear()
+    cache.clear()
+
+    assert cache.load() is None
+
+
+def test_private_files(cache_dir):
+    cache = SessionCache('user', 'token')
+    cache.save(SESSION)
+
+    assert stat.S_IMODE(os.stat(cache.path).st_mode) == 0o600
+    assert stat.S_IMODE(os.stat(cache_dir).st_mode) == 0o700
+    assert [p.name for p in cache_dir.iterdir()] == [cache.path.name]
+
+
+def test_unreadable(cache_dir):
+    cache = SessionCache('user', 'token')
+    cache.path.write_text('{"fetched_at": ')
+    assert cache.load() is None
+
+    write_json(cache.path, ['not', 'a', 'session'])
+    assert read_json(cache.path) == ['not', 'a', 'session']
+    assert cache.load() is None
@@ -0,0 +1,37 @@
+from fastmask.masked_email import MaskedMailClient
+
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'benchmarks'))
+from fake_server import FakeJMAP, FakeServer  # noqa: E402
+
+
+class MovingSession(FakeJMAP):
+    """A FakeJMAP whose session state can be moved on, counting session fetches"""
+
+    session_state = 'session-1'
+    fetches = 0
+
+    def session(self, base_url: str) -> dict:
+        self.fetches += 1
+        return {**super().session(base_url), 'state': self.session_state}
+
+    def api(self, request: dict) -> dict:
+        return {**super().api(request), 'sessionState': self.session_state}
+
+
+def test_session_change_refetches_once(tmp_path, monkeypatch):
+    monkeypatch.setenv('FASTMASK_CACHE_DIR', str(tmp_path))
+    # One id per request, so a get is split across the thread pool
+    jmap = MovingSession(size=40, latency=0.02, limits={'maxObjectsInGet': 1, 'maxCallsInRequest': 1})
+    ids = list(jmap.objects)
+
+    with FakeServer(jmap) as server:
+        client = MaskedMailClient('u', 't', session_url=server.session_url, cache_session=False)
+        assert jmap.fetches == 1
+        jmap.session_state = 'session-2'
+
+        assert [x.id for x in client.get(ids=ids[:8], sort_by=None)] == ids[:8]
+        assert client.session['state'] == 'session-2'
+        assert jmap.fetches == 2
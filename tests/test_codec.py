@@ -0,0 +1,58 @@
+from fastmask.codec import STDLIB, accept_encoding, get_codec
+
+import builtins
+import pytest
+
+VALUE = {'methodCalls': [['MaskedEmail/get', {'ids': None, 'description': 'Café ☕'}, '0']]}
+
+
+@pytest.fixture
+def no_orjson(monkeypatch):
+    real_import = builtins.__import__
+
+    def fake_import(name, *args, **kwargs):
+        if name == 'orjson':
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, '__import__', fake_import)
+
+
+def test_stdlib():
+    codec = get_codec('json')
+
+    assert codec is STDLIB
+    assert codec.loads(codec.dumps(VALUE)) == VALUE
+    assert b' ' not in codec.dumps({'a': [1, 2]})
+
+
+def test_default_prefers_orjson():
+    pytest.importorskip('orjson')
+    codec = get_codec()
+
+    assert codec.name == 'orjson'
+    assert codec.loads(codec.dumps(VALUE)) == VALUE
+
+
+def test_default_falls_back(no_orjson):
+    assert get_codec() is STDLIB
+
+
+def test_orjson_required(no_orjson):
+    with pytest.raises(ImportError, match='pip install'):
+        get_codec('orjson')
+
+
+def test_unknown():
+    with pytest.raises(ValueError, match='Unknown JSON codec'):
+        get_codec('yaml')
+
+
+def test_accept_encoding(monkeypatch):
+    import importlib.util
+
+    monkeypatch.setattr(importlib.util, 'find_spec', lambda name: None)
+    assert accept_encoding() == 'gzip'
+
+    monkeypatch.setattr(importlib.util, 'find_spec', lambda name: object() if name == 'brotli' else None)
+    assert accept_encoding() == 'br, gzip'
@@ -0,0 +1,107 @@
+from fastmask import cli
+from fastmask.daemon import Daemon, caller_env, environment, forward
+
+from types import SimpleNamespace
+import json
+import os
+import socket
+import tempfile
+import threading
+import pytest
+
+
+@pytest.fixture
+def caller(tmp_path, monkeypatch):
+    """A working directory with a .env, and an environment without FM_* variables"""
+
+    for k in list(os.environ):
+        if k.startswith('FM_'):
+            monkeypatch.delenv(k)
+    monkeypatch.delenv('SKIP_PYTHONDOTENV', raising=False)
+    (tmp_path / '.env').write_text('FM_USERNAME=dotenv@fastmail.com\nFM_ME_TOKEN=dotenv-token\nOTHER=1\n')
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def listener():
+    """A socket answering one request, which it keeps"""
+
+    directory = tempfile.mkdtemp(prefix='fm')
+    path = os.path.join(directory, 'serve.sock')
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+    received = []
+
+    def answer():
+        conn, _ = server.accept()
+        with conn, conn.makefile('rb') as fh:
+            received.append(json.loads(fh.readline()))
+            conn.sendall(json.dumps({'exit': 0, 'stdout': '', 'stderr': ''}).encode() + b'\n')
+
+    thread = threading.Thread(target=answer, daemon=True)
+    thread.start()
+    yield path, received
+    thread.join(5)
+    server.close()
+    os.unlink(path)
+    os.rmdir(directory)
+
+
+def test_caller_env_reads_dotenv(caller):
+    env = caller_env({'TERM': 'xterm', 'HOME': '/home/me'})
+    assert env == {'TERM': 'xterm', 'FM_USERNAME': 'dotenv@fastmail.com', 'FM_ME_TOKEN': 'dotenv-token'}
+
+
+def test_caller_env_prefers_environment(caller):
+    env = caller_env({'FM_USERNAME': 'shell@fastmail.com'})
+    assert env['FM_USERNAME'] == 'shell@fastmail.com'
+    assert env['FM_ME_TOKEN'] == 'dotenv-token'
+
+
+def test_caller_env_skip_dotenv(caller):
+    assert caller_env({'SKIP_PYTHONDOTENV': '1'}) == {}
+
+
+def test_forward_sends_dotenv(caller, listener, monkeypatch):
+    monkeypatch.delenv('FASTMASK_NO_DAEMON', raising=False)
+    path, received = listener
+
+    assert forward(['list'], path=path) == 0
+    assert received[0]['cwd'] == str(caller)
+    assert received[0]['env']['FM_USERNAME'] == 'dotenv@fastmail.com'
+    assert received[0]['env']['FM_ME_TOKEN'] == 'dotenv-token'
+
+
+def test_run_uses_only_callers_variables(monkeypatch, tmp_path):
+    # The daemon was started for another account, with a variable the caller doesn't set
+    monkeypatch.setenv('FM_USERNAME', 'daemon@fastmail.com')
+    monkeypatch.setenv('FM_ME_TOKEN', 'daemon-token')
+    monkeypatch.setenv('FM_SESSION_URL', 'http://daemon.example/.well-known/jmap')
+    seen = {}
+
+    def main(args, prog_name, color):
+        seen.update({k: os.environ.get(k) for k in ('FM_USERNAME', 'FM_ME_TOKEN', 'FM_SESSION_URL')})
+        seen['cwd'] = os.getcwd()
+
+    monkeypatch.setattr(cli.cli, 'main', main)
+    daemon = Daemon(SimpleNamespace(), path=str(tmp_path / 'serve.sock'))
+    response = daemon.run({'argv': ['list'], 'cwd': str(tmp_path), 'env': {'FM_USERNAME': 'caller@fastmail.com', 'FM_ME_TOKEN': 'caller-token'}})
+
+    assert response['exit'] == 0
+    assert seen == {'FM_USERNAME': 'caller@fastmail.com', 'FM_ME_TOKEN': 'caller-token', 'FM_SESSION_URL': None, 'cwd': str(tmp_path)}
+    assert os.environ['FM_USERNAME'] == 'daemon@fastmail.com'
+    assert os.environ['FM_SESSION_URL'] == 'http://daemon.example/.well-known/jmap'
+
+
+def test_environment_restores(monkeypatch, tmp_path):
+    monkeypatch.setenv('FM_A', 'a')
+    monkeypatch.delenv('FM_B', raising=False)
+
+    with environment({'FM_A': None, 'FM_B': 'b'}, str(tmp_path)):
+        assert 'FM_A' not in os.environ
+        assert os.environ['FM_B'] == 'b'
+
+    assert os.environ['FM_A'] == 'a'
+    assert 'FM_B' not in os.environ
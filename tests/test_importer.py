@@ -0,0 +1,111 @@
+from fastmask.importer import import_masked_emails, load_checkpoint, row_properties
+
+import json
+import pytest
+
+
+class StubClient:
+    """Creates every row in batches of batch_size, failing the rows listed in fail"""
+
+    def __init__(self, fail: set[int] = frozenset(), stop_after: int | None = None):
+        self.fail = fail
+        self.stop_after = stop_after
+        self.sent = []
+
+    def new_stream(self, rows, batch_size=None):
+        rows = list(rows)
+        for i in range(0, len(rows), batch_size or 2):
+            if self.stop_after is not None and i // (batch_size or 2) == self.stop_after:
+                raise ConnectionError('interrupted')
+            response = {'created': {}, 'notCreated': {}}
+            for key, props in rows[i:i + (batch_size or 2)]:
+                self.sent.append((key, props))
+                n = int(key[len('row-'):])
+                if n in self.fail:
+                    response['notCreated'][key] = {'type': 'invalidProperties'}
+                else:
+                    response['created'][key] = {'id': f'masked-{n}', 'email': f'row{n}@fastmail.com'}
+            yield response
+
+
+def results(path) -> list[dict]:
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'aliases.csv'
+    path.write_text(
+        'email,description,url,forDomain,state\n'
+        'old1@fastmail.com,Shop,https://shop.example,,enabled\n'
+        'old2@fastmail.com,Bank,,https://bank.example,\n'
+        'old3@fastmail.com,News,,,disabled\n'
+        'old4@fastmail.com,Forum,,,\n'
+        'old5@fastmail.com,Games,,,\n'
+    )
+    return path
+
+
+def test_row_properties():
+    assert row_properties({'email': 'x@fastmail.com', 'description': 'Shop', 'url': '', 'forDomain': '', 'state': ''}) == {'description': 'Shop', 'forDomain': ''}
+    assert row_properties({'description': 'Shop', 'url': None, 'emailPrefix': 'shop', 'id': 'masked-1'}) == {'description': 'Shop', 'emailPrefix': 'shop'}
+
+
+def test_import(source, tmp_path):
+    client = StubClient(fail={3})
+    summaries = list(import_masked_emails(client, str(source), batch_size=2))
+
+    assert [s['created'] for s in summaries] == [2, 1, 1]
+    assert summaries[-1]['totals'] == {'created': 4, 'failed': 1, 'skipped': 0}
+    assert client.sent[0] == ('row-1', {'description': 'Shop', 'url': 'https://shop.example', 'forDomain': '', 'state': 'enabled'})
+
+    lines = results(tmp_path / 'aliases.csv.results.ndjson')
+    assert [x['row'] for x in lines] == [1, 2, 3, 4, 5]
+    assert lines[0] == {'row': 1, 'id': 'masked-1', 'email': 'row1@fastmail.com', 'description': 'Shop'}
+    assert lines[2] == {'row': 3, 'error': {'type': 'invalidProperties'}}
+
+
+def test_resume(source, tmp_path):
+    with pytest.raises(ConnectionError):
+        list(import_masked_emails(StubClient(stop_after=1), str(source), batch_size=2))
+    assert load_checkpoint(str(tmp_path / 'aliases.csv.results.ndjson')) == {1, 2}
+
+    client = StubClient()
+    summaries = list(import_masked_emails(client, str(source), batch_size=2))
+
+    assert [key for key, _ in client.sent] == ['row-3', 'row-4', 'row-5']
+    assert summaries[-1]['totals'] == {'created': 3, 'failed': 0, 'skipped': 2}
+    assert [x['row'] for x in results(tmp_path / 'aliases.csv.results.ndjson')] == [1, 2, 3, 4, 5]
+
+
+def test_failed_rows_are_retried(source, tmp_path):
+    list(import_masked_emails(StubClient(fail={2}), str(source), batch_size=5))
+    client = StubClient()
+    list(import_masked_emails(client, str(source), batch_size=5))
+
+    assert [key for key, _ in client.sent] == ['row-2']
+
+
+def test_checkpoint_ignores_cut_line(tmp_path):
+    path = tmp_path / 'results.ndjson'
+    path.write_text('{"row": 1, "id": "masked-1"}\n{"row": 2, "error": {}}\n{"row": 3, "id": "mas')
+
+    assert load_checkpoint(str(path)) == {1}
+    assert load_checkpoint(str(tmp_path / 'missing.ndjson')) == set()
+
+
+def test_ndjson_source(tmp_path):
+    path = tmp_path / 'aliases.ndjson'
+    path.write_text('{"description": "Shop", "url": null}\n\n{"description": "Bank", "state": "disabled"}\n')
+    client = StubClient()
+    list(import_masked_emails(client, str(path), results=str(tmp_path / 'out.ndjson')))
+
+    assert client.sent == [('row-1', {'description': 'Shop'}), ('row-2', {'description': 'Bank', 'state': 'disabled'})]
+
+
+def test_unknown_format(tmp_path):
+    path = tmp_path / 'aliases.txt'
+    path.write_text('')
+
+    with pytest.raises(ValueError):
+        list(import_masked_emails(StubClient(), str(path)))
@@ -0,0 +1,95 @@
+from fastmask.index import IdIndex
+from fastmask.masked_email import MaskedMailClient
+
+from pathlib import Path
+import json
+import pytest
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'benchmarks'))
+from fake_server import FakeJMAP, FakeServer  # noqa: E402
+
+RECORDS = [
+    {'id': 'masked-101', 'email': 'shop.1@fastmail.com', 'description': 'Shop'},
+    {'id': 'masked-102', 'email': 'shop.2@fastmail.com', 'description': 'shop'},
+    {'id': 'masked-103', 'email': 'bank@fastmail.com', 'description': 'Bank'},
+    {'id': 'masked-104', 'email': 'blank@fastmail.com', 'description': None},
+]
+
+
+@pytest.fixture
+def index() -> IdIndex:
+    return IdIndex.build(RECORDS, 's1')
+
+
+@pytest.mark.parametrize('key, expected', [
+    ('masked-101', ['masked-101']),
+    ('masked-999', []),
+    ('103', ['masked-103']),
+    ('999', []),
+    ('bank@fastmail.com', ['masked-103']),
+    ('other@fastmail.com', []),
+    ('BANK', ['masked-103']),
+    ('nothing', []),
+])
+def test_resolve(index, key, expected):
+    assert index.resolve(key) == expected
+
+
+def test_ambiguous_description(index):
+    # Descriptions are matched case-insensitively, so both shops match
+    assert index.resolve('Shop') == ['masked-101', 'masked-102']
+    assert index.resolve('SHOP') == ['masked-101', 'masked-102']
+
+
+def test_resolve_does_not_leak(index):
+    index.resolve('shop').append('masked-999')
+    assert index.resolve('shop') == ['masked-101', 'masked-102']
+
+
+def test_save_and_load(index, tmp_path):
+    path = tmp_path / 'index.json'
+    index.save(path)
+    loaded = IdIndex.load(path)
+
+    assert loaded.state == 's1'
+    assert loaded.ids == index.ids
+    for key in ('masked-101', '102', 'bank@fastmail.com', 'shop', ''):
+        assert loaded.resolve(key) == index.resolve(key)
+
+
+def test_load_missing(tmp_path):
+    assert IdIndex.load(tmp_path / 'missing.json') is None
+
+
+def test_load_other_format(index, tmp_path):
+    path = tmp_path / 'index.json'
+    index.save(path)
+    data = json.loads(path.read_text())
+
+    path.write_text(json.dumps({**data, 'version': 0}))
+    assert IdIndex.load(path) is None
+
+    del data['email']
+    path.write_text(json.dumps(data))
+    assert IdIndex.load(path) is None
+
+
+@pytest.mark.parametrize('cache_index', [True, False])
+def test_client_index_cache(tmp_path, monkeypatch, cache_index):
+    cache = tmp_path / 'cache'
+    monkeypatch.setenv('FASTMASK_CACHE_DIR', str(cache))
+    jmap = FakeJMAP(size=20)
+    x = next(iter(jmap.objects.values()))
+
+    with FakeServer(jmap) as server:
+        client = MaskedMailClient('u', 't', session_url=server.session_url, cache_session=False, cache_index=cache_index)
+        assert client.resolve(x['email']) == [x['id']]
+        assert client.resolve(x['id']) == [x['id']]
+
+    if cache_index:
+        assert [p.name for p in cache.iterdir()] == [client.index_path.name]
+    else:
+        # Nothing about the account is written, and the cache dir isn't even created
+        assert client.index_path is None
+        assert not cache.exists()
@@ -0,0 +1,70 @@
+from fastmask.mirror import Mirror
+
+import pytest
+
+RECORDS = [
+    {'id': 'masked-1', 'email': 'one@fastmail.com', 'description': 'Shop', 'state': 'enabled'},
+    {'id': 'masked-2', 'email': 'two@fastmail.com', 'description': 'Bank', 'state': 'disabled'},
+    {'id': 'masked-3', 'email': 'three@fastmail.com', 'description': 'Café ☕', 'state': 'enabled'},
+]
+
+
+@pytest.fixture
+def mirror(tmp_path) -> Mirror:
+    mirror = Mirror(tmp_path / 'mirror.sqlite')
+    yield mirror
+    mirror.close()
+
+
+def test_empty(mirror):
+    assert mirror.state is None
+    assert mirror.records() == []
+
+
+def test_replace(mirror):
+    mirror.replace(RECORDS, 's1')
+    assert mirror.state == 's1'
+    assert mirror.records() == RECORDS
+
+    mirror.replace(RECORDS[:1], 's2')
+    assert mirror.state == 's2'
+    assert mirror.records() == RECORDS[:1]
+
+
+def test_apply(mirror):
+    mirror.replace(RECORDS, 's1')
+    mirror.apply(
+        changed=[{**RECORDS[0], 'state': 'disabled'}, {'id': 'masked-4', 'email': 'four@fastmail.com', 'description': '', 'state': 'pending'}],
+        destroyed=['masked-2', 'masked-missing'],
+        state='s2',
+    )
+
+    assert mirror.state == 's2'
+    assert [x['id'] for x in mirror.records()] == ['masked-1', 'masked-3', 'masked-4']
+    assert mirror.records(['masked-1'])[0]['state'] == 'disabled'
+
+
+def test_records_by_id(mirror):
+    mirror.replace(RECORDS, 's1')
+
+    assert [x['id'] for x in mirror.records(['masked-3', 'masked-9', 'masked-1'])] == ['masked-3', 'masked-1']
+    assert mirror.records([]) == []
+
+
+def test_persists(tmp_path):
+    mirror = Mirror(tmp_path / 'mirror.sqlite')
+    mirror.replace(RECORDS, 's1')
+    mirror.close()
+
+    mirror = Mirror(tmp_path / 'mirror.sqlite')
+    assert mirror.state == 's1'
+    assert mirror.records() == RECORDS
+    mirror.close()
+
+
+def test_clear(mirror):
+    mirror.replace(RECORDS, 's1')
+    mirror.clear()
+
+    assert mirror.state is None
+    assert mirror.records() == []
@@ -0,0 +1,101 @@
+from fastmask.masked_email import MaskedMailClient
+from fastmask.prune import Plan
+from fastmask.record import MaskedEmail
+
+from pathlib import Path
+import pytest
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'benchmarks'))
+from fake_server import FakeJMAP, FakeServer  # noqa: E402
+
+RULES = [
+    ('delete', 'state = disabled and lastMessageAt is null'),
+    ('block', 'state = enabled and createdBy = 1Password'),
+]
+
+
+def record(id_: str, **kwargs) -> MaskedEmail:
+    return MaskedEmail.from_dict({
+        'id': id_,
+        'email': f'{id_}@fastmail.com',
+        'state': 'enabled',
+        'createdAt': '2024-01-01T00:00:00Z',
+        'lastMessageAt': None,
+        'createdBy': 'fastmask',
+        **kwargs,
+    })
+
+
+def test_scan():
+    plan = Plan(RULES, 's1').scan([
+        record('a', state='disabled'),
+        record('b', createdBy='1Password'),
+        record('c'),
+        record('d', state='deleted'),
+        record('e', state='disabled', lastMessageAt='2024-02-01T00:00:00Z'),
+    ])
+
+    assert {x.id: x['action'] for x in plan} == {'a': 'delete', 'b': 'block'}
+    assert plan.counts() == {'delete': 1, 'block': 1}
+    assert plan.batch(10) == {'a': {'state': 'deleted'}, 'b': {'state': 'disabled'}}
+    assert plan.batch(1) == {'a': {'state': 'deleted'}}
+
+
+def test_first_rule_wins():
+    plan = Plan([('block', 'createdBy = 1Password'), ('delete', 'state = enabled')], 's1')
+    plan.scan([record('a', createdBy='1Password'), record('b')])
+
+    assert {x.id: x['action'] for x in plan} == {'a': 'block', 'b': 'delete'}
+
+
+def test_already_in_state():
+    # A disabled Masked Email matching a block rule is left alone, not passed on to later rules
+    plan = Plan([('block', 'createdBy = 1Password'), ('delete', 'createdBy = 1Password')], 's1')
+    plan.scan([record('a', state='disabled', createdBy='1Password')])
+
+    assert len(plan) == 0
+
+
+def test_unknown_action():
+    with pytest.raises(ValueError, match='Unknown prune action'):
+        Plan([('archive', 'state = enabled')], 's1')
+
+
+def test_replan():
+    plan = Plan(RULES, 's1').scan([record('a', createdBy='1Password'), record('b', createdBy='1Password'), record('c')])
+    plan.replan([
+        {'newState': 's2', 'created': [], 'updated': [record('a', createdBy='fastmask').to_dict()], 'destroyed': ['b']},
+        {'newState': 's3', 'created': [record('d', state='disabled').to_dict()], 'updated': [], 'destroyed': []},
+    ])
+
+    assert plan.state == 's3'
+    assert {x.id: x['action'] for x in plan} == {'d': 'delete'}
+
+
+def test_prune_replans_on_conflict(tmp_path, monkeypatch):
+    monkeypatch.setenv('FASTMASK_CACHE_DIR', str(tmp_path))
+    jmap = FakeJMAP(size=300, limits={'maxObjectsInSet': 25})
+
+    with FakeServer(jmap) as server:
+        client = MaskedMailClient('u', 't', session_url=server.session_url, cache_session=False)
+        plan = client.plan_prune(RULES)
+        planned = {x.id for x in plan}
+        assert planned and plan.state == jmap.state
+
+        # Another client takes one Masked Email out of the plan and brings a new one into it
+        leaving = next(iter(planned))
+        joining = next(k for k, v in jmap.objects.items() if v['state'] == 'enabled' and v['createdBy'] != '1Password')
+        jmap.api({'methodCalls': [['MaskedEmail/set', {'update': {
+            leaving: {'createdBy': 'fastmask', 'state': 'enabled', 'lastMessageAt': None},
+            joining: {'createdBy': '1Password'},
+        }}, '0']]})
+
+        result = client.prune(plan)
+
+    assert result['replans'] == 1
+    assert len(plan) == 0
+    assert set(result['updated']) == planned - {leaving} | {joining}
+    assert jmap.objects[leaving]['state'] == 'enabled'
+    assert jmap.objects[joining]['state'] == 'disabled'
+    assert sum(result['applied'].values()) == len(result['updated'])
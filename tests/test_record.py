@@ -0,0 +1,102 @@
+from fastmask.record import FIELDS, MaskedEmail, field_value
+
+from datetime import datetime
+import json
+
+JMAP = {
+    'id': 'masked-1',
+    'email': 'shop.abc@fastmail.com',
+    'description': 'Shop',
+    'state': 'enabled',
+    'url': None,
+    'forDomain': 'https://shop.example',
+    'createdAt': '2024-01-31T12:00:00Z',
+    'lastMessageAt': None,
+    'createdBy': 'fastmask',
+}
+
+
+def test_from_dict():
+    x = MaskedEmail.from_dict(JMAP)
+
+    assert x.id == 'masked-1'
+    assert x.for_domain == 'https://shop.example'
+    assert x.created_at == datetime(2024, 1, 31, 12, 0, 0)
+    assert x.last_message_at is None
+    assert MaskedEmail.from_dict(x) is x
+
+
+def test_dict_view():
+    x = MaskedEmail.from_dict(JMAP)
+
+    assert x['createdAt'] == '2024-01-31T12:00:00Z'
+    assert x.get('url') is None
+    assert x.get('missing', 'default') == 'default'
+    assert list(x) == list(FIELDS)
+    assert dict(x) == JMAP
+    assert x.to_dict() == JMAP
+    assert json.loads(json.dumps(x.to_dict())) == JMAP
+    assert len(x) == len(FIELDS)
+    assert 'forDomain' in x and 'missing' not in x
+
+
+def test_equality_with_dict():
+    x = MaskedEmail.from_dict(JMAP)
+
+    assert x == JMAP
+    assert JMAP == x
+    assert x == MaskedEmail.from_dict(dict(JMAP))
+    assert x != {**JMAP, 'state': 'disabled'}
+    assert x != 'masked-1'
+
+
+def test_extra_keys():
+    x = MaskedEmail.from_dict({**JMAP, 'account': 'u'})
+
+    assert x['account'] == 'u'
+    assert list(x)[-1] == 'account'
+    assert x == {**JMAP, 'account': 'u'}
+
+
+def test_setitem():
+    x = MaskedEmail.from_dict(JMAP)
+    x['lastMessageAt'] = '2024-02-01T00:00:00Z'
+    x['state'] = 'disabled'
+    x['note'] = 'kept'
+
+    assert x.last_message_at == datetime(2024, 2, 1)
+    assert x['lastMessageAt'] == '2024-02-01T00:00:00Z'
+    assert x.state == 'disabled'
+    assert x['note'] == 'kept'
+
+
+def test_fractional_seconds():
+    x = MaskedEmail.from_dict({**JMAP, 'createdAt': '2024-01-31T12:00:00.123Z'})
+    assert x.created_at == datetime(2024, 1, 31, 12, 0, 0)
+
+
+def test_field_value():
+    x = MaskedEmail.from_dict(JMAP)
+
+    assert field_value(x, 'createdAt') == datetime(2024, 1, 31, 12, 0, 0)
+    assert field_value(JMAP, 'createdAt') == '2024-01-31T12:00:00Z'
+
+
+def test_copy():
+    x = MaskedEmail.from_dict({**JMAP, 'note': 'original'})
+    y = x.copy()
+    y['account'] = 'u'
+    y['state'] = 'disabled'
+
+    assert y == {**JMAP, 'note': 'original', 'state': 'disabled', 'account': 'u'}
+    assert x == {**JMAP, 'note': 'original'}
+
+
+def test_hashable():
+    x = MaskedEmail.from_dict(JMAP)
+    y = MaskedEmail.from_dict(dict(JMAP))
+
+    assert hash(x) == hash(y)
+    assert {x, y} == {x}
+    assert {x: 1}[y] == 1
+    assert len({x, MaskedEmail.from_dict({**JMAP, 'id': 'masked-2'})}) == 2
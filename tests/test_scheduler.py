@@ -0,0 +1,167 @@
+from fastmask import scheduler
+from fastmask.scheduler import RequestScheduler, is_idempotent, retry_after
+
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+import pytest
+
+
+class Response:
+    def __init__(self, status_code: int, headers: dict | None = None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.closed = False
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class Stub:
+    """request() returning the given responses in turn, raising those that are exceptions"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def __call__(self):
+        response = self.responses[min(self.calls, len(self.responses) - 1)]
+        self.calls += 1
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+@pytest.fixture(autouse=True)
+def sleeps(monkeypatch) -> list[float]:
+    slept = []
+    monkeypatch.setattr(scheduler.time, 'sleep', slept.append)
+    return slept
+
+
+def call(*methods) -> dict:
+    return {'methodCalls': [[name, args, str(n)] for n, (name, args) in enumerate(methods)]}
+
+
+@pytest.mark.parametrize('request_, expected', [
+    (call(('MaskedEmail/get', {'ids': None})), True),
+    (call(('MaskedEmail/changes', {'sinceState': '1'}), ('MaskedEmail/get', {'#ids': {}})), True),
+    (call(('MaskedEmail/set', {'update': {'masked-1': {'state': 'disabled'}}})), True),
+    (call(('MaskedEmail/set', {'destroy': ['masked-1']})), True),
+    (call(('MaskedEmail/set', {'create': {'new': {'description': 'Shop'}}})), False),
+    (call(('MaskedEmail/get', {}), ('MaskedEmail/set', {'create': {'new': {}}, 'update': {}})), False),
+    (call(('Core/echo', {})), False),
+    ({}, True),
+])
+def test_is_idempotent(request_, expected):
+    assert is_idempotent(request_) is expected
+
+
+def test_retry_after_seconds():
+    assert retry_after({'Retry-After': '3'}) == 3.0
+    assert retry_after({'Retry-After': '0.5'}) == 0.5
+    assert retry_after({'Retry-After': '-2'}) == 0.0
+    assert retry_after({}) is None
+    assert retry_after({'Retry-After': 'soon'}) is None
+
+
+def test_retry_after_date():
+    later = datetime.now(timezone.utc) + timedelta(seconds=30)
+    assert 28 <= retry_after({'Retry-After': format_datetime(later, usegmt=True)}) <= 30
+
+    earlier = datetime.now(timezone.utc) - timedelta(seconds=30)
+    assert retry_after({'Retry-After': format_datetime(earlier, usegmt=True)}) == 0.0
+
+
+def test_success():
+    request = Stub(Response(200))
+    response = RequestScheduler().send(request)
+
+    assert response.status_code == 200
+    assert response.fastmask_retries == 0
+    assert request.calls == 1
+
+
+@pytest.mark.parametrize('idempotent', [True, False])
+def test_retries_503(idempotent):
+    request = Stub(Response(503), Response(503), Response(200))
+    response = RequestScheduler(backoff=0.01).send(request, idempotent=idempotent)
+
+    assert response.status_code == 200
+    assert response.fastmask_retries == 2
+    assert request.calls == 3
+
+
+def test_retries_500_if_idempotent():
+    request = Stub(Response(500), Response(200))
+    assert RequestScheduler(backoff=0.01).send(request, idempotent=True).status_code == 200
+    assert request.calls == 2
+
+    request = Stub(Response(500), Response(200))
+    response = RequestScheduler(backoff=0.01).send(request, idempotent=False)
+    assert response.status_code == 500
+    assert response.fastmask_retries == 0
+    assert request.calls == 1
+
+
+def test_does_not_retry_client_errors():
+    request = Stub(Response(400), Response(200))
+
+    assert RequestScheduler().send(request).status_code == 400
+    assert request.calls == 1
+
+
+def test_honours_retry_after(sleeps):
+    request = Stub(Response(429, {'Retry-After': '2'}), Response(200))
+    RequestScheduler(backoff=0.01).send(request)
+
+    assert 2 <= max(sleeps) <= 2.01
+
+
+def test_gives_up_after_max_retries():
+    request = Stub(Response(503))
+    response = RequestScheduler(max_retries=3, backoff=0.01).send(request)
+
+    assert response.status_code == 503
+    assert response.fastmask_retries == 3
+    assert request.calls == 4
+
+
+def test_gives_up_after_max_wait():
+    request = Stub(Response(429, {'Retry-After': '4'}))
+    response = RequestScheduler(max_retries=10, backoff=0.01, max_wait=10).send(request)
+
+    # Two waits of just over 4 seconds fit in 10, a third does not
+    assert response.status_code == 429
+    assert request.calls == 3
+
+
+def test_errors():
+    request = Stub(ConnectionError('reset'), Response(200))
+    assert RequestScheduler(backoff=0.01).send(request, errors=(ConnectionError,)).status_code == 200
+
+    request = Stub(ConnectionError('reset'), Response(200))
+    with pytest.raises(ConnectionError):
+        RequestScheduler(backoff=0.01).send(request, idempotent=False, errors=(ConnectionError,))
+    assert request.calls == 1
+
+
+def test_safe_errors_retried_when_not_idempotent():
+    request = Stub(ConnectionRefusedError(), ConnectionRefusedError(), Response(200))
+    response = RequestScheduler(backoff=0.01).send(request, idempotent=False, safe_errors=(ConnectionRefusedError,))
+
+    assert response.status_code == 200
+    assert request.calls == 3
+
+
+def test_raises_last_error():
+    request = Stub(ConnectionRefusedError('refused'))
+    with pytest.raises(ConnectionRefusedError):
+        RequestScheduler(max_retries=2, backoff=0.01).send(request, safe_errors=(ConnectionRefusedError,))
+    assert request.calls == 3
+
+
+def test_closes_discarded_responses():
+    responses = [Response(503), Response(500), Response(200)]
+    RequestScheduler(backoff=0.01).send(Stub(*responses))
+
+    assert [r.closed for r in responses] == [True, True, False]
@@ -0,0 +1,80 @@
+from fastmask.search_index import SearchIndex
+
+import pytest
+
+RECORDS = [
+    {'id': 'a', 'email': 'shop@fastmail.com', 'description': 'Shop', 'url': None, 'forDomain': ''},
+    {'id': 'b', 'email': 'x1@fastmail.com', 'description': 'Shopping list', 'url': 'https://shop.example', 'forDomain': ''},
+    {'id': 'c', 'email': 'x2@fastmail.com', 'description': 'Online shop', 'url': None, 'forDomain': ''},
+    {'id': 'd', 'email': 'x3@fastmail.com', 'description': 'Workshop', 'url': None, 'forDomain': ''},
+    {'id': 'e', 'email': 'x4@fastmail.com', 'description': 'News', 'url': None, 'forDomain': 'https://news.example'},
+]
+
+
+def naive(records: list[dict], query: str, fields=('email', 'description', 'url', 'forDomain')) -> set[str]:
+    query = query.lower()
+    return {x['id'] for x in records if any(query in str(x.get(f) or '').lower() for f in fields)}
+
+
+@pytest.fixture
+def index() -> SearchIndex:
+    return SearchIndex.build(RECORDS, state='s1')
+
+
+@pytest.mark.parametrize('query', ['shop', 'SHOP', 'sh', 'x', 'fastmail', 'example', 'ping li', 'orks', 'nothing', ''])
+def test_matches_substring_search(index, query):
+    assert {x['id'] for x in index.search(query)} == naive(RECORDS, query)
+
+
+def test_ranking(index):
+    # Exact description matches beat email prefixes, then word prefixes, then other substrings
+    assert [x['id'] for x in index.search('shop')] == ['a', 'b', 'c', 'd']
+
+
+@pytest.mark.parametrize('description, kind', [
+    ('shop', 0),
+    ('shopshop shop', 1),
+    ('my shop', 2),
+    ('myshop shop', 2),
+    ('myshop-shop', 2),
+    ('myshopshop', 3),
+])
+def test_rank_kinds(description, kind):
+    index = SearchIndex.build([{'id': 'a', 'email': 'x@fastmail.com', 'description': description}], fields=('description',))
+    assert index.rank('a', 'shop')[0] == kind
+
+
+def test_later_word_beats_substring():
+    index = SearchIndex.build([
+        {'id': 'a', 'email': 'x1@fastmail.com', 'description': 'workshop'},
+        {'id': 'b', 'email': 'x2@fastmail.com', 'description': 'myshop shop'},
+    ], fields=('description',))
+
+    assert [x['id'] for x in index.search('shop')] == ['b', 'a']
+
+
+def test_limit(index):
+    assert [x['id'] for x in index.search('shop', limit=2)] == ['a', 'b']
+    assert [x['id'] for x in index.search('shop', limit=0)] == []
+
+
+def test_update(index):
+    index.update([{**RECORDS[4], 'description': 'Shop news'}], destroyed=['a'], state='s2')
+
+    assert index.state == 's2'
+    assert {x['id'] for x in index.search('shop')} == {'b', 'c', 'd', 'e'}
+    assert index.search('news')[0]['description'] == 'Shop news'
+
+
+def test_remove_drops_postings(index):
+    for x in RECORDS:
+        index.remove(x['id'])
+    index.remove('missing')
+
+    assert index.postings == {}
+    assert index.search('') == []
+
+
+def test_filters(index):
+    assert [x['id'] for x in index.search('shop', filters=lambda x: x['url'] is None)] == ['a', 'c', 'd']
+    assert [x['id'] for x in index.search('shop', limit=1, filters=lambda x: x['url'] is not None)] == ['b']
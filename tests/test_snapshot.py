@@ -0,0 +1,110 @@
+from fastmask.query import apply_query
+from fastmask.record import MaskedEmail
+from fastmask.snapshot import CategoryColumn, Snapshot, StringColumn, write_snapshot
+from fastmask.stats import account_stats
+
+import pytest
+
+STATES = ('enabled', 'disabled', 'deleted', 'pending')
+
+
+def records(n: int = 50, creators: int = 3) -> list[dict]:
+    return [
+        {
+            'id': f'masked-{i}',
+            'email': f'user.{i}@fastmail.com',
+            'description': ['Shop', 'Café ☕', '', None, 'Ünïcödé 🎉'][i % 5],
+            'state': STATES[i % 4],
+            'url': f'https://site{i % 7}.example' if i % 3 else None,
+            'forDomain': f'https://site{i % 7}.example',
+            'createdAt': f'2024-{1 + i % 12:02d}-{1 + i % 28:02d}T{i % 24:02d}:00:00Z',
+            'lastMessageAt': None if i % 4 == 0 else f'2025-01-{1 + i % 28:02d}T12:30:15Z',
+            'createdBy': f'app-{i % creators}',
+        }
+        for i in range(n)
+    ]
+
+
+@pytest.fixture
+def snapshot(tmp_path) -> Snapshot:
+    path = str(tmp_path / 'account.fmsnap')
+    assert write_snapshot(path, records(), 'state-9', 'u1') == 50
+    return Snapshot(path)
+
+
+def test_round_trip(snapshot):
+    assert len(snapshot) == 50
+    assert snapshot.state == 'state-9'
+    assert snapshot.account_id == 'u1'
+    assert list(snapshot.records()) == records()
+    assert [snapshot.record(i) for i in range(50)] == records()
+    assert isinstance(snapshot.columns['state'], CategoryColumn)
+
+
+def test_round_trip_records(tmp_path):
+    path = str(tmp_path / 'account.fmsnap')
+    write_snapshot(path, [MaskedEmail.from_dict(d) for d in records()], 'state-9')
+
+    assert list(Snapshot(path).records()) == records()
+
+
+def test_many_categories(tmp_path):
+    # Past MAX_CATEGORIES distinct values, a category column is stored as strings
+    path = str(tmp_path / 'account.fmsnap')
+    write_snapshot(path, records(300, creators=300), 'state-9')
+    snapshot = Snapshot(path)
+
+    assert isinstance(snapshot.columns['createdBy'], StringColumn)
+    assert list(snapshot.records()) == records(300, creators=300)
+
+
+def test_empty(tmp_path):
+    path = str(tmp_path / 'empty.fmsnap')
+    assert write_snapshot(path, [], 'state-0') == 0
+    snapshot = Snapshot(path)
+
+    assert len(snapshot) == 0
+    assert list(snapshot.records()) == []
+    assert snapshot.get() == []
+    assert snapshot.account_id == 'empty.fmsnap'
+
+
+@pytest.mark.parametrize('query', [
+    {},
+    {'sort_by': 'createdAt'},
+    {'sort_by': 'lastMessageAt', 'sort_order': 'desc'},
+    {'sort_by': 'description', 'limit': 7},
+    {'where': 'state = enabled or lastMessageAt is null'},
+    {'where': 'description contains shop', 'sort_by': 'email', 'sort_order': 'desc', 'limit': 3},
+])
+def test_get_matches_apply_query(snapshot, query):
+    expected = apply_query([MaskedEmail.from_dict(d) for d in records()], **{'sort_by': 'createdAt', **query})
+    assert snapshot.get(**query) == expected
+
+
+@pytest.mark.parametrize('query', [
+    {'sort_by': 'createdAt'},
+    {'sort_by': 'url', 'sort_order': 'desc', 'limit': 10},
+    {'where': 'createdBy = app-1', 'sort_by': 'createdAt', 'limit': 4},
+])
+def test_iter_matches_get(snapshot, query):
+    assert [x['id'] for x in snapshot.iter(**query)] == [x['id'] for x in snapshot.get(**query)]
+
+
+def test_iter_ids(snapshot):
+    assert [x['id'] for x in snapshot.iter(ids=['masked-3', 'masked-1', 'missing'])] == ['masked-1', 'masked-3']
+
+
+def test_stats(snapshot):
+    masked_emails = [MaskedEmail.from_dict(d) for d in records()]
+
+    assert snapshot.stats() == account_stats(masked_emails)
+    assert snapshot.stats(top_n=2, where='state = enabled') == account_stats([x for x in masked_emails if x.state == 'enabled'], top_n=2)
+
+
+def test_not_a_snapshot(tmp_path):
+    path = tmp_path / 'other.json'
+    path.write_text('{"not": "a snapshot"}')
+
+    with pytest.raises(ValueError, match='not a fastmask snapshot'):
+        Snapshot(str(path))
@@ -0,0 +1,78 @@
+from fastmask.record import MaskedEmail
+from fastmask.stats import Columns, DAY, account_stats, age_buckets, epoch_seconds, per_month, rows, top
+
+from datetime import datetime
+
+NOW = datetime(2024, 6, 15, 12, 0, 0)
+NOW_SECONDS = epoch_seconds([NOW])[0]
+
+RECORDS = [
+    {'id': 'masked-1', 'state': 'enabled', 'forDomain': 'https://shop.example', 'url': None, 'createdAt': '2024-06-10T00:00:00Z', 'lastMessageAt': None},
+    {'id': 'masked-2', 'state': 'enabled', 'forDomain': 'https://shop.example', 'url': 'https://shop.example/a', 'createdAt': '2024-04-01T00:00:00Z', 'lastMessageAt': None},
+    {'id': 'masked-3', 'state': 'enabled', 'forDomain': '', 'url': None, 'createdAt': '2023-01-01T00:00:00Z', 'lastMessageAt': None},
+    {'id': 'masked-4', 'state': 'enabled', 'forDomain': 'https://bank.example', 'url': 'https://shop.example/a', 'createdAt': '2024-02-29T23:59:59Z', 'lastMessageAt': '2024-06-14T00:00:00Z'},
+    {'id': 'masked-5', 'state': 'disabled', 'forDomain': 'https://shop.example', 'url': None, 'createdAt': '2024-04-15T00:00:00Z', 'lastMessageAt': None},
+    {'id': 'masked-6', 'state': 'deleted', 'forDomain': None, 'url': None, 'createdAt': '2024-04-30T00:00:00Z', 'lastMessageAt': '2023-06-01T00:00:00Z'},
+]
+
+
+def test_epoch_seconds():
+    assert epoch_seconds([datetime(1970, 1, 2), None]) == [DAY, None]
+    assert Columns.from_records(RECORDS)['createdAt'][0] == epoch_seconds([datetime(2024, 6, 10)])[0]
+
+
+def test_age_buckets():
+    ages = [0, 29, 31, 89, 91, 364, 366, 1000]
+    timestamps = [NOW_SECONDS - days * DAY for days in ages]
+
+    assert age_buckets(timestamps, NOW_SECONDS) == [
+        ('< 30 days', 2),
+        ('30-90 days', 2),
+        ('90-365 days', 2),
+        ('> 1 year', 2),
+    ]
+    assert age_buckets([], NOW_SECONDS) == [('< 30 days', 0), ('30-90 days', 0), ('90-365 days', 0), ('> 1 year', 0)]
+
+
+def test_per_month():
+    timestamps = epoch_seconds([datetime(2024, 3, 1), datetime(2023, 11, 30, 23, 59, 59), datetime(2024, 2, 29), datetime(2023, 12, 1)])
+
+    assert per_month(timestamps) == [('2023-11', 1), ('2023-12', 1), ('2024-01', 0), ('2024-02', 1), ('2024-03', 1)]
+    assert per_month([]) == []
+
+
+def test_top():
+    column = ['a', 'b', 'a', None, '', '', 'c', 'b', 'a']
+
+    assert top(column, 2) == [('a', 3), ('b', 2)]
+    assert top([None, ''], 5) == []
+
+
+def test_account_stats():
+    stats = account_stats(RECORDS, now=NOW)
+
+    assert stats['state'] == [('enabled', 4), ('disabled', 1), ('deleted', 1)]
+    assert stats['unused_by_age'] == [('< 30 days', 1), ('30-90 days', 1), ('90-365 days', 0), ('> 1 year', 1)]
+    assert stats['top_domains'] == [('https://shop.example', 3), ('https://bank.example', 1)]
+    assert stats['top_urls'] == [('https://shop.example/a', 2)]
+    assert stats['created_per_month'][0] == ('2023-01', 1)
+    assert stats['created_per_month'][-4:] == [('2024-03', 0), ('2024-04', 3), ('2024-05', 0), ('2024-06', 1)]
+    assert sum(n for _, n in stats['created_per_month']) == len(RECORDS)
+    assert stats['last_message'] == [('< 30 days', 1), ('30-90 days', 0), ('90-365 days', 0), ('> 1 year', 1), ('never', 4)]
+
+
+def test_records_and_dicts_agree():
+    records = [MaskedEmail.from_dict(d) for d in RECORDS]
+
+    assert account_stats(records, now=NOW) == account_stats(RECORDS, now=NOW)
+    assert account_stats(Columns.from_records(records), now=NOW, top_n=1) == account_stats(RECORDS, now=NOW, top_n=1)
+
+
+def test_rows():
+    stats = account_stats(RECORDS, now=NOW)
+
+    assert list(rows({'state': stats['state']})) == [
+        {'stat': 'state', 'key': 'enabled', 'count': 4},
+        {'stat': 'state', 'key': 'disabled', 'count': 1},
+        {'stat': 'state', 'key': 'deleted', 'count': 1},
+    ]
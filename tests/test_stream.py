@@ -0,0 +1,95 @@
+from fastmask.stream import GetStream
+
+import json
+import pytest
+
+RECORDS = [
+    {'id': 'masked-1', 'email': 'one@fastmail.com', 'description': 'Café ☕ "quoted" \\ é', 'state': 'enabled'},
+    {'id': 'masked-2', 'email': 'two@fastmail.com', 'description': '', 'state': 'disabled', 'url': None},
+    {'id': 'masked-3', 'email': 'three@fastmail.com', 'description': '🎉 \n\t  ', 'nested': {'a': [1, 2.5, -3e10]}},
+    {'id': 'masked-4', 'email': 'four@fastmail.com', 'count': 12345678901234567890},
+]
+
+RESPONSE = {
+    'methodResponses': [
+        ['MaskedEmail/get', {'accountId': 'u1', 'state': 'state-42', 'list': RECORDS, 'notFound': []}, '0'],
+        ['Core/echo', {'ignored': True}, '1'],
+    ],
+    'sessionState': 'session-7',
+}
+
+
+def chunked(body: bytes, size: int) -> list[bytes]:
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+def test_whole_body():
+    body = json.dumps(RESPONSE, ensure_ascii=False).encode()
+    stream = GetStream([body])
+
+    assert list(stream) == RECORDS
+    assert stream.state == 'state-42'
+    assert stream.args == {'accountId': 'u1', 'state': 'state-42', 'notFound': []}
+    assert stream.response == {'sessionState': 'session-7'}
+    assert stream.bytes == len(body)
+
+
+@pytest.mark.parametrize('ensure_ascii', [False, True])
+def test_split_at_every_boundary(ensure_ascii):
+    # Cuts land inside keys, strings, escapes, numbers and multi-byte UTF-8 characters
+    body = json.dumps(RESPONSE, ensure_ascii=ensure_ascii).encode()
+    for n in range(1, len(body)):
+        stream = GetStream([body[:n], b'', body[n:]])
+        assert list(stream) == RECORDS, n
+        assert stream.state == 'state-42'
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7])
+def test_small_chunks(size):
+    body = json.dumps(RESPONSE, ensure_ascii=False, indent=2).encode()
+    stream = GetStream(chunked(body, size))
+
+    assert list(stream) == RECORDS
+    assert stream.response == {'sessionState': 'session-7'}
+
+
+def test_number_at_chunk_end():
+    body = b'{"methodResponses": [["MaskedEmail/get", {"list": [12', b'34, 5', b'6], "state": "s"}, "0"]]}'
+    assert list(GetStream(body)) == [1234, 56]
+
+
+def test_empty_list():
+    body = json.dumps({'methodResponses': [['MaskedEmail/get', {'list': [], 'state': 's'}, '0']]}).encode()
+    stream = GetStream(chunked(body, 5))
+
+    assert list(stream) == []
+    assert stream.state == 's'
+
+
+def test_yields_lazily():
+    body = json.dumps(RESPONSE).encode()
+    chunks = iter(chunked(body, 16))
+    stream = iter(GetStream(chunks))
+
+    assert next(stream) == RECORDS[0]
+    assert next(chunks, None) is not None
+
+
+def test_error_response():
+    body = json.dumps({'methodResponses': [['error', {'type': 'accountNotFound'}, '0']]}).encode()
+    stream = GetStream(chunked(body, 3))
+
+    with pytest.raises(ValueError, match='accountNotFound'):
+        list(stream)
+    assert stream.args == {'type': 'accountNotFound'}
+
+
+@pytest.mark.parametrize('body', [
+    b'',
+    b'{"methodResponses": [["MaskedEmail/get", {"list": [{"id": "masked-1"}',
+    b'{"methodResponses": [["MaskedEmail/get", {"list": [{"id": }]}, "0"]]}',
+    b'["MaskedEmail/get"]',
+])
+def test_malformed(body):
+    with pytest.raises(ValueError):
+        list(GetStream(chunked(body, 4)))
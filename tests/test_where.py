@@ -0,0 +1,149 @@
+from fastmask.record import MaskedEmail
+from fastmask.where import WhereError, compile_where
+
+from datetime import datetime, timedelta
+import pytest
+
+
+def record(**kwargs) -> MaskedEmail:
+    return MaskedEmail.from_dict({
+        'id': 'masked-1',
+        'email': 'shop.abc@fastmail.com',
+        'description': 'Shopping',
+        'state': 'enabled',
+        'url': None,
+        'forDomain': 'https://example.shop',
+        'createdAt': '2024-01-31T12:00:00Z',
+        'lastMessageAt': None,
+        'createdBy': 'fastmask',
+        **kwargs,
+    })
+
+
+@pytest.mark.parametrize('expression, expected', [
+    ('state = enabled', True),
+    ('state != enabled', False),
+    ('STATE = enabled', True),
+    ('forDomain endswith .SHOP', True),
+    ('description contains shop', True),
+    ('email startswith shop.', True),
+    ('email ~ "^shop\\.[a-z]+@"', True),
+    ('url is null', True),
+    ('url is not null', False),
+    ('url is empty', True),
+    ('description is not empty', True),
+    ('url contains example', False),
+    ('createdAt < 2024-02-01', True),
+    ('createdAt >= 2024-01-31T12:00:01Z', False),
+    ('lastMessageAt < now', False),
+    ('state = enabled and (lastMessageAt is null or lastMessageAt < now-90d)', True),
+    ('not state = enabled or createdBy = "fastmask"', True),
+    ('not (state = enabled and url is null)', False),
+    ("description = 'Shopping'", True),
+])
+def test_matches(expression, expected):
+    assert compile_where(expression)(record()) is expected
+
+
+def test_relative_dates():
+    week_ago = (datetime.utcnow() - timedelta(days=7)).strftime('%Y-%m-%dT%H:%M:%SZ')
+    x = record(lastMessageAt=week_ago)
+
+    assert compile_where('lastMessageAt > now-8d')(x)
+    assert not compile_where('lastMessageAt > now-6d')(x)
+    assert not compile_where('lastMessageAt is null')(x)
+
+
+@pytest.mark.parametrize('expression', [
+    '',
+    'state',
+    'state =',
+    'state = enabled and',
+    '(state = enabled',
+    'state = enabled)',
+    'colour = red',
+    'state like enabled',
+    'state is maybe',
+    'createdAt contains 2024',
+    'createdAt < yesterday',
+    'email ~ "("',
+    'state = (',
+    'state = )',
+    'description ~ )',
+    'description contains <',
+    'createdAt = (',
+    "state 'contains' enabled",
+])
+def test_malformed(expression):
+    with pytest.raises(WhereError):
+        compile_where(expression)
+
+
+@pytest.mark.parametrize('expression', [
+    "__import__('os').system('true')",
+    'state = enabled or __import__("os")',
+    'x.__class__ = 1',
+    'state.__class__ = 1',
+    'state = enabled; import os',
+    'state = enabled + 1',
+    'lambda = 1',
+])
+def test_rejects_code(expression):
+    with pytest.raises(WhereError):
+        compile_where(expression)
+
+
+@pytest.mark.parametrize('value', ['[1]', '{}', 'x.id', 'True'])
+def test_bare_values_are_strings(value):
+    predicate = compile_where(f'description = {value}')
+
+    assert not predicate(record())
+    assert predicate(record(description=value))
+
+
+@pytest.mark.parametrize('value', [
+    "__import__('os').system('exit 1')",
+    '") or True or ("',
+    "' + str(x) + '",
+    '\\" or 1 or \\"',
+])
+def test_values_are_constants(value):
+    # Whatever a quoted value holds, it is compared as a string, never evaluated
+    quoted = '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+    predicate = compile_where(f'description = {quoted}')
+
+    assert not predicate(record())
+    assert predicate(record(description=value))
+    assert value not in predicate.source
+
+
+def test_fields():
+    predicate = compile_where('state = enabled and (URL is null or lastmessageat < now-1d)')
+    assert predicate.fields == {'state', 'url', 'lastMessageAt'}
+
+
+@pytest.mark.parametrize('expression, expected', [
+    ('createdAt = 2024-01-31', True),
+    ('createdAt == 2024-01-31', True),
+    ('createdAt = 2024-01-30', False),
+    ('createdAt = 2024-02-01', False),
+    ('createdAt != 2024-01-31', False),
+    ('createdAt != 2024-02-01', True),
+    ('createdAt = 2024-01-31T12:00:00Z', True),
+    ('createdAt = 2024-01-31T00:00:00Z', False),
+    ('createdAt >= 2024-01-31', True),
+    ('createdAt < 2024-01-31', False),
+    ('lastMessageAt = 2024-01-31', False),
+    ('lastMessageAt != 2024-01-31', True),
+])
+def test_date_equality_spans_the_day(expression, expected):
+    assert compile_where(expression)(record()) is expected
+
+
+def test_day_bounds():
+    predicate = compile_where('lastMessageAt = 2024-01-31')
+
+    assert predicate(record(lastMessageAt='2024-01-31T00:00:00Z'))
+    assert predicate(record(lastMessageAt='2024-01-31T23:59:59Z'))
+    assert not predicate(record(lastMessageAt='2024-02-01T00:00:00Z'))
+    assert not predicate(record(lastMessageAt='2024-01-30T23:59:59Z'))